@@ -7,7 +7,11 @@ from datetime import datetime, timezone
 from flask import Blueprint, request, jsonify
 
 from auth.security import require_auth, validate_input
-from database.optimization import db_optimizer, maintenance_tasks
+from database.optimization import db_optimizer, maintenance_tasks, index_advisor
+from database.query_metrics import query_metrics
+from database.migrations import run_migrations
+from database.plan_tracker import plan_tracker
+from database.scheduler import maintenance_scheduler
 from cache.cache_manager import cache_manager, CACHE_WARMUP_FUNCTIONS
 from middleware.security_middleware import strict_rate_limit
 
@@ -81,30 +85,20 @@ def optimize_database():
     """
     Run database optimization tasks.
     
-    Creates indexes, materialized views, and runs maintenance tasks.
+    Applies pending index and materialized view migrations and runs maintenance tasks.
     """
     try:
         results = {
-            'indexes': {'created': [], 'skipped': [], 'errors': []},
-            'materialized_views': {'created': [], 'skipped': [], 'errors': []},
+            'migrations': {'applied': [], 'skipped': [], 'errors': []},
             'maintenance': {'completed': False, 'error': None}
         }
         
-        # Create indexes
+        # Apply pending index and materialized view migrations (skipped if another runner holds the lock)
         try:
-            index_results = db_optimizer.create_indexes()
-            results['indexes'] = index_results
+            results['migrations'] = run_migrations(wait=False)
         except Exception as e:
-            logger.error(f"Index creation error: {e}")
-            results['indexes']['errors'] = [f"Index creation failed: {str(e)}"]
-        
-        # Create materialized views
-        try:
-            view_results = db_optimizer.create_materialized_views()
-            results['materialized_views'] = view_results
-        except Exception as e:
-            logger.error(f"Materialized view creation error: {e}")
-            results['materialized_views']['errors'] = [f"View creation failed: {str(e)}"]
+            logger.error(f"Migration error: {e}")
+            results['migrations']['errors'] = [f"Migrations failed: {str(e)}"]
         
         # Run maintenance
         try:
@@ -154,6 +148,210 @@ def get_database_stats():
             'error_code': 'DB_STATS_ERROR'
         }), 500
 
+@admin_bp.route('/database/queries', methods=['GET'])
+@require_auth
+def get_query_stats():
+    """
+    Get the top database queries by cumulative execution time.
+    
+    Query parameters:
+    - limit: Number of fingerprints to return (default: 20, max: 100)
+    - order_by: total_ms, avg_ms, max_ms, calls, total_rows or total_payload_bytes (default: total_ms)
+    """
+    try:
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        order_by = request.args.get('order_by', 'total_ms')
+        
+        if order_by not in ('total_ms', 'avg_ms', 'max_ms', 'calls', 'total_rows', 'total_payload_bytes'):
+            return jsonify({
+                'error': f'Invalid order_by: {order_by}',
+                'error_code': 'INVALID_ORDER_BY'
+            }), 400
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'summary': query_metrics.get_summary(),
+                'queries': query_metrics.top_queries(limit=limit, order_by=order_by)
+            },
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Query stats error: {e}")
+        return jsonify({
+            'error': 'Failed to get query statistics',
+            'error_code': 'QUERY_STATS_ERROR'
+        }), 500
+
+@admin_bp.route('/database/queries/reset', methods=['POST'])
+@require_auth
+@strict_rate_limit
+def reset_query_stats():
+    """
+    Reset collected query statistics.
+    """
+    try:
+        query_metrics.reset()
+        
+        logger.info(f"Query statistics reset by user: {request.user_id}")
+        
+        return jsonify({
+            'success': True,
+            'message': 'Query statistics reset',
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Query stats reset error: {e}")
+        return jsonify({
+            'error': 'Failed to reset query statistics',
+            'error_code': 'QUERY_STATS_RESET_ERROR'
+        }), 500
+
+@admin_bp.route('/database/indexes/advice', methods=['GET'])
+@require_auth
+def get_index_advice():
+    """
+    Get index recommendations from the captured query workload.
+    
+    Query parameters:
+    - refresh: Run the advisor now instead of returning the last report (default: false)
+    
+    Reports missing, unused, unavailable and redundant indexes with their
+    estimated benefit and write cost.
+    """
+    try:
+        refresh = request.args.get('refresh', 'false').lower() == 'true'
+        report = index_advisor.last_report
+        
+        if refresh or report is None:
+            report = index_advisor.analyze()
+        
+        if 'error' in report:
+            return jsonify({
+                'error': 'Index advisor failed',
+                'error_code': 'INDEX_ADVICE_ERROR'
+            }), 500
+        
+        return jsonify({
+            'success': True,
+            'data': report,
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Index advice error: {e}")
+        return jsonify({
+            'error': 'Failed to get index advice',
+            'error_code': 'INDEX_ADVICE_ERROR'
+        }), 500
+
+@admin_bp.route('/database/plans', methods=['GET'])
+@require_auth
+def get_query_plans():
+    """
+    Get stored plan captures of the registered hot queries.
+    
+    Query parameters:
+    - days: Days of history to return (default: 14, max: 90)
+    - name: Only this registered query (optional)
+    - include_plan: Include the full EXPLAIN JSON (default: false)
+    
+    Each capture lists the regressions flagged against earlier captures.
+    """
+    try:
+        days = min(request.args.get('days', 14, type=int), 90)
+        name = request.args.get('name')
+        include_plan = request.args.get('include_plan', 'false').lower() == 'true'
+        
+        history = plan_tracker.history(days=days, name=name, include_plan=include_plan)
+        if history is None:
+            return jsonify({
+                'error': 'Plan history unavailable',
+                'error_code': 'QUERY_PLANS_ERROR'
+            }), 500
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'captures': history,
+                'regressions': [
+                    {'name': row['name'], 'captured_on': str(row['captured_on']), **regression}
+                    for row in history
+                    for regression in row['regressions']
+                ]
+            },
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Query plans error: {e}")
+        return jsonify({
+            'error': 'Failed to get query plans',
+            'error_code': 'QUERY_PLANS_ERROR'
+        }), 500
+
+@admin_bp.route('/database/plans/capture', methods=['POST'])
+@require_auth
+@strict_rate_limit
+def capture_query_plans():
+    """Capture today's plans of the registered hot queries now"""
+    try:
+        report = plan_tracker.capture()
+        
+        if 'error' in report:
+            return jsonify({
+                'error': 'Plan capture failed',
+                'error_code': 'PLAN_CAPTURE_ERROR'
+            }), 500
+        
+        return jsonify({
+            'success': True,
+            'data': report,
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Plan capture error: {e}")
+        return jsonify({
+            'error': 'Failed to capture query plans',
+            'error_code': 'PLAN_CAPTURE_ERROR'
+        }), 500
+
+@admin_bp.route('/scheduler', methods=['GET'])
+@require_auth
+def get_scheduler_status():
+    """
+    Get the maintenance scheduler state and run history.
+    
+    Query parameters:
+    - job: Only runs of this job (optional)
+    - limit: Number of runs (default: 50, max: 500)
+    
+    Leadership and next runs are as seen by the worker answering the
+    request; the run history is shared by every worker.
+    """
+    try:
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        history = maintenance_scheduler.history(limit=limit, job=request.args.get('job'))
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'status': maintenance_scheduler.get_status(),
+                'history': history if history is not None else []
+            },
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Scheduler status error: {e}")
+        return jsonify({
+            'error': 'Failed to get scheduler status',
+            'error_code': 'SCHEDULER_STATUS_ERROR'
+        }), 500
+
 @admin_bp.route('/system/info', methods=['GET'])
 @require_auth
 def get_system_info():
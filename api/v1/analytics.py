@@ -9,7 +9,13 @@ from marshmallow import Schema, fields
 
 from auth.security import require_auth, optional_auth, validate_input, APIQuerySchema
 from cache.cache_manager import cached_api_response
-from database.optimization import optimized_queries
+from database.deadlines import query_budget
+from database.optimization import optimized_queries, aggregate_router
+from database.dimension_catalog import dimension_catalog
+from database.rollups import GRANULARITIES
+from database.periods import period_conditions, period_filter
+from database.pagination import InvalidCursor, cursor_scope, decode_cursor, keyset_predicate, keyset_order, paginate, pagination_info
+from database.connection_v3 import run_concurrently
 from middleware.security_middleware import rate_limit_by_user
 
 logger = logging.getLogger(__name__)
@@ -18,6 +24,10 @@ analytics_bp = Blueprint('analytics', __name__, url_prefix='/api/v1/analytics')
 class TrendQuerySchema(APIQuerySchema):
     """Extended schema for trend queries"""
     days = fields.Int(validate=lambda x: 1 <= x <= 365, missing=30)
+    granularity = fields.Str(
+        validate=lambda x: x in GRANULARITIES,
+        missing='day'
+    )
 
 class RankingQuerySchema(APIQuerySchema):
     """Schema for ranking queries"""
@@ -30,11 +40,51 @@ class RankingQuerySchema(APIQuerySchema):
         missing='desc'
     )
 
+def _keyset_page(query, query_params, params, name, key_columns, descending=True):
+    """
+    Page through a GROUP BY ``query`` ordered by promedio, then ``key_columns``.
+    
+    Returns ``(rows, next_cursor)``. The ``cursor`` request parameter resumes
+    after the last row of the previous page; ``offset`` is only honoured for
+    the first page, for older clients.
+    """
+    from database.connection_v3 import execute_query
+    
+    scope = cursor_scope(name, **{
+        key: params.get(key) for key in ('quarter', 'year', 'estado', 'grupo', 'ranking_type', 'order')
+    })
+    after = decode_cursor(params['cursor'], scope) if params.get('cursor') else None
+    
+    sql_columns = ['promedio'] + [f"COALESCE({column}, '')" for column in key_columns]
+    keyset_sql, keyset_params = keyset_predicate(sql_columns, after, descending)
+    
+    page_query = f"SELECT * FROM ({query}) AS grouped"
+    page_params = list(query_params) + keyset_params
+    if keyset_sql:
+        page_query += f" WHERE {keyset_sql}"
+    page_query += f" ORDER BY {keyset_order(sql_columns, descending)} LIMIT %s"
+    page_params.append(params['limit'] + 1)
+    
+    if after is None and params.get('offset'):
+        page_query += " OFFSET %s"
+        page_params.append(params['offset'])
+    
+    results = execute_query(page_query, page_params)
+    return paginate(results, params['limit'], ['promedio'] + key_columns, scope)
+
+def _invalid_cursor_response(error):
+    """400 response for a cursor that does not belong to the request"""
+    return jsonify({
+        'error': str(error),
+        'error_code': 'INVALID_CURSOR'
+    }), 400
+
 @analytics_bp.route('/kpis', methods=['GET'])
 @optional_auth
 @rate_limit_by_user("30 per minute")
 @validate_input(APIQuerySchema)
 @cached_api_response(ttl=300, cache_type='kpis')
+@query_budget(5000)
 def get_kpis():
     """
     Get Key Performance Indicators with optional filtering.
@@ -77,16 +127,7 @@ def get_kpis():
                   AND fecha_supervision IS NOT NULL
             """
             
-            query_params = []
-            conditions = []
-            
-            if params['quarter'] != 'ALL':
-                conditions.append("EXTRACT(QUARTER FROM fecha_supervision) = %s")
-                query_params.append(int(params['quarter'][1]))
-            
-            if params['year']:
-                conditions.append("EXTRACT(YEAR FROM fecha_supervision) = %s")
-                query_params.append(params['year'])
+            conditions, query_params = period_conditions(params['quarter'], params['year'])
                 
             if params.get('estado'):
                 conditions.append("estado = %s")
@@ -182,6 +223,7 @@ def get_kpis():
 @rate_limit_by_user("20 per minute")
 @validate_input(APIQuerySchema)
 @cached_api_response(ttl=600, cache_type='analytics')
+@query_budget(3000)
 def get_states_performance():
     """
     Get performance metrics grouped by states.
@@ -191,53 +233,34 @@ def get_states_performance():
     try:
         params = request.validated_data
         
-        # Query for state performance
-        query = """
-            SELECT 
-                estado,
-                ROUND(AVG(CAST(porcentaje AS NUMERIC)), 2) as promedio,
-                COUNT(*) as total_supervisiones,
-                COUNT(DISTINCT sucursal_clean) as total_sucursales,
-                ROUND(MIN(CAST(porcentaje AS NUMERIC)), 2) as minimo,
-                ROUND(MAX(CAST(porcentaje AS NUMERIC)), 2) as maximo
-            FROM supervision_operativa_detalle
-            WHERE porcentaje IS NOT NULL AND fecha_supervision IS NOT NULL
-        """
-        
-        query_params = []
-        
-        if params['quarter'] != 'ALL':
-            query += " AND EXTRACT(QUARTER FROM fecha_supervision) = %s"
-            query_params.append(int(params['quarter'][1]))
-        
-        if params['year']:
-            query += " AND EXTRACT(YEAR FROM fecha_supervision) = %s"
-            query_params.append(params['year'])
-        
-        if params.get('grupo'):
-            query += " AND grupo_operativo = %s"
-            query_params.append(params['grupo'])
+        query, query_params, _ = aggregate_router.build(
+            'states_performance',
+            {
+                'promedio': 'promedio',
+                'total_supervisiones': 'evaluaciones',
+                'total_sucursales': 'sucursales',
+                'minimo': 'minimo',
+                'maximo': 'maximo'
+            },
+            group_by=['estado'],
+            filters={'grupo': params.get('grupo')},
+            quarter=params['quarter'],
+            year=params['year']
+        )
         
-        query += """
-            GROUP BY estado
-            ORDER BY promedio DESC
-            LIMIT %s OFFSET %s;
-        """
-        query_params.extend([params['limit'], params['offset']])
+        results, next_cursor = _keyset_page(query, query_params, params, 'states_performance', ['estado'])
         
-        from database.connection_v3 import execute_query
-        results = execute_query(query, query_params)
+        pagination = pagination_info(params['limit'], next_cursor, params['offset'])
+        pagination['total'] = len(results)
         
         return jsonify({
             'success': True,
             'data': results,
-            'pagination': {
-                'limit': params['limit'],
-                'offset': params['offset'],
-                'total': len(results)
-            }
+            'pagination': pagination
         })
         
+    except InvalidCursor as e:
+        return _invalid_cursor_response(e)
     except Exception as e:
         logger.error(f"States performance endpoint error: {e}")
         return jsonify({
@@ -250,6 +273,7 @@ def get_states_performance():
 @rate_limit_by_user("20 per minute")
 @validate_input(APIQuerySchema)
 @cached_api_response(ttl=300, cache_type='analytics')
+@query_budget(3000)
 def get_branches_performance():
     """
     Get performance metrics grouped by branches (sucursales).
@@ -273,13 +297,9 @@ def get_branches_performance():
         
         query_params = []
         
-        if params['quarter'] != 'ALL':
-            query += " AND EXTRACT(QUARTER FROM fecha_supervision) = %s"
-            query_params.append(int(params['quarter'][1]))
-        
-        if params['year']:
-            query += " AND EXTRACT(YEAR FROM fecha_supervision) = %s"
-            query_params.append(params['year'])
+        period_sql, period_params = period_filter(params['quarter'], params['year'])
+        query += period_sql
+        query_params.extend(period_params)
         
         if params.get('estado'):
             query += " AND estado = %s"
@@ -291,23 +311,21 @@ def get_branches_performance():
         
         query += """
             GROUP BY sucursal_clean, estado, grupo_operativo
-            ORDER BY promedio DESC
-            LIMIT %s OFFSET %s;
         """
-        query_params.extend([params['limit'], params['offset']])
         
-        from database.connection_v3 import execute_query
-        results = execute_query(query, query_params)
+        results, next_cursor = _keyset_page(
+            query, query_params, params, 'branches_performance',
+            ['sucursal_clean', 'estado', 'grupo_operativo']
+        )
         
         return jsonify({
             'success': True,
             'data': results,
-            'pagination': {
-                'limit': params['limit'],
-                'offset': params['offset']
-            }
+            'pagination': pagination_info(params['limit'], next_cursor, params['offset'])
         })
         
+    except InvalidCursor as e:
+        return _invalid_cursor_response(e)
     except Exception as e:
         logger.error(f"Branches performance endpoint error: {e}")
         return jsonify({
@@ -320,6 +338,7 @@ def get_branches_performance():
 @rate_limit_by_user("20 per minute") 
 @validate_input(APIQuerySchema)
 @cached_api_response(ttl=600, cache_type='analytics')
+@query_budget(3000)
 def get_groups_performance():
     """
     Get performance metrics grouped by operational groups.
@@ -327,40 +346,24 @@ def get_groups_performance():
     try:
         params = request.validated_data
         
-        query = """
-            SELECT 
-                grupo_operativo,
-                ROUND(AVG(CAST(porcentaje AS NUMERIC)), 2) as promedio,
-                COUNT(*) as total_supervisiones,
-                COUNT(DISTINCT sucursal_clean) as total_sucursales,
-                COUNT(DISTINCT estado) as estados_presentes,
-                ROUND(MIN(CAST(porcentaje AS NUMERIC)), 2) as minimo,
-                ROUND(MAX(CAST(porcentaje AS NUMERIC)), 2) as maximo
-            FROM supervision_operativa_detalle
-            WHERE porcentaje IS NOT NULL 
-              AND fecha_supervision IS NOT NULL
-              AND grupo_operativo IS NOT NULL
-        """
-        
-        query_params = []
-        
-        if params['quarter'] != 'ALL':
-            query += " AND EXTRACT(QUARTER FROM fecha_supervision) = %s"
-            query_params.append(int(params['quarter'][1]))
-        
-        if params['year']:
-            query += " AND EXTRACT(YEAR FROM fecha_supervision) = %s"
-            query_params.append(params['year'])
-        
-        if params.get('estado'):
-            query += " AND estado = %s"
-            query_params.append(params['estado'])
+        query, query_params, _ = aggregate_router.build(
+            'groups_performance',
+            {
+                'promedio': 'promedio',
+                'total_supervisiones': 'evaluaciones',
+                'total_sucursales': 'sucursales',
+                'estados_presentes': 'estados',
+                'minimo': 'minimo',
+                'maximo': 'maximo'
+            },
+            group_by=['grupo'],
+            filters={'estado': params.get('estado')},
+            non_null=['grupo'],
+            quarter=params['quarter'],
+            year=params['year']
+        )
         
-        query += """
-            GROUP BY grupo_operativo
-            ORDER BY promedio DESC
-            LIMIT %s OFFSET %s;
-        """
+        query += " ORDER BY promedio DESC LIMIT %s OFFSET %s"
         query_params.extend([params['limit'], params['offset']])
         
         from database.connection_v3 import execute_query
@@ -387,12 +390,14 @@ def get_groups_performance():
 @rate_limit_by_user("15 per minute")
 @validate_input(TrendQuerySchema)
 @cached_api_response(ttl=900, cache_type='analytics')
+@query_budget(5000)
 def get_performance_trends():
     """
     Get performance trends over time.
     
     Query parameters:
     - days: Number of days to look back (default: 30, max: 365)
+    - granularity: 'day', 'week', 'month' or 'quarter' (default: day)
     - estado: State filter (optional)
     - grupo: Group filter (optional)
     """
@@ -402,7 +407,8 @@ def get_performance_trends():
         trends = optimized_queries.get_performance_trends(
             days=params['days'],
             estado=params.get('estado'),
-            grupo=params.get('grupo')
+            grupo=params.get('grupo'),
+            granularity=params['granularity']
         )
         
         return jsonify({
@@ -410,6 +416,7 @@ def get_performance_trends():
             'data': trends,
             'metadata': {
                 'days_analyzed': params['days'],
+                'granularity': params['granularity'],
                 'filters': {
                     'estado': params.get('estado'),
                     'grupo': params.get('grupo')
@@ -429,6 +436,7 @@ def get_performance_trends():
 @rate_limit_by_user("15 per minute")
 @validate_input(RankingQuerySchema)
 @cached_api_response(ttl=600, cache_type='analytics')
+@query_budget(3000)
 def get_ranking():
     """
     Get performance rankings for different entity types.
@@ -471,29 +479,22 @@ def get_ranking():
         
         query_params = []
         
-        if params['quarter'] != 'ALL':
-            query += " AND EXTRACT(QUARTER FROM fecha_supervision) = %s"
-            query_params.append(int(params['quarter'][1]))
-        
-        if params['year']:
-            query += " AND EXTRACT(YEAR FROM fecha_supervision) = %s"
-            query_params.append(params['year'])
+        period_sql, period_params = period_filter(params['quarter'], params['year'])
+        query += period_sql
+        query_params.extend(period_params)
         
         group_by_columns = entity_column
         if additional_columns:
             group_by_columns += ', ' + additional_columns.rstrip(',')
         
-        order_direction = 'DESC' if order == 'desc' else 'ASC'
-        
         query += f"""
             GROUP BY {group_by_columns}
-            ORDER BY promedio {order_direction}
-            LIMIT %s OFFSET %s;
         """
-        query_params.extend([params['limit'], params['offset']])
         
-        from database.connection_v3 import execute_query
-        results = execute_query(query, query_params)
+        key_columns = ['entidad'] + ([column.strip() for column in additional_columns.rstrip(',').split(',')] if additional_columns else [])
+        results, next_cursor = _keyset_page(
+            query, query_params, params, 'ranking', key_columns, descending=(order == 'desc')
+        )
         
         return jsonify({
             'success': True,
@@ -501,13 +502,12 @@ def get_ranking():
             'metadata': {
                 'ranking_type': ranking_type,
                 'order': order,
-                'pagination': {
-                    'limit': params['limit'],
-                    'offset': params['offset']
-                }
+                'pagination': pagination_info(params['limit'], next_cursor, params['offset'])
             }
         })
         
+    except InvalidCursor as e:
+        return _invalid_cursor_response(e)
     except Exception as e:
         logger.error(f"Ranking endpoint error: {e}")
         return jsonify({
@@ -520,6 +520,7 @@ def get_ranking():
 @rate_limit_by_user("30 per minute")
 @validate_input(APIQuerySchema)
 @cached_api_response(ttl=180, cache_type='analytics')
+@query_budget(5000)
 def get_analytics_summary():
     """
     Get comprehensive analytics summary combining multiple metrics.
@@ -527,19 +528,19 @@ def get_analytics_summary():
     try:
         params = request.validated_data
         
-        # Get KPIs
-        kpi_data = optimized_queries.get_optimized_kpis(
-            quarter=params['quarter'],
-            year=params['year'],
-            estado=params.get('estado'),
-            grupo=params.get('grupo')
-        )
-        
-        # Get recent trends (last 7 days)
-        trend_data = optimized_queries.get_performance_trends(
-            days=7,
-            estado=params.get('estado'),
-            grupo=params.get('grupo')
+        # Get KPIs and recent trends (last 7 days) concurrently
+        kpi_data, trend_data = run_concurrently(
+            lambda: optimized_queries.get_optimized_kpis(
+                quarter=params['quarter'],
+                year=params['year'],
+                estado=params.get('estado'),
+                grupo=params.get('grupo')
+            ),
+            lambda: optimized_queries.get_performance_trends(
+                days=7,
+                estado=params.get('estado'),
+                grupo=params.get('grupo')
+            )
         )
         
         summary = {
@@ -570,23 +571,13 @@ def get_analytics_summary():
 @optional_auth
 @rate_limit_by_user("60 per minute")
 @cached_api_response(ttl=3600, cache_type='metadata')
+@query_budget(2000)
 def get_estados_metadata():
     """
     Get list of all available states for filtering.
     """
     try:
-        query = """
-            SELECT DISTINCT estado
-            FROM supervision_operativa_detalle
-            WHERE estado IS NOT NULL
-              AND estado != ''
-            ORDER BY estado;
-        """
-        
-        from database.connection_v3 import execute_query
-        results = execute_query(query)
-        
-        estados = [row['estado'] for row in results]
+        estados = dimension_catalog.values('estado')
         
         return jsonify({
             'success': True,
@@ -608,23 +599,13 @@ def get_estados_metadata():
 @optional_auth
 @rate_limit_by_user("60 per minute")
 @cached_api_response(ttl=3600, cache_type='metadata')
+@query_budget(2000)
 def get_grupos_metadata():
     """
     Get list of all available operational groups for filtering.
     """
     try:
-        query = """
-            SELECT DISTINCT grupo_operativo
-            FROM supervision_operativa_detalle
-            WHERE grupo_operativo IS NOT NULL
-              AND grupo_operativo != ''
-            ORDER BY grupo_operativo;
-        """
-        
-        from database.connection_v3 import execute_query
-        results = execute_query(query)
-        
-        grupos = [row['grupo_operativo'] for row in results]
+        grupos = dimension_catalog.values('grupo')
         
         return jsonify({
             'success': True,
@@ -646,22 +627,16 @@ def get_grupos_metadata():
 @optional_auth
 @rate_limit_by_user("60 per minute")
 @cached_api_response(ttl=3600, cache_type='metadata')
+@query_budget(3000)
 def get_areas_metadata():
     """
     Get list of all available evaluation areas (29 indicators).
     """
     try:
-        query = """
-            SELECT DISTINCT area_evaluacion, COUNT(*) as total_evaluaciones
-            FROM supervision_operativa_detalle
-            WHERE area_evaluacion IS NOT NULL
-              AND area_evaluacion != ''
-            GROUP BY area_evaluacion
-            ORDER BY area_evaluacion;
-        """
-        
-        from database.connection_v3 import execute_query
-        results = execute_query(query)
+        results = [
+            {'area_evaluacion': item['value'], 'total_evaluaciones': item['evaluaciones']}
+            for item in dimension_catalog.with_counts('area')
+        ]
         
         return jsonify({
             'success': True,
@@ -8,7 +8,10 @@ from marshmallow import Schema, fields
 
 from auth.security import optional_auth, validate_input, APIQuerySchema
 from cache.cache_manager import cached_api_response
-from database.optimization import optimized_queries
+from database.deadlines import query_budget
+from database.optimization import optimized_queries, aggregate_router
+from database.periods import period_filter
+from database.queries_v3 import heatmap_query
 from middleware.security_middleware import rate_limit_by_user
 
 logger = logging.getLogger(__name__)
@@ -27,6 +30,7 @@ class GeoQuerySchema(APIQuerySchema):
 @rate_limit_by_user("15 per minute")
 @validate_input(GeoQuerySchema)
 @cached_api_response(ttl=600, cache_type='geo_data')
+@query_budget(3000)
 def get_coordinates():
     """
     Get branch coordinates with performance data for mapping.
@@ -125,6 +129,7 @@ def get_coordinates():
 @rate_limit_by_user("20 per minute")
 @validate_input(APIQuerySchema)
 @cached_api_response(ttl=900, cache_type='geo_data')
+@query_budget(3000)
 def get_states_geo_data():
     """
     Get state-level geographic performance data for choropleth maps.
@@ -134,47 +139,29 @@ def get_states_geo_data():
     try:
         params = request.validated_data
         
-        query = """
-            SELECT 
-                estado,
-                ROUND(AVG(CAST(porcentaje AS NUMERIC)), 2) as promedio,
-                COUNT(*) as total_supervisiones,
-                COUNT(DISTINCT sucursal_clean) as total_sucursales,
-                ROUND(MIN(CAST(porcentaje AS NUMERIC)), 2) as minimo,
-                ROUND(MAX(CAST(porcentaje AS NUMERIC)), 2) as maximo,
-                ROUND(STDDEV(CAST(porcentaje AS NUMERIC)), 2) as desviacion
-            FROM supervision_operativa_detalle
-            WHERE porcentaje IS NOT NULL 
-              AND fecha_supervision IS NOT NULL
-              AND estado IS NOT NULL
-        """
-        
-        query_params = []
-        
-        if params['quarter'] != 'ALL':
-            query += " AND EXTRACT(QUARTER FROM fecha_supervision) = %s"
-            query_params.append(int(params['quarter'][1]))
-        
-        if params['year']:
-            query += " AND EXTRACT(YEAR FROM fecha_supervision) = %s"
-            query_params.append(params['year'])
-        
-        if params.get('grupo'):
-            query += " AND grupo_operativo = %s"
-            query_params.append(params['grupo'])
-        
-        query += """
-            GROUP BY estado
-            ORDER BY promedio DESC;
-        """
-        
-        from database.connection_v3 import execute_query
-        results = execute_query(query, query_params)
+        results = aggregate_router.query(
+            'states_geo',
+            {
+                'promedio': 'promedio',
+                'total_supervisiones': 'evaluaciones',
+                'total_sucursales': 'sucursales',
+                'minimo': 'minimo',
+                'maximo': 'maximo',
+                'desviacion': 'desviacion_estandar'
+            },
+            order_by='promedio DESC',
+            row_format='namedtuple',
+            group_by=['estado'],
+            filters={'grupo': params.get('grupo')},
+            non_null=['estado'],
+            quarter=params['quarter'],
+            year=params['year']
+        )
         
         # Process for choropleth visualization
         processed_data = []
         for item in results:
-            score = item['promedio'] or 0
+            score = item.promedio or 0
             
             # Determine intensity for choropleth coloring
             if score >= 95:
@@ -194,13 +181,13 @@ def get_states_geo_data():
                 category = 'bajo'
             
             processed_data.append({
-                'estado': item['estado'],
-                'promedio': item['promedio'],
-                'total_supervisiones': item['total_supervisiones'],
-                'total_sucursales': item['total_sucursales'],
-                'minimo': item['minimo'],
-                'maximo': item['maximo'],
-                'desviacion': item['desviacion'],
+                'estado': item.estado,
+                'promedio': item.promedio,
+                'total_supervisiones': item.total_supervisiones,
+                'total_sucursales': item.total_sucursales,
+                'minimo': item.minimo,
+                'maximo': item.maximo,
+                'desviacion': item.desviacion,
                 'intensidad_mapa': intensity,
                 'categoria_performance': category
             })
@@ -231,6 +218,7 @@ def get_states_geo_data():
 @rate_limit_by_user("10 per minute")
 @validate_input(GeoQuerySchema)
 @cached_api_response(ttl=1200, cache_type='geo_data')
+@query_budget(5000)
 def get_heatmap_data():
     """
     Get data optimized for heatmap visualization.
@@ -240,59 +228,27 @@ def get_heatmap_data():
     try:
         params = request.validated_data
         
-        query = """
-            SELECT 
-                latitud,
-                longitud,
-                CAST(porcentaje AS NUMERIC) as porcentaje,
-                sucursal_clean,
-                estado,
-                fecha_supervision
-            FROM supervision_operativa_detalle
-            WHERE latitud IS NOT NULL 
-              AND longitud IS NOT NULL 
-              AND porcentaje IS NOT NULL
-              AND fecha_supervision IS NOT NULL
-        """
-        
-        query_params = []
-        
-        if params['quarter'] != 'ALL':
-            query += " AND EXTRACT(QUARTER FROM fecha_supervision) = %s"
-            query_params.append(int(params['quarter'][1]))
-        
-        if params['year']:
-            query += " AND EXTRACT(YEAR FROM fecha_supervision) = %s"
-            query_params.append(params['year'])
-        
-        if params.get('estado'):
-            query += " AND estado = %s"
-            query_params.append(params['estado'])
-        
-        if params.get('grupo'):
-            query += " AND grupo_operativo = %s"
-            query_params.append(params['grupo'])
-        
-        # Limit for performance
-        query += " LIMIT %s;"
-        query_params.append(min(params['limit'], 5000))  # Max 5000 points for heatmap
+        # Max 5000 points for heatmap
+        query, query_params = heatmap_query(
+            params['quarter'], params['year'], params.get('estado'), params.get('grupo'),
+            limit=min(params['limit'], 5000)
+        )
         
-        from database.connection_v3 import execute_query
-        results = execute_query(query, query_params)
+        from database.connection_v3 import stream_query
         
-        # Process for heatmap
+        # Process for heatmap while rows stream in from a server-side cursor
         heatmap_points = []
-        for item in results:
+        for item in stream_query(query, query_params, row_format='namedtuple'):
             # Normalize intensity (0-1 based on percentage)
-            intensity = (item['porcentaje'] or 0) / 100.0
+            intensity = float(item.porcentaje or 0) / 100.0
             
             heatmap_points.append({
-                'lat': float(item['latitud']),
-                'lng': float(item['longitud']),
+                'lat': float(item.latitud),
+                'lng': float(item.longitud),
                 'intensity': intensity,
-                'value': item['porcentaje'],
-                'sucursal': item['sucursal_clean'],
-                'estado': item['estado']
+                'value': item.porcentaje,
+                'sucursal': item.sucursal_clean,
+                'estado': item.estado
             })
         
         return jsonify({
@@ -325,6 +281,7 @@ def get_heatmap_data():
 @optional_auth
 @rate_limit_by_user("30 per minute")
 @cached_api_response(ttl=3600, cache_type='geo_data')
+@query_budget(2000)
 def get_map_bounds():
     """
     Get geographic bounds for map initialization.
@@ -399,6 +356,7 @@ def get_map_bounds():
 @rate_limit_by_user("10 per minute")
 @validate_input(GeoQuerySchema)
 @cached_api_response(ttl=1800, cache_type='geo_data')
+@query_budget(5000)
 def get_performance_clusters():
     """
     Get performance clusters for advanced map visualization.
@@ -432,13 +390,9 @@ def get_performance_clusters():
         
         query_params = []
         
-        if params['quarter'] != 'ALL':
-            query += " AND EXTRACT(QUARTER FROM fecha_supervision) = %s"
-            query_params.append(int(params['quarter'][1]))
-        
-        if params['year']:
-            query += " AND EXTRACT(YEAR FROM fecha_supervision) = %s"
-            query_params.append(params['year'])
+        period_sql, period_params = period_filter(params['quarter'], params['year'])
+        query += period_sql
+        query_params.extend(period_params)
         
         query += """
             GROUP BY estado
@@ -447,22 +401,22 @@ def get_performance_clusters():
         """
         
         from database.connection_v3 import execute_query
-        results = execute_query(query, query_params)
+        results = execute_query(query, query_params, row_format='namedtuple')
         
         # Process clusters
         clusters = []
         for item in results:
             cluster = {
-                'id': f"cluster_{item['estado']}",
-                'estado': item['estado'],
-                'performance_level': item['cluster_performance'],
-                'promedio': item['promedio_cluster'],
-                'total_sucursales': item['total_sucursales'],
+                'id': f"cluster_{item.estado}",
+                'estado': item.estado,
+                'performance_level': item.cluster_performance,
+                'promedio': item.promedio_cluster,
+                'total_sucursales': item.total_sucursales,
                 'centro': {
-                    'lat': float(item['centro_lat']),
-                    'lng': float(item['centro_lng'])
+                    'lat': float(item.centro_lat),
+                    'lng': float(item.centro_lng)
                 },
-                'sucursales': item['sucursales_incluidas'][:10]  # Limit for response size
+                'sucursales': item.sucursales_incluidas[:10]  # Limit for response size
             }
             clusters.append(cluster)
         
@@ -9,6 +9,9 @@ from datetime import datetime, timezone
 from flask import Blueprint, jsonify
 
 from database.connection_v3 import test_connection
+from database.query_metrics import query_metrics
+from database.dimension_catalog import dimension_catalog
+from database.optimization import aggregate_router
 from cache.cache_manager import cache_manager, cache_monitoring
 from middleware.security_middleware import security_middleware
 
@@ -188,13 +191,18 @@ def database_health():
         # Connection pool info (if available)
         pool_info = {}
         try:
-            from database.connection_v3 import connection_pool
+            from database.connection_v3 import connection_pool, read_connection_pool, get_pool_stats
             if connection_pool:
                 pool_info = {
                     'pool_size': connection_pool.max_size,
                     'available_connections': connection_pool.get_stats().get('pool_available', 'unknown'),
-                    'pool_hits': connection_pool.get_stats().get('pool_hits', 'unknown')
+                    'pool_hits': connection_pool.get_stats().get('pool_hits', 'unknown'),
+                    'read_replica_enabled': read_connection_pool is not connection_pool,
+                    'telemetry': get_pool_stats()
                 }
+                if read_connection_pool is not None and read_connection_pool is not connection_pool:
+                    pool_info['read_pool_size'] = read_connection_pool.max_size
+                    pool_info['read_available_connections'] = read_connection_pool.get_stats().get('pool_available', 'unknown')
         except Exception:
             pool_info = {'error': 'Pool info unavailable'}
         
@@ -216,7 +224,9 @@ def database_health():
                 'response_time_ms': round(response_time, 2),
                 'server_time': test_result[0]['current_time'].isoformat() if test_result else None,
                 'version': test_result[0]['db_version'] if test_result else None,
-                'pool_info': pool_info
+                'pool_info': pool_info,
+                'dimension_catalog': dimension_catalog.get_stats(),
+                'aggregate_routing': aggregate_router.get_stats()
             }
         }
         
@@ -371,8 +381,16 @@ app_database_connected {1 if test_connection() else 0}
 # HELP app_redis_available Redis availability status
 # TYPE app_redis_available gauge
 app_redis_available {1 if cache_stats['redis_available'] else 0}
+
 """
         
+        # Per-fingerprint database query histograms
+        metrics_text += query_metrics.prometheus_metrics()
+        
+        from database.connection_v3 import pool_monitors
+        for monitor in list(pool_monitors.values()):
+            metrics_text += monitor.prometheus_metrics()
+        
         from flask import Response
         return Response(metrics_text, mimetype='text/plain')
         
@@ -15,8 +15,10 @@ from database.queries_v3 import (
     get_sucursales_list, get_grupos_operativos, get_areas_evaluacion,
     get_summary_stats, get_metrics_by_sucursal, get_performance_by_sucursal,
     get_performance_by_grupo, get_performance_by_area, get_trends_by_date,
-    get_detailed_performance
+    get_detailed_performance, get_performance_rollup, get_detailed_performance_page
 )
+from database.pagination import InvalidCursor
+from database.rollups import GRANULARITIES
 # Note: queries_real_metabase functions temporarily disabled during cleanup
 # from database.queries_real_metabase import (
 #     get_real_kpis, get_real_estados_performance, get_real_sucursales_coordinates,
@@ -527,6 +529,32 @@ def get_performance_area():
             'error': str(e)
         }), 500
 
+@app.route('/api/performance/rollup')
+def get_performance_rollup_endpoint():
+    """Get performance by sucursal, grupo and area (plus total) in a single scan."""
+    try:
+        fecha_inicio = request.args.get('fecha_inicio')
+        fecha_fin = request.args.get('fecha_fin')
+        
+        if not fecha_inicio:
+            fecha_inicio = (datetime.now() - timedelta(days=30)).date()
+        if not fecha_fin:
+            fecha_fin = datetime.now().date()
+            
+        data = get_performance_rollup(fecha_inicio, fecha_fin)
+        return jsonify({
+            'status': 'success',
+            'data': data,
+            'count': {name: len(rows) for name, rows in data.items() if name != 'total'}
+        })
+    except Exception as e:
+        logger.error(f"Error getting performance rollup: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Failed to fetch performance data',
+            'error': str(e)
+        }), 500
+
 @app.route('/api/trends')
 def get_trends():
     """Get trends over time."""
@@ -534,13 +562,20 @@ def get_trends():
         fecha_inicio = request.args.get('fecha_inicio')
         fecha_fin = request.args.get('fecha_fin')
         sucursal = request.args.get('sucursal')
+        granularity = request.args.get('granularity', 'day')
+        
+        if granularity not in GRANULARITIES:
+            return jsonify({
+                'status': 'error',
+                'message': f"granularity must be one of {', '.join(GRANULARITIES)}"
+            }), 400
         
         if not fecha_inicio:
             fecha_inicio = (datetime.now() - timedelta(days=30)).date()
         if not fecha_fin:
             fecha_fin = datetime.now().date()
             
-        data = get_trends_by_date(fecha_inicio, fecha_fin, sucursal)
+        data = get_trends_by_date(fecha_inicio, fecha_fin, sucursal, granularity)
         return jsonify({
             'status': 'success',
             'data': data,
@@ -570,11 +605,26 @@ def get_metrics():
         if not fecha_fin:
             fecha_fin = datetime.now().date()
             
-        data = get_detailed_performance(sucursal, grupo, area, fecha_inicio, fecha_fin)
+        cursor = request.args.get('cursor')
+        try:
+            page_size = int(request.args.get('page_size', 1000))
+        except ValueError:
+            page_size = 0
+        if page_size < 1:
+            return jsonify({
+                'status': 'error',
+                'message': 'Invalid page_size',
+                'error': 'page_size must be a positive integer'
+            }), 400
+        page_size = min(page_size, 1000)
+        
+        page = get_detailed_performance_page(sucursal, grupo, area, fecha_inicio, fecha_fin, page_size, cursor)
+        data = page['data']
         return jsonify({
             'status': 'success',
             'data': data,
             'count': len(data),
+            'next_cursor': page['next_cursor'],
             'filters': {
                 'sucursal': sucursal,
                 'grupo': grupo,
@@ -583,6 +633,12 @@ def get_metrics():
                 'fecha_fin': str(fecha_fin)
             }
         })
+    except InvalidCursor as e:
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid cursor',
+            'error': str(e)
+        }), 400
     except Exception as e:
         logger.error(f"Error getting metrics: {str(e)}")
         return jsonify({
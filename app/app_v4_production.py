@@ -6,6 +6,7 @@ Version 4.0 - Production Release
 import os
 import sys
 import logging
+import threading
 from datetime import datetime, timezone
 from flask import Flask, request, jsonify
 from flask_cors import CORS
@@ -17,7 +18,12 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from auth.security import SecurityConfig
 from middleware.security_middleware import SecurityMiddleware
 from cache.cache_manager import cache_manager, CACHE_WARMUP_FUNCTIONS
+from database.connection_v3 import init_connection_pool
+from database.dimension_catalog import dimension_catalog
 from database.optimization import db_optimizer, maintenance_tasks
+from database.rollups import time_rollups, geo_rollup
+from database.scheduler import maintenance_scheduler
+from database.migrations import run_migrations, run_partitioning
 from error_handling import error_handler_manager
 from api.v1 import auth_bp, analytics_bp, geo_bp, health_bp, admin_bp
 from web.dashboard import web_bp
@@ -317,16 +323,15 @@ def initialize_services(app):
     
     with app.app_context():
         try:
-            # Initialize database optimizations
-            logger.info("Initializing database optimizations...")
+            # Pre-open the connection pool; filter dimensions load in the background
+            # and are queried directly until the catalog is ready
+            init_connection_pool()
+            dimension_catalog.start_loading()
             
-            # Create indexes if they don't exist
-            index_results = db_optimizer.create_indexes()
-            logger.info(f"Database indexes: {len(index_results['created'])} created, {len(index_results['skipped'])} skipped")
-            
-            # Create materialized views
-            view_results = db_optimizer.create_materialized_views()
-            logger.info(f"Materialized views: {len(view_results['created'])} created, {len(view_results['skipped'])} skipped")
+            # Indexes, materialized views and rollup tables are applied out of band
+            # (python -m database.migrations); opt in to a non-blocking attempt here
+            if os.getenv('DB_MIGRATE_ON_BOOT', 'false').lower() == 'true':
+                threading.Thread(target=run_migrations, kwargs={'wait': False}, daemon=True).start()
             
             # Warm cache
             logger.info("Warming application cache...")
@@ -370,73 +375,17 @@ def add_custom_middleware(app):
 
 # Background task setup (for production deployment)
 def setup_background_tasks(app):
-    """Setup background tasks for maintenance"""
+    """Start the leader-elected maintenance scheduler"""
+    # Flask CLI commands (init-db, maintenance, ...) do their own work
+    if os.getenv('FLASK_RUN_FROM_CLI') == 'true':
+        return
+    
+    if os.getenv('SCHEDULER_ENABLED', 'true').lower() != 'true':
+        logger.info("Maintenance scheduler disabled")
+        return
+    
     try:
-        from celery import Celery
-        
-        # Configure Celery
-        celery = Celery(
-            app.import_name,
-            broker=os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0'),
-            backend=os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
-        )
-        
-        # Configure task schedules
-        celery.conf.beat_schedule = {
-            'refresh-materialized-views': {
-                'task': 'tasks.refresh_materialized_views',
-                'schedule': 3600.0,  # Every hour
-            },
-            'cleanup-cache': {
-                'task': 'tasks.cleanup_cache',
-                'schedule': 21600.0,  # Every 6 hours
-            },
-            'daily-maintenance': {
-                'task': 'tasks.daily_maintenance',
-                'schedule': 86400.0,  # Daily
-            }
-        }
-        
-        @celery.task
-        def refresh_materialized_views():
-            """Background task to refresh materialized views"""
-            with app.app_context():
-                try:
-                    results = db_optimizer.refresh_materialized_views()
-                    logger.info(f"Materialized views refreshed: {results}")
-                    return results
-                except Exception as e:
-                    logger.error(f"Error refreshing materialized views: {e}")
-                    return {'error': str(e)}
-        
-        @celery.task
-        def cleanup_cache():
-            """Background task to cleanup cache"""
-            try:
-                # Clear expired entries
-                cache_manager.clear_pattern("*:expired:*")
-                logger.info("Cache cleanup completed")
-                return {'status': 'completed'}
-            except Exception as e:
-                logger.error(f"Cache cleanup error: {e}")
-                return {'error': str(e)}
-        
-        @celery.task
-        def daily_maintenance():
-            """Background task for daily maintenance"""
-            with app.app_context():
-                try:
-                    maintenance_tasks.daily_maintenance()
-                    logger.info("Daily maintenance completed")
-                    return {'status': 'completed'}
-                except Exception as e:
-                    logger.error(f"Daily maintenance error: {e}")
-                    return {'error': str(e)}
-        
-        logger.info("Background tasks configured successfully")
-        
-    except ImportError:
-        logger.warning("Celery not available, background tasks disabled")
+        maintenance_scheduler.start()
     except Exception as e:
         logger.error(f"Error setting up background tasks: {e}")
 
@@ -454,22 +403,36 @@ def init_db():
     with app.app_context():
         logger.info("Initializing database...")
         
-        # Create indexes
-        index_results = db_optimizer.create_indexes()
-        print(f"Indexes created: {len(index_results['created'])}")
-        print(f"Indexes skipped: {len(index_results['skipped'])}")
-        if index_results['errors']:
-            print(f"Index errors: {index_results['errors']}")
+        # Apply pending migrations (waits for any other runner to finish)
+        migration_results = run_migrations(wait=True)
+        print(f"Migrations applied: {len(migration_results['applied'])}")
+        print(f"Migrations up to date: {migration_results['up_to_date']}")
+        if migration_results['skipped']:
+            print(f"Migrations skipped: {migration_results['skipped']}")
+        if migration_results['errors']:
+            print(f"Migration errors: {migration_results['errors']}")
         
-        # Create materialized views
-        view_results = db_optimizer.create_materialized_views()
-        print(f"Views created: {len(view_results['created'])}")
-        print(f"Views skipped: {len(view_results['skipped'])}")
-        if view_results['errors']:
-            print(f"View errors: {view_results['errors']}")
+        # Populate time rollups
+        print(f"Time rollups: {time_rollups.rebuild()}")
+        print(f"Geo rollup: {geo_rollup.rebuild()}")
         
         print("Database initialization completed")
 
+@app.cli.command()
+def partition_table():
+    """Convert supervision_operativa_detalle to quarterly partitions"""
+    with app.app_context():
+        logger.info("Partitioning supervision table...")
+        
+        results = run_partitioning(move_history=True)
+        print(f"Conversion: {results['partitioning']}")
+        print(f"Historical quarters moved: {results['history']}")
+        print(f"Migrations applied: {len(results['applied'])}")
+        if results['errors']:
+            print(f"Partitioning errors: {results['errors']}")
+        
+        print(f"Partitions: {db_optimizer.partition_status()}")
+
 @app.cli.command()
 def warm_cache():
     """Warm application cache"""
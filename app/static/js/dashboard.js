@@ -227,30 +227,26 @@ async function loadAllData() {
         
         const filters = getFilters();
         
-        // Fetch all data in parallel
-        const [summaryRes, sucursalRes, grupoRes, areaRes, trendsRes, metricsRes] = await Promise.all([
+        // Fetch all data in parallel; the sucursal/grupo/area breakdowns come from one rollup scan
+        const [summaryRes, rollupRes, trendsRes, metricsRes] = await Promise.all([
             fetch('/api/summary'),
-            fetch(`/api/performance/sucursal?${new URLSearchParams(filters)}`),
-            fetch(`/api/performance/grupo?${new URLSearchParams(filters)}`),
-            fetch(`/api/performance/area?${new URLSearchParams(filters)}`),
+            fetch(`/api/performance/rollup?${new URLSearchParams(filters)}`),
             fetch(`/api/trends?${new URLSearchParams(filters)}`),
             fetch(`/api/metrics?${new URLSearchParams(filters)}`)
         ]);
 
         // Parse responses
         const summaryData = await summaryRes.json();
-        const sucursalData = await sucursalRes.json();
-        const grupoData = await grupoRes.json();
-        const areaData = await areaRes.json();
+        const rollupData = (await rollupRes.json()).data || {};
         const trendsData = await trendsRes.json();
         const metricsData = await metricsRes.json();
 
         // Store data globally
         currentData = {
             summary: summaryData.data,
-            sucursal: sucursalData.data,
-            grupo: grupoData.data,
-            area: areaData.data,
+            sucursal: rollupData.sucursal,
+            grupo: rollupData.grupo,
+            area: rollupData.area,
             trends: trendsData.data,
             metrics: metricsData.data
         };
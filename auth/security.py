@@ -278,6 +278,12 @@ class APIQuerySchema(Schema):
         missing=0,
         error_messages={'invalid': 'Offset must be 0 or greater'}
     )
+    cursor = fields.Str(
+        validate=validate.Length(max=512),
+        missing=None,
+        allow_none=True,
+        error_messages={'invalid_length': 'Cursor too long'}
+    )
 
 class TelegramAuthSchema(Schema):
     """Validation for Telegram authentication data"""
@@ -4,8 +4,10 @@ Provides intelligent caching for database queries, API responses, and session da
 """
 
 import os
+import time
 import redis
 import json
+import fnmatch
 import hashlib
 import logging
 import pickle
@@ -34,6 +36,13 @@ class CacheConfig:
         'static_data': 3600    # 1 hour
     }
     
+    # Seconds a worker reuses a scope's version before re-reading it from Redis
+    VERSION_CHECK_INTERVAL = float(os.getenv('CACHE_VERSION_CHECK_INTERVAL', 2))
+    
+    # TTL cap for entries only held in this process (no Redis): other workers'
+    # invalidations cannot reach them, so they must expire quickly
+    LOCAL_MAX_TTL = int(os.getenv('CACHE_LOCAL_MAX_TTL', 60))
+    
     # Cache prefixes for organization
     PREFIXES = {
         'query': 'q',
@@ -92,6 +101,13 @@ class MemoryCache:
         self.cache.clear()
         self.access_times.clear()
     
+    def clear_pattern(self, pattern: str) -> int:
+        """Delete keys matching a glob pattern"""
+        keys = [key for key in self.cache if fnmatch.fnmatchcase(key, pattern)]
+        for key in keys:
+            self.delete(key)
+        return len(keys)
+    
     def _evict_lru(self):
         """Evict least recently used item"""
         if not self.access_times:
@@ -106,6 +122,8 @@ class CacheManager:
     def __init__(self):
         self.redis_client = None
         self.memory_cache = MemoryCache()
+        # scope -> (version, monotonic time it was read)
+        self.scope_versions = {}
         self.stats = {
             'hits': 0,
             'misses': 0,
@@ -137,13 +155,37 @@ class CacheManager:
             self.redis_client = None
             self.stats['redis_available'] = False
     
-    def generate_cache_key(self, prefix: str, **kwargs) -> str:
-        """Generate consistent cache keys"""
+    def _scope_version(self, scope: str) -> int:
+        """Current version of ``scope``, shared through Redis (re-read every VERSION_CHECK_INTERVAL)"""
+        version, checked_at = self.scope_versions.get(scope, (0, None))
+        if not self.redis_client:
+            return version
+        if checked_at is not None and time.monotonic() - checked_at < CacheConfig.VERSION_CHECK_INTERVAL:
+            return version
+        
+        try:
+            value = self.redis_client.get(f"ver:{scope}")
+            version = int(value) if value is not None else 0
+        except Exception as e:
+            logger.error(f"Cache version read error for {scope}: {e}")
+        self.scope_versions[scope] = (version, time.monotonic())
+        return version
+    
+    def generate_cache_key(self, prefix: str, scope: str = None, **kwargs) -> str:
+        """
+        Generate consistent cache keys.
+        
+        ``scope`` (a function or endpoint name) and its current version are
+        part of the key, so ``invalidate_scopes`` retires every entry of the
+        scope at once in all workers.
+        """
         # Sort kwargs for consistent keys
         key_data = json.dumps(kwargs, sort_keys=True, default=str)
         key_hash = hashlib.md5(key_data.encode()).hexdigest()
         
         prefix_short = CacheConfig.PREFIXES.get(prefix, prefix[:3])
+        if scope:
+            return f"{prefix_short}:{scope}:v{self._scope_version(scope)}:{key_hash}"
         return f"{prefix_short}:{key_hash}"
     
     def get(self, key: str) -> Optional[Any]:
@@ -179,6 +221,7 @@ class CacheManager:
     def set(self, key: str, value: Any, ttl: int = None, cache_type: str = 'default'):
         """Set cached value with intelligent TTL"""
         ttl = ttl or CacheConfig.TTL_CONFIG.get(cache_type, CacheConfig.DEFAULT_TTL)
+        local_ttl = min(ttl, CacheConfig.LOCAL_MAX_TTL)
         
         try:
             # Try Redis first
@@ -193,13 +236,13 @@ class CacheManager:
                 logger.debug(f"Cached in Redis: {key} (TTL: {ttl}s)")
             
             # Also cache in memory for faster access
-            self.memory_cache.set(key, value, ttl)
+            self.memory_cache.set(key, value, ttl if self.redis_client else local_ttl)
             
         except Exception as e:
             logger.error(f"Cache set error for key {key}: {e}")
             self.stats['errors'] += 1
             # Always try memory cache as fallback
-            self.memory_cache.set(key, value, ttl)
+            self.memory_cache.set(key, value, local_ttl)
     
     def delete(self, key: str):
         """Delete cached value"""
@@ -210,16 +253,43 @@ class CacheManager:
         except Exception as e:
             logger.error(f"Cache delete error for key {key}: {e}")
     
-    def clear_pattern(self, pattern: str):
+    def clear_pattern(self, pattern: str) -> int:
         """Clear cache keys matching pattern"""
+        cleared = self.memory_cache.clear_pattern(pattern)
         try:
             if self.redis_client:
                 keys = self.redis_client.keys(pattern)
                 if keys:
                     self.redis_client.delete(*keys)
+                    cleared += len(keys)
                     logger.info(f"Cleared {len(keys)} cache keys matching: {pattern}")
         except Exception as e:
             logger.error(f"Cache clear pattern error: {e}")
+        return cleared
+    
+    def invalidate_scopes(self, scopes: List[str]) -> int:
+        """
+        Retire the cached results of the given functions or endpoints.
+        
+        Scopes are ``cached_query`` function names and ``cached_api_response``
+        endpoint names. Each scope's version is bumped in Redis, so every
+        worker stops using the old entries within VERSION_CHECK_INTERVAL;
+        they expire by TTL. Without Redis only this process sees the bump,
+        and other workers' entries live at most LOCAL_MAX_TTL seconds.
+        """
+        for scope in scopes:
+            version = self.scope_versions.get(scope, (0, None))[0] + 1
+            try:
+                if self.redis_client:
+                    version = self.redis_client.incr(f"ver:{scope}")
+            except Exception as e:
+                logger.error(f"Cache version bump error for {scope}: {e}")
+            self.scope_versions[scope] = (version, time.monotonic())
+            self.memory_cache.clear_pattern(f"*:{scope}:*")
+        
+        if scopes:
+            logger.info(f"Invalidated cache scopes: {', '.join(scopes)}")
+        return len(scopes)
     
     def get_stats(self) -> Dict[str, Any]:
         """Get cache statistics"""
@@ -281,6 +351,7 @@ def cached_query(ttl: int = None, cache_type: str = 'database_queries', key_pref
             # Generate cache key
             cache_key = cache_manager.generate_cache_key(
                 key_prefix,
+                scope=func.__name__,
                 func_name=func.__name__,
                 args=args,
                 kwargs=kwargs
@@ -313,6 +384,7 @@ def cached_api_response(ttl: int = None, cache_type: str = 'api_responses'):
             
             cache_key = cache_manager.generate_cache_key(
                 'api',
+                scope=request.endpoint,
                 endpoint=request.endpoint,
                 args=dict(request.args),
                 user_id=getattr(request, 'user_id', None)
@@ -7,22 +7,35 @@ import os
 import json
 from datetime import datetime
 from flask import Flask, render_template, jsonify, request
-import psycopg
 from psycopg.rows import dict_row
 from dotenv import load_dotenv
 
+from database.periods import quarter_range
+from database.dimension_catalog import dimension_catalog
+from database.connection_v3 import (
+    get_db_connection as get_pooled_connection,
+    return_db_connection,
+    init_connection_pool,
+    execute_queries_concurrently
+)
+from database.scheduler import maintenance_scheduler
+
 load_dotenv()
 
 app = Flask(__name__)
 
-# Database connection
-DATABASE_URL = os.getenv('DATABASE_URL')
+# Abrir el pool al arrancar cada worker para que la primera petición no pague el handshake
+init_connection_pool()
+
+# Mantenimiento programado (vistas, rollups, caché) sin broker: un solo worker líder lo ejecuta
+if os.getenv('SCHEDULER_ENABLED', 'true').lower() == 'true':
+    maintenance_scheduler.start()
 
 def get_db_connection():
-    """Establecer conexión a PostgreSQL"""
+    """Obtener una conexión del pool compartido de PostgreSQL"""
     try:
-        conn = psycopg.connect(DATABASE_URL)
-        return conn
+        # Este dashboard solo lee datos: usar la réplica si está configurada
+        return get_pooled_connection(route='replica')
     except Exception as e:
         print(f"Error conectando a la base de datos: {e}")
         return None
@@ -38,46 +51,48 @@ def get_kpis():
     trimestre = request.args.get('trimestre', 'Q3')
     year = int(request.args.get('year', '2025'))
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Error de conexión'}), 500
-    
-    cur = conn.cursor(row_factory=dict_row)
-    
     # Mapeo de trimestres
     quarter_map = {'Q1': 1, 'Q2': 2, 'Q3': 3, 'Q4': 4}
     quarter_num = quarter_map.get(trimestre, 3)
     
+    # Comparación con trimestre anterior
+    prev_quarter = quarter_num - 1 if quarter_num > 1 else 4
+    prev_year = year if quarter_num > 1 else year - 1
+    
+    # KPIs principales
+    kpis_query = """
+        SELECT 
+            AVG(porcentaje) as promedio_general,
+            COUNT(DISTINCT sucursal_clean) as sucursales_evaluadas,
+            COUNT(DISTINCT estado) as estados_activos,
+            COUNT(DISTINCT grupo_operativo) as grupos_operativos,
+            COUNT(*) as total_evaluaciones
+        FROM supervision_operativa_detalle
+        WHERE fecha_supervision >= %s
+        AND fecha_supervision < %s
+        AND porcentaje IS NOT NULL
+    """
+    
+    anterior_query = """
+        SELECT AVG(porcentaje) as promedio_anterior
+        FROM supervision_operativa_detalle
+        WHERE fecha_supervision >= %s
+        AND fecha_supervision < %s
+        AND porcentaje IS NOT NULL
+    """
+    
     try:
-        # KPIs principales
-        cur.execute("""
-            SELECT 
-                AVG(porcentaje) as promedio_general,
-                COUNT(DISTINCT sucursal_clean) as sucursales_evaluadas,
-                COUNT(DISTINCT estado) as estados_activos,
-                COUNT(DISTINCT grupo_operativo) as grupos_operativos,
-                COUNT(*) as total_evaluaciones
-            FROM supervision_operativa_detalle
-            WHERE EXTRACT(YEAR FROM fecha_supervision) = %s
-            AND EXTRACT(QUARTER FROM fecha_supervision) = %s
-            AND porcentaje IS NOT NULL
-        """, (year, quarter_num))
+        # Ambos trimestres se consultan en paralelo
+        kpis_rows, anterior_rows = execute_queries_concurrently([
+            (kpis_query, quarter_range(year, quarter_num)),
+            (anterior_query, quarter_range(prev_year, prev_quarter))
+        ])
         
-        kpis = cur.fetchone()
-        
-        # Comparación con trimestre anterior
-        prev_quarter = quarter_num - 1 if quarter_num > 1 else 4
-        prev_year = year if quarter_num > 1 else year - 1
-        
-        cur.execute("""
-            SELECT AVG(porcentaje) as promedio_anterior
-            FROM supervision_operativa_detalle
-            WHERE EXTRACT(YEAR FROM fecha_supervision) = %s
-            AND EXTRACT(QUARTER FROM fecha_supervision) = %s
-            AND porcentaje IS NOT NULL
-        """, (prev_year, prev_quarter))
+        if not kpis_rows:
+            return jsonify({'error': 'Error de conexión'}), 500
         
-        anterior = cur.fetchone()
+        kpis = kpis_rows[0]
+        anterior = anterior_rows[0] if anterior_rows else None
         variacion = 0
         if anterior and anterior['promedio_anterior']:
             variacion = float(kpis['promedio_general']) - float(anterior['promedio_anterior'])
@@ -98,8 +113,6 @@ def get_kpis():
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
 
 @app.route('/api/indicadores')
 def get_indicadores():
@@ -130,12 +143,12 @@ def get_indicadores():
             WHERE porcentaje IS NOT NULL
             AND area_evaluacion IS NOT NULL 
             AND area_evaluacion != ''
-            AND EXTRACT(YEAR FROM fecha_supervision) = %s
-            AND EXTRACT(QUARTER FROM fecha_supervision) = %s
+            AND fecha_supervision >= %s
+            AND fecha_supervision < %s
             GROUP BY area_evaluacion
             HAVING AVG(porcentaje) IS NOT NULL
             ORDER BY AVG(porcentaje) DESC
-        """, (year, quarter_num))
+        """, quarter_range(year, quarter_num))
         
         indicadores = cur.fetchall()
         
@@ -178,7 +191,7 @@ def get_indicadores():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
-        conn.close()
+        return_db_connection(conn)
 
 @app.route('/api/sucursales')  
 def get_sucursales():
@@ -201,10 +214,10 @@ def get_sucursales():
     where_conditions = [
         "latitud IS NOT NULL",
         "longitud IS NOT NULL", 
-        "EXTRACT(YEAR FROM fecha_supervision) = %s",
-        "EXTRACT(QUARTER FROM fecha_supervision) = %s"
+        "fecha_supervision >= %s",
+        "fecha_supervision < %s"
     ]
-    params = [year, quarter_num]
+    params = list(quarter_range(year, quarter_num))
     
     if estado and estado != 'Todos los Estados':
         where_conditions.append("estado = %s")
@@ -271,7 +284,7 @@ def get_sucursales():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
-        conn.close()
+        return_db_connection(conn)
 
 @app.route('/api/estados')
 def get_estados():
@@ -296,13 +309,13 @@ def get_estados():
                 AVG(porcentaje) as promedio,
                 COUNT(*) as evaluaciones
             FROM supervision_operativa_detalle
-            WHERE EXTRACT(YEAR FROM fecha_supervision) = %s
-            AND EXTRACT(QUARTER FROM fecha_supervision) = %s
+            WHERE fecha_supervision >= %s
+            AND fecha_supervision < %s
             AND porcentaje IS NOT NULL
             AND estado IS NOT NULL
             GROUP BY estado
             ORDER BY AVG(porcentaje) DESC
-        """, (year, quarter_num))
+        """, quarter_range(year, quarter_num))
         
         estados = cur.fetchall()
         
@@ -323,7 +336,7 @@ def get_estados():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
-        conn.close()
+        return_db_connection(conn)
 
 @app.route('/api/grupos')
 def get_grupos():
@@ -348,13 +361,13 @@ def get_grupos():
                 AVG(porcentaje) as promedio,
                 COUNT(*) as evaluaciones
             FROM supervision_operativa_detalle
-            WHERE EXTRACT(YEAR FROM fecha_supervision) = %s
-            AND EXTRACT(QUARTER FROM fecha_supervision) = %s
+            WHERE fecha_supervision >= %s
+            AND fecha_supervision < %s
             AND porcentaje IS NOT NULL
             AND grupo_operativo IS NOT NULL
             GROUP BY grupo_operativo
             ORDER BY AVG(porcentaje) DESC
-        """, (year, quarter_num))
+        """, quarter_range(year, quarter_num))
         
         grupos = cur.fetchall()
         
@@ -375,67 +388,29 @@ def get_grupos():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
-        conn.close()
+        return_db_connection(conn)
 
 @app.route('/api/filtros')
 def get_filtros():
     """API: Opciones de filtros disponibles"""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({'error': 'Error de conexión'}), 500
-    
-    cur = conn.cursor(row_factory=dict_row)
-    
     try:
-        # Estados únicos
-        cur.execute("""
-            SELECT DISTINCT estado, COUNT(DISTINCT sucursal_clean) as sucursales
-            FROM supervision_operativa_detalle
-            WHERE estado IS NOT NULL
-            GROUP BY estado
-            ORDER BY sucursales DESC
-        """)
-        estados = cur.fetchall()
+        # Catálogo de dimensiones en memoria: no consulta la tabla en cada petición
+        estados = sorted(dimension_catalog.with_counts('estado'), key=lambda e: e['sucursales'], reverse=True)
+        grupos = sorted(dimension_catalog.with_counts('grupo'), key=lambda g: g['sucursales'], reverse=True)
         
-        # Grupos únicos
-        cur.execute("""
-            SELECT DISTINCT grupo_operativo, COUNT(DISTINCT sucursal_clean) as sucursales
-            FROM supervision_operativa_detalle
-            WHERE grupo_operativo IS NOT NULL
-            GROUP BY grupo_operativo
-            ORDER BY sucursales DESC
-        """)
-        grupos = cur.fetchall()
-        
-        # Trimestres disponibles
-        cur.execute("""
-            SELECT DISTINCT 
-                EXTRACT(YEAR FROM fecha_supervision) as year,
-                EXTRACT(QUARTER FROM fecha_supervision) as quarter
-            FROM supervision_operativa_detalle
-            ORDER BY year DESC, quarter DESC
-        """)
-        periodos = cur.fetchall()
-        
-        quarter_names = {1: 'Q1', 2: 'Q2', 3: 'Q3', 4: 'Q4'}
-        trimestres = []
-        for p in periodos:
-            trimestres.append({
-                'value': f"{quarter_names[int(p['quarter'])]} {int(p['year'])}",
-                'quarter': quarter_names[int(p['quarter'])],
-                'year': int(p['year'])
-            })
+        trimestres = [
+            {'value': p['value'], 'quarter': p['quarter'], 'year': p['year']}
+            for p in dimension_catalog.periods()
+        ]
         
         return jsonify({
-            'estados': [{'nombre': e['estado'], 'sucursales': e['sucursales']} for e in estados],
-            'grupos': [{'nombre': g['grupo_operativo'], 'sucursales': g['sucursales']} for g in grupos],
+            'estados': [{'nombre': e['value'], 'sucursales': e['sucursales']} for e in estados],
+            'grupos': [{'nombre': g['value'], 'sucursales': g['sucursales']} for g in grupos],
             'trimestres': trimestres
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 8888))
@@ -1,35 +1,136 @@
 import os
+import re
+import asyncio
+import math
+import time
+import itertools
+import threading
+from array import array
+from contextlib import contextmanager
 import psycopg
-from psycopg.rows import dict_row
-from psycopg_pool import ConnectionPool
+from psycopg import pq
+from psycopg.rows import dict_row, tuple_row, namedtuple_row
+from psycopg_pool import ConnectionPool, AsyncConnectionPool, PoolTimeout
 from dotenv import load_dotenv
 import logging
 
+# Before the local imports: PoolConfig (pool_monitor) reads its settings at import time
 load_dotenv()
 
+from .query_metrics import query_metrics, estimate_payload_bytes
+from .deadlines import SET_STATEMENT_TIMEOUT_SQL, current_budget, activate_budget, tracked
+from .pool_monitor import PoolConfig, PoolMonitor
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
-# Database connection pool
+# Database connection pools: primary for writes/DDL/maintenance, read pool
+# for SELECTs (a separate replica when DATABASE_READ_URL is set, otherwise
+# the primary pool itself)
 connection_pool = None
+read_connection_pool = None
+_pool_lock = threading.Lock()
+_checked_out = {}
+
+# Checkout telemetry and autoscaling, keyed by pool name ('primary'/'replica')
+pool_monitors = {}
+
+# Async pools (keyed by route) and the background event loop that owns them
+async_connection_pools = {}
+_async_loop = None
+_async_pool_lock = None
+
+# Statements whose SQL text is worth preparing server-side when repeated
+PREPARABLE_STATEMENTS = ('SELECT', 'WITH')
+
+# Valid values for the ``route`` argument of the execution functions
+ROUTES = ('auto', 'primary', 'replica')
+_WRITE_KEYWORDS = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE|INTO|NEXTVAL|SETVAL)\b', re.IGNORECASE)
+
+# Rows fetched per round trip by stream_query
+STREAM_BATCH_SIZE = 2000
+_cursor_ids = itertools.count(1)
+
+# Row shapes accepted by execute_query/stream_query via ``row_format``
+ROW_FACTORIES = {
+    'dict': dict_row,
+    'tuple': tuple_row,
+    'namedtuple': namedtuple_row,
+}
+COLUMNAR_FORMATS = ('columns', 'numpy')
+
+# int2, int4, int8, float4, float8, numeric
+NUMERIC_TYPE_OIDS = {21, 23, 20, 700, 701, 1700}
+
+def _get_prepare_threshold():
+    """Read the psycopg prepare threshold from the environment ('none' disables it)."""
+    value = os.getenv('DB_PREPARE_THRESHOLD', '2').strip().lower()
+    if value in ('', 'none', 'off'):
+        return None
+    return int(value)
+
+def _pool_kwargs():
+    """Connection arguments shared by every pool."""
+    return {
+        'row_factory': dict_row,
+        'prepare_threshold': _get_prepare_threshold()
+    }
+
+def _create_pool(conninfo, name):
+    """Create a psycopg3 pool. Connections keep their prepared statements,
+    so repeated SQL text skips parse/plan, and are recycled after
+    DB_POOL_MAX_LIFETIME seconds. With DB_POOL_PREWARM the worker waits
+    for min_size connections before serving its first request."""
+    monitor = PoolMonitor(name)
+    pool = ConnectionPool(
+        conninfo,
+        name=name,
+        kwargs=_pool_kwargs(),
+        check=ConnectionPool.check_connection,
+        configure=monitor.register_connection,
+        open=True,
+        **PoolConfig.pool_arguments()
+    )
+    monitor.pool = pool
+    pool_monitors[name] = monitor
+    
+    if PoolConfig.PREWARM:
+        try:
+            pool.wait(timeout=PoolConfig.CHECKOUT_TIMEOUT)
+        except PoolTimeout:
+            logger.warning(f"Pool '{name}' not fully pre-opened within {PoolConfig.CHECKOUT_TIMEOUT}s")
+    
+    return pool
 
 def init_connection_pool():
-    """Initialize the database connection pool with psycopg3."""
-    global connection_pool
+    """Initialize the primary and read database connection pools with psycopg3."""
+    global connection_pool, read_connection_pool
+    
+    if connection_pool is not None:
+        return True
     
     try:
         DATABASE_URL = os.getenv('DATABASE_URL')
+        DATABASE_READ_URL = os.getenv('DATABASE_READ_URL')
         
         if not DATABASE_URL:
             logger.error("DATABASE_URL not found in environment variables")
             return False
         
         # Create connection pool with psycopg3
-        connection_pool = ConnectionPool(
-            DATABASE_URL,
-            min_size=1,
-            max_size=10,
-            open=True
-        )
+        connection_pool = _create_pool(DATABASE_URL, 'primary')
+        
+        if DATABASE_READ_URL and DATABASE_READ_URL != DATABASE_URL:
+            read_connection_pool = _create_pool(DATABASE_READ_URL, 'replica')
+            logger.info("Read replica connection pool created successfully")
+        else:
+            read_connection_pool = connection_pool
         
         if connection_pool:
             logger.info("Database connection pool created successfully")
@@ -39,20 +140,117 @@ def init_connection_pool():
         logger.error(f"Error creating connection pool: {error}")
         return False
 
-def get_db_connection():
-    """Get a connection from the pool."""
+def _ensure_pool():
+    """Create the pool on first use; safe to call from concurrent threads."""
+    if connection_pool is None:
+        with _pool_lock:
+            if connection_pool is None:
+                return init_connection_pool()
+    return True
+
+def is_read_query(query):
+    """Whether a statement only reads data and can be served by a replica."""
+    return query.lstrip().upper().startswith(PREPARABLE_STATEMENTS) and not _WRITE_KEYWORDS.search(query)
+
+def _resolve_route(query, route):
+    """Turn ``route='auto'`` into 'replica' for reads and 'primary' for everything else."""
+    if route not in ROUTES:
+        raise ValueError(f"Unknown route: {route}")
+    if route == 'auto':
+        return 'replica' if is_read_query(query) else 'primary'
+    return route
+
+def _pool_for(route):
+    """Pool serving an already-resolved route."""
+    return read_connection_pool if route == 'replica' else connection_pool
+
+@contextmanager
+def _checkout(route):
+    """Borrow a connection for ``route`` and record how long the caller waited."""
+    pool = _pool_for(route)
+    monitor = pool_monitors.get(pool.name)
+    started = time.perf_counter()
+    acquired = False
+    
+    try:
+        with pool.connection() as conn:
+            acquired = True
+            if monitor:
+                monitor.record_checkout((time.perf_counter() - started) * 1000)
+            try:
+                yield conn
+            finally:
+                if monitor:
+                    monitor.record_return()
+    except PoolTimeout:
+        if monitor and not acquired:
+            monitor.record_checkout((time.perf_counter() - started) * 1000, timed_out=True)
+        raise
+
+@contextmanager
+def autocommit_connection(route='primary'):
+    """
+    Borrow a connection in autocommit mode.
+    
+    For statements that cannot run inside a transaction block, such as
+    ``CREATE INDEX CONCURRENTLY`` and ``VACUUM``, and for session-level
+    advisory locks held across several statements.
+    """
+    if not _ensure_pool():
+        raise RuntimeError("Database connection pool unavailable")
+    
+    with _checkout(route) as conn:
+        conn.autocommit = True
+        try:
+            yield conn
+        finally:
+            conn.autocommit = False
+
+def execute_autocommit(query, params=None):
+    """Run one statement outside a transaction block on the primary; returns None on error."""
+    started = time.perf_counter()
+    failed = False
+    
+    try:
+        with autocommit_connection() as conn:
+            started = time.perf_counter()
+            cursor = conn.execute(query, params, prepare=False)
+            return max(cursor.rowcount, 0)
+    except Exception as error:
+        failed = True
+        logger.error(f"Error executing autocommit statement: {error}")
+        return None
+    finally:
+        query_metrics.record(query, (time.perf_counter() - started) * 1000, 0, 0, failed)
+
+def get_pool_stats():
+    """Checkout telemetry for every sync pool."""
+    return {name: monitor.snapshot() for name, monitor in pool_monitors.items()}
+
+def get_db_connection(route='primary'):
+    """Get a connection from the pool (``route='replica'`` for read-only work)."""
     global connection_pool
     
-    if connection_pool is None:
-        if not init_connection_pool():
-            return None
+    if not _ensure_pool():
+        return None
     
     try:
         # Get connection from pool
-        connection = connection_pool.getconn()
+        pool = _pool_for(route)
+        monitor = pool_monitors.get(pool.name)
+        started = time.perf_counter()
+        try:
+            connection = pool.getconn()
+        except PoolTimeout:
+            if monitor:
+                monitor.record_checkout((time.perf_counter() - started) * 1000, timed_out=True)
+            raise
+        if monitor:
+            monitor.record_checkout((time.perf_counter() - started) * 1000)
         if connection:
             # Set row factory to dict
             connection.row_factory = dict_row
+            _checked_out[id(connection)] = pool
             return connection
     except Exception as error:
         logger.error(f"Error getting connection from pool: {error}")
@@ -64,13 +262,27 @@ def return_db_connection(connection):
     
     if connection_pool and connection:
         try:
-            connection_pool.putconn(connection)
+            # End any read transaction left open by the caller so the pool
+            # does not have to roll it back (and warn) on its own
+            if connection.info.transaction_status != pq.TransactionStatus.IDLE:
+                connection.rollback()
+            pool = _checked_out.pop(id(connection), connection_pool)
+            pool.putconn(connection)
+            if pool.name in pool_monitors:
+                pool_monitors[pool.name].record_return()
         except Exception as error:
             logger.error(f"Error returning connection to pool: {error}")
 
 def close_all_connections():
     """Close all connections in the pool."""
-    global connection_pool
+    global connection_pool, read_connection_pool
+    
+    if read_connection_pool and read_connection_pool is not connection_pool:
+        try:
+            read_connection_pool.close()
+            logger.info("All read replica connections closed")
+        except Exception as error:
+            logger.error(f"Error closing read replica connections: {error}")
     
     if connection_pool:
         try:
@@ -78,18 +290,24 @@ def close_all_connections():
             logger.info("All database connections closed")
         except Exception as error:
             logger.error(f"Error closing connections: {error}")
+    
+    for route, pool in list(async_connection_pools.items()):
+        try:
+            asyncio.run_coroutine_threadsafe(pool.close(), _async_loop).result(timeout=10)
+            async_connection_pools.pop(route, None)
+            logger.info(f"All async {route} database connections closed")
+        except Exception as error:
+            logger.error(f"Error closing async connections: {error}")
 
 def test_connection():
     """Test the database connection."""
     try:
-        DATABASE_URL = os.getenv('DATABASE_URL')
-        
-        if not DATABASE_URL:
+        if not _ensure_pool():
             logger.error("DATABASE_URL not found")
             return False
         
-        # Simple connection test
-        with psycopg.connect(DATABASE_URL) as conn:
+        # Simple connection test on a pooled connection
+        with connection_pool.connection() as conn:
             with conn.cursor(row_factory=dict_row) as cursor:
                 cursor.execute("SELECT version();")
                 db_version = cursor.fetchone()
@@ -122,23 +340,476 @@ def test_connection():
         logger.error(f"Error testing connection: {error}")
         return False
 
-def execute_query(query, params=None):
-    """Execute a query and return results."""
+def _is_preparable(query):
+    """Whether a statement is a read that the server can prepare."""
+    return query.lstrip().upper().startswith(PREPARABLE_STATEMENTS)
+
+def _row_factory_for(row_format):
+    """Resolve a ``row_format`` name to the psycopg row factory that builds it."""
+    if row_format in COLUMNAR_FORMATS:
+        return tuple_row
+    if row_format not in ROW_FACTORIES:
+        raise ValueError(f"Unknown row_format: {row_format}")
+    return ROW_FACTORIES[row_format]
+
+def _to_columns(description, rows, row_format):
+    """
+    Transpose tuple rows into a ``{column: values}`` mapping.
+    
+    Numeric columns become ``array('d')`` (or NumPy float64 arrays for
+    ``row_format='numpy'``) with NULL mapped to NaN; other columns stay
+    plain lists.
+    """
+    if row_format == 'numpy' and not NUMPY_AVAILABLE:
+        raise ValueError("row_format='numpy' requires numpy to be installed")
+    
+    columns = {}
+    for index, column in enumerate(description):
+        values = [row[index] for row in rows]
+        
+        if column.type_code in NUMERIC_TYPE_OIDS:
+            numbers = array('d', (math.nan if value is None else float(value) for value in values))
+            columns[column.name] = np.frombuffer(numbers, dtype=np.float64) if row_format == 'numpy' else numbers
+        else:
+            columns[column.name] = values
+    
+    return columns
+
+def _execute_with_budget(conn, cursor, query, params, prepare, budget):
+    """Execute ``query``, first capping it at the request budget's remaining time."""
+    if budget is None:
+        cursor.execute(query, params, prepare=prepare)
+        return
+    
+    timeout = [str(budget.statement_timeout_ms())]
+    if psycopg.Pipeline.is_supported():
+        # Send the SET and the statement in a single round trip
+        with conn.pipeline():
+            conn.execute(SET_STATEMENT_TIMEOUT_SQL, timeout, prepare=False)
+            cursor.execute(query, params, prepare=prepare)
+    else:
+        conn.execute(SET_STATEMENT_TIMEOUT_SQL, timeout, prepare=False)
+        cursor.execute(query, params, prepare=prepare)
+
+def execute_query(query, params=None, prepare=None, row_format='dict', route='auto'):
+    """
+    Execute a query on a pooled connection and return results.
+    
+    Reads return a list of dicts; other statements are committed and
+    return the affected row count. ``prepare`` overrides the pool's
+    prepare threshold for this call (True forces a server-side prepared
+    statement, False skips it). DDL and maintenance are never prepared.
+    
+    ``row_format`` selects the shape of read results: ``'dict'``,
+    ``'tuple'``, ``'namedtuple'``, or column-oriented ``'columns'`` /
+    ``'numpy'`` (see ``_to_columns``).
+    
+    ``route='auto'`` sends reads to the read pool (DATABASE_READ_URL)
+    and DDL, maintenance and writes to the primary; pass ``'primary'``
+    for reads that must observe the primary's latest state.
+    
+    Inside a ``statement_budget``/``query_budget`` scope the statement
+    runs with ``statement_timeout`` set to the budget's remaining time.
+    """
+    budget = current_budget()
+    started = time.perf_counter()
+    row_count = payload_bytes = 0
+    failed = False
+    
     try:
-        DATABASE_URL = os.getenv('DATABASE_URL')
+        if not _ensure_pool():
+            failed = True
+            return None
         
-        with psycopg.connect(DATABASE_URL) as conn:
-            with conn.cursor(row_factory=dict_row) as cursor:
-                cursor.execute(query, params)
+        if not _is_preparable(query):
+            prepare = False
+        
+        with _checkout(_resolve_route(query, route)) as conn, tracked(budget, conn):
+            with conn.cursor(row_factory=_row_factory_for(row_format)) as cursor:
+                # Time the statement itself, not the wait for a pooled connection
+                started = time.perf_counter()
+                _execute_with_budget(conn, cursor, query, params, prepare, budget)
                 
-                # Check if it's a SELECT query
-                if query.strip().upper().startswith('SELECT'):
-                    results = cursor.fetchall()
-                    return [dict(row) for row in results]
+                # Statements producing rows (SELECT, WITH ... SELECT) have a description
+                if cursor.description is not None:
+                    rows = cursor.fetchall()
+                    row_count = len(rows)
+                    payload_bytes = estimate_payload_bytes(cursor.pgresult)
+                    if row_format in COLUMNAR_FORMATS:
+                        return _to_columns(cursor.description, rows, row_format)
+                    return rows
                 else:
                     conn.commit()
+                    row_count = max(cursor.rowcount, 0)
                     return cursor.rowcount
                     
     except Exception as error:
+        failed = True
+        if budget:
+            budget.note_error(error)
         logger.error(f"Error executing query: {error}")
-        return None
\ No newline at end of file
+        return None
+    finally:
+        query_metrics.record(query, (time.perf_counter() - started) * 1000, row_count, payload_bytes, failed, params)
+
+def stream_query(query, params=None, batch_size=STREAM_BATCH_SIZE, row_format='dict', route='replica'):
+    """
+    Yield rows of a SELECT one at a time using a named server-side cursor.
+    
+    Rows are pulled from the server in ``batch_size`` chunks, so memory use
+    stays bounded by the batch instead of the whole result set. The pooled
+    connection is held until the generator is exhausted or closed; use it
+    in a ``for`` loop or wrap it in ``contextlib.closing`` when breaking
+    out early. Errors are logged and re-raised so a failed stream is never
+    mistaken for a short one. ``row_format`` may be ``'dict'``,
+    ``'tuple'`` or ``'namedtuple'``.
+    """
+    if row_format not in ROW_FACTORIES:
+        raise ValueError(f"Unsupported row_format for streaming: {row_format}")
+    
+    if not _ensure_pool():
+        raise RuntimeError("Database connection pool unavailable")
+    
+    cursor_name = f"stream_{os.getpid()}_{next(_cursor_ids)}"
+    
+    budget = current_budget()
+    
+    # Only time spent waiting on the server counts, not the consumer's work
+    elapsed = 0.0
+    row_count = payload_bytes = 0
+    failed = False
+    
+    try:
+        with _checkout(route) as conn, tracked(budget, conn):
+            if budget:
+                # Also bounds every FETCH issued for the cursor
+                conn.execute(SET_STATEMENT_TIMEOUT_SQL, [str(budget.statement_timeout_ms())], prepare=False)
+            
+            with conn.cursor(name=cursor_name, row_factory=ROW_FACTORIES[row_format]) as cursor:
+                cursor.itersize = batch_size
+                started = time.perf_counter()
+                cursor.execute(query, params)
+                elapsed += time.perf_counter() - started
+                
+                while True:
+                    started = time.perf_counter()
+                    rows = cursor.fetchmany(batch_size)
+                    elapsed += time.perf_counter() - started
+                    if not rows:
+                        break
+                    row_count += len(rows)
+                    payload_bytes += estimate_payload_bytes(cursor.pgresult)
+                    yield from rows
+                    
+    except Exception as error:
+        failed = True
+        if budget:
+            budget.note_error(error)
+        logger.error(f"Error streaming query: {error}")
+        raise
+    finally:
+        query_metrics.record(query, elapsed * 1000, row_count, payload_bytes, failed, params)
+
+def execute_batch_queries(queries, row_format='dict', route='auto'):
+    """
+    Run several statements over one pooled connection in pipeline mode.
+    
+    ``queries`` is a list of ``(sql, params)`` pairs. All statements are
+    sent before any result is read, so the batch costs a single network
+    round trip instead of one per statement. Returns the result of each
+    statement in order (rows for reads, row counts otherwise); on error
+    every entry is None, as a failed statement aborts the rest of the
+    pipeline. Falls back to sequential execution on the same connection
+    when libpq lacks pipeline support.
+    """
+    budget = current_budget()
+    started = time.perf_counter()
+    results = [None] * len(queries)
+    failed = False
+    
+    try:
+        if not _ensure_pool():
+            failed = True
+            return results
+        
+        if route not in ROUTES:
+            raise ValueError(f"Unknown route: {route}")
+        if route == 'auto':
+            route = 'replica' if all(is_read_query(sql) for sql, _ in queries) else 'primary'
+        row_factory = _row_factory_for(row_format)
+        
+        with _checkout(route) as conn, tracked(budget, conn):
+            cursors = []
+            started = time.perf_counter()
+            
+            def send():
+                if budget:
+                    conn.execute(SET_STATEMENT_TIMEOUT_SQL, [str(budget.statement_timeout_ms())], prepare=False)
+                for sql, params in queries:
+                    cursor = conn.cursor(row_factory=row_factory)
+                    cursor.execute(sql, params, prepare=None if _is_preparable(sql) else False)
+                    cursors.append(cursor)
+            
+            if psycopg.Pipeline.is_supported():
+                # Results are all available once the pipeline block syncs
+                with conn.pipeline():
+                    send()
+            else:
+                send()
+            
+            for index, cursor in enumerate(cursors):
+                if cursor.description is not None:
+                    rows = cursor.fetchall()
+                    if row_format in COLUMNAR_FORMATS:
+                        rows = _to_columns(cursor.description, rows, row_format)
+                    results[index] = rows
+                else:
+                    results[index] = cursor.rowcount
+                cursor.close()
+        
+        return results
+    
+    except Exception as error:
+        failed = True
+        if budget:
+            budget.note_error(error)
+        logger.error(f"Error executing query batch: {error}")
+        return [None] * len(queries)
+    finally:
+        # Every statement shared the same round trip: record the batch latency for each
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for (sql, params), result in zip(queries, results):
+            rows = len(result) if isinstance(result, list) else 0
+            query_metrics.record(sql, elapsed_ms, rows, 0, failed, params)
+
+def _column_buffer(type_oid):
+    """Empty buffer for one column: ``array('d')`` for numerics, a list otherwise."""
+    return array('d') if type_oid in NUMERIC_TYPE_OIDS else []
+
+def copy_columns(query, params=None, row_format='columns', route='replica'):
+    """
+    Bulk-read a SELECT through ``COPY (...) TO STDOUT (FORMAT BINARY)``.
+    
+    Values are decoded from the binary COPY stream and appended straight
+    into per-column buffers, skipping the dict cursor, per-row dicts and
+    text parsing of ``execute_query``. The result has the same shape as
+    ``execute_query(..., row_format='columns'|'numpy')``: numeric columns
+    are ``array('d')`` (NumPy float64 for ``'numpy'``) with NULL as NaN,
+    other columns are lists. ``params`` are bound client-side since COPY
+    cannot take server-side parameters.
+    """
+    if row_format not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unsupported row_format for COPY: {row_format}")
+    if row_format == 'numpy' and not NUMPY_AVAILABLE:
+        raise ValueError("row_format='numpy' requires numpy to be installed")
+    
+    if not _ensure_pool():
+        raise RuntimeError("Database connection pool unavailable")
+    
+    budget = current_budget()
+    started = time.perf_counter()
+    row_count = 0
+    failed = False
+    
+    try:
+        with _checkout(route) as conn, tracked(budget, conn):
+            if budget:
+                conn.execute(SET_STATEMENT_TIMEOUT_SQL, [str(budget.statement_timeout_ms())], prepare=False)
+            
+            with conn.cursor() as cursor:
+                started = time.perf_counter()
+                
+                # Binary COPY needs the column types up front; a zero-row probe gives them
+                cursor.execute(f"SELECT * FROM ({query}) AS copy_probe LIMIT 0", params)
+                description = cursor.description
+                type_oids = [column.type_code for column in description]
+                buffers = [_column_buffer(oid) for oid in type_oids]
+                numeric = [oid in NUMERIC_TYPE_OIDS for oid in type_oids]
+                
+                with cursor.copy(f"COPY ({query}) TO STDOUT (FORMAT BINARY)", params) as copy:
+                    copy.set_types(type_oids)
+                    for row in copy.rows():
+                        row_count += 1
+                        for index, value in enumerate(row):
+                            if numeric[index]:
+                                buffers[index].append(math.nan if value is None else float(value))
+                            else:
+                                buffers[index].append(value)
+        
+        columns = {}
+        for column, buffer in zip(description, buffers):
+            if row_format == 'numpy' and isinstance(buffer, array):
+                columns[column.name] = np.frombuffer(buffer, dtype=np.float64)
+            else:
+                columns[column.name] = buffer
+        return columns
+    
+    except Exception as error:
+        failed = True
+        if budget:
+            budget.note_error(error)
+        logger.error(f"Error in COPY bulk read: {error}")
+        raise
+    finally:
+        query_metrics.record(query, (time.perf_counter() - started) * 1000, row_count, 0, failed, params)
+
+def _get_async_loop():
+    """Start (once per process) the background event loop that runs async queries."""
+    global _async_loop
+    
+    if _async_loop is None:
+        with _pool_lock:
+            if _async_loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='db-async-loop', daemon=True)
+                thread.start()
+                _async_loop = loop
+    return _async_loop
+
+async def init_async_connection_pool(route='primary'):
+    """Initialize the asyncio connection pool for ``route`` on the running event loop."""
+    global _async_pool_lock
+    
+    if _async_pool_lock is None:
+        _async_pool_lock = asyncio.Lock()
+    
+    async with _async_pool_lock:
+        if route in async_connection_pools:
+            return True
+        
+        DATABASE_URL = os.getenv('DATABASE_URL')
+        
+        if not DATABASE_URL:
+            logger.error("DATABASE_URL not found in environment variables")
+            return False
+        
+        if route == 'replica':
+            DATABASE_URL = os.getenv('DATABASE_READ_URL', DATABASE_URL)
+        
+        try:
+            pool = AsyncConnectionPool(
+                DATABASE_URL,
+                name=f'async-{route}',
+                kwargs=_pool_kwargs(),
+                check=AsyncConnectionPool.check_connection,
+                open=False,
+                **PoolConfig.pool_arguments()
+            )
+            await pool.open()
+            async_connection_pools[route] = pool
+            logger.info(f"Async {route} database connection pool created successfully")
+            return True
+        except Exception as error:
+            logger.error(f"Error creating async connection pool: {error}")
+            return False
+
+async def execute_query_async(query, params=None, prepare=None, row_format='dict', route='auto'):
+    """
+    Async counterpart of ``execute_query`` backed by ``AsyncConnectionPool``.
+    
+    The async pools are bound to the event loop that first creates them;
+    sync code should go through ``execute_queries_concurrently`` which
+    always uses the module's background loop.
+    """
+    budget = current_budget()
+    started = time.perf_counter()
+    row_count = payload_bytes = 0
+    failed = False
+    
+    try:
+        route = _resolve_route(query, route)
+        if route == 'replica' and not os.getenv('DATABASE_READ_URL'):
+            # No replica configured: share the primary async pool
+            route = 'primary'
+        
+        if route not in async_connection_pools and not await init_async_connection_pool(route):
+            failed = True
+            return None
+        
+        if not _is_preparable(query):
+            prepare = False
+        
+        async with async_connection_pools[route].connection() as conn:
+            with tracked(budget, conn):
+                async with conn.cursor(row_factory=_row_factory_for(row_format)) as cursor:
+                    started = time.perf_counter()
+                    if budget and psycopg.Pipeline.is_supported():
+                        timeout = [str(budget.statement_timeout_ms())]
+                        async with conn.pipeline():
+                            await conn.execute(SET_STATEMENT_TIMEOUT_SQL, timeout, prepare=False)
+                            await cursor.execute(query, params, prepare=prepare)
+                    elif budget:
+                        await conn.execute(SET_STATEMENT_TIMEOUT_SQL, [str(budget.statement_timeout_ms())], prepare=False)
+                        await cursor.execute(query, params, prepare=prepare)
+                    else:
+                        await cursor.execute(query, params, prepare=prepare)
+                    
+                    if cursor.description is not None:
+                        rows = await cursor.fetchall()
+                        row_count = len(rows)
+                        payload_bytes = estimate_payload_bytes(cursor.pgresult)
+                        if row_format in COLUMNAR_FORMATS:
+                            return _to_columns(cursor.description, rows, row_format)
+                        return rows
+                    else:
+                        await conn.commit()
+                        row_count = max(cursor.rowcount, 0)
+                        return cursor.rowcount
+                    
+    except Exception as error:
+        failed = True
+        if budget:
+            budget.note_error(error)
+        logger.error(f"Error executing async query: {error}")
+        return None
+    finally:
+        query_metrics.record(query, (time.perf_counter() - started) * 1000, row_count, payload_bytes, failed, params)
+
+async def gather_queries_async(queries, budget=None):
+    """Run ``(query, params)`` pairs concurrently, each on its own pooled connection."""
+    # Child tasks inherit the caller's request budget from this context
+    activate_budget(budget)
+    return await asyncio.gather(*(execute_query_async(query, params) for query, params in queries))
+
+async def gather_calls_async(calls, budget=None):
+    """Run blocking callables (e.g. cached query functions) concurrently in worker threads."""
+    # to_thread copies this task's context, so the threads' queries run under the caller's budget
+    activate_budget(budget)
+    return await asyncio.gather(*(asyncio.to_thread(call) for call in calls))
+
+def _wait_for(future, timeout, budget):
+    """Wait on a background-loop future, cancelling its queries if the caller gives up."""
+    if timeout is None and budget is not None:
+        timeout = budget.remaining_ms() / 1000.0
+    
+    try:
+        return future.result(timeout)
+    except TimeoutError:
+        future.cancel()
+        if budget:
+            budget.exceeded = True
+            budget.cancel_inflight()
+        raise
+    except BaseException:
+        future.cancel()
+        if budget:
+            budget.cancel_inflight()
+        raise
+
+def execute_queries_concurrently(queries, timeout=None):
+    """
+    Execute several independent queries at once from synchronous code.
+    
+    ``queries`` is a list of ``(query, params)`` tuples; results come back
+    in the same order, with ``None`` for any query that failed. Wall-clock
+    time is that of the slowest query rather than the sum of all of them.
+    """
+    budget = current_budget()
+    future = asyncio.run_coroutine_threadsafe(gather_queries_async(queries, budget), _get_async_loop())
+    return _wait_for(future, timeout, budget)
+
+def run_concurrently(*calls, timeout=None):
+    """Run zero-argument callables concurrently and return their results in order."""
+    budget = current_budget()
+    future = asyncio.run_coroutine_threadsafe(gather_calls_async(calls, budget), _get_async_loop())
+    return _wait_for(future, timeout, budget)
@@ -0,0 +1,147 @@
+"""
+Per-request query time budgets.
+A budget bounds every statement issued while it is active via a transaction-local
+Postgres statement_timeout, and cancels in-flight statements server-side when
+the request is abandoned.
+"""
+
+import time
+import logging
+import threading
+import contextvars
+from functools import wraps
+from contextlib import contextmanager
+from typing import Optional
+
+from psycopg import errors as pg_errors
+
+logger = logging.getLogger(__name__)
+
+# Applied inside the query's transaction so it resets on commit/rollback
+SET_STATEMENT_TIMEOUT_SQL = "SELECT set_config('statement_timeout', %s, true)"
+
+_current_budget = contextvars.ContextVar('query_budget', default=None)
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a statement would start after its request budget ran out"""
+
+class QueryBudget:
+    """Deadline shared by every statement of one request"""
+
+    def __init__(self, timeout_ms: int, name: str = None):
+        self.timeout_ms = timeout_ms
+        self.name = name or 'query'
+        self.deadline = time.monotonic() + timeout_ms / 1000.0
+        self.exceeded = False
+        self.connections = set()
+        self.lock = threading.Lock()
+
+    def remaining_ms(self) -> int:
+        """Milliseconds left before the deadline (never negative)"""
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+    def statement_timeout_ms(self) -> int:
+        """Timeout for the next statement; raises if the budget is already spent"""
+        remaining = self.remaining_ms()
+        if remaining <= 0:
+            self.exceeded = True
+            raise QueryBudgetExceeded(f"{self.name}: {self.timeout_ms}ms budget exhausted")
+        return remaining
+
+    def track(self, connection):
+        """Register a connection currently running one of our statements"""
+        with self.lock:
+            self.connections.add(connection)
+
+    def untrack(self, connection):
+        """Forget a connection once its statement is done"""
+        with self.lock:
+            self.connections.discard(connection)
+
+    def cancel_inflight(self):
+        """Ask the server to cancel every statement still running for this budget"""
+        with self.lock:
+            connections = list(self.connections)
+
+        for connection in connections:
+            try:
+                connection.cancel()
+                logger.warning(f"Cancelled in-flight query for {self.name}")
+            except Exception as e:
+                logger.error(f"Error cancelling query for {self.name}: {e}")
+
+    def note_error(self, error: Exception):
+        """Flag the budget as exceeded when ``error`` is a timeout"""
+        if isinstance(error, (pg_errors.QueryCanceled, QueryBudgetExceeded)):
+            self.exceeded = True
+
+def current_budget() -> Optional[QueryBudget]:
+    """The budget active in this context, if any"""
+    return _current_budget.get()
+
+def activate_budget(budget: Optional[QueryBudget]):
+    """Make ``budget`` current (used when handing work to another thread or loop)"""
+    return _current_budget.set(budget)
+
+@contextmanager
+def tracked(budget: Optional[QueryBudget], connection):
+    """Track ``connection`` on ``budget`` for the duration of the block"""
+    if budget is None:
+        yield
+        return
+
+    budget.track(connection)
+    try:
+        yield
+    finally:
+        budget.untrack(connection)
+
+@contextmanager
+def without_budget():
+    """Run the block outside any request budget (shared work that outlives the request)"""
+    token = _current_budget.set(None)
+    try:
+        yield
+    finally:
+        _current_budget.reset(token)
+
+@contextmanager
+def statement_budget(timeout_ms: int, name: str = None):
+    """
+    Bound every query issued inside the block to ``timeout_ms`` in total.
+
+    If the block is left by an exception (client disconnect, worker
+    timeout, request abort) any statement still running on behalf of it
+    is cancelled server-side instead of burning database CPU.
+    """
+    budget = QueryBudget(timeout_ms, name)
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    except BaseException:
+        budget.cancel_inflight()
+        raise
+    finally:
+        _current_budget.reset(token)
+
+def query_budget(timeout_ms: int):
+    """Decorator declaring the database latency budget of a Flask view"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            from flask import request, jsonify
+
+            with statement_budget(timeout_ms, name=request.endpoint) as budget:
+                response = func(*args, **kwargs)
+
+            if budget.exceeded:
+                logger.warning(f"Query budget of {timeout_ms}ms exceeded for {request.path}")
+                return jsonify({
+                    'error': 'Query time budget exceeded',
+                    'error_code': 'QUERY_TIMEOUT',
+                    'budget_ms': timeout_ms
+                }), 504
+
+            return response
+        return wrapper
+    return decorator
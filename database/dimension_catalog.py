@@ -0,0 +1,317 @@
+"""
+In-process dimension catalog.
+Keeps the distinct estados, grupos, sucursales, areas and periods of
+supervision_operativa_detalle (with branch and evaluation counts) in worker
+memory, so filter dropdowns and metadata endpoints never scan the fact table.
+The catalog refreshes itself from a cheap watermark check. Its first load
+runs in a background thread; until it completes, lookups query the detail
+table directly.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .connection_v3 import execute_query
+from .deadlines import without_budget
+from .periods import QUARTER_NAMES
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ('estado', 'grupo', 'sucursal', 'area')
+
+# Detail table column of each dimension
+DIMENSION_COLUMNS = {
+    'estado': 'estado',
+    'grupo': 'grupo_operativo',
+    'sucursal': 'sucursal_clean',
+    'area': 'area_evaluacion',
+}
+
+FACTS_QUERY = """
+    SELECT
+        sucursal_clean,
+        estado,
+        grupo_operativo,
+        area_evaluacion,
+        EXTRACT(YEAR FROM fecha_supervision)::int as year,
+        EXTRACT(QUARTER FROM fecha_supervision)::int as quarter,
+        COUNT(*) as evaluaciones
+    FROM supervision_operativa_detalle
+    WHERE fecha_supervision IS NOT NULL {delta}
+    GROUP BY 1, 2, 3, 4, 5, 6
+"""
+
+# Max date plus cumulative insert/update/delete counters; both are cheap to read.
+# Counters are summed over partitions once the table is partitioned.
+WATERMARK_QUERY = """
+    SELECT
+        (SELECT MAX(fecha_supervision) FROM supervision_operativa_detalle) as max_fecha,
+        COALESCE(SUM(s.n_tup_ins), 0) as inserts,
+        COALESCE(SUM(s.n_tup_upd + s.n_tup_del), 0) as changes,
+        COALESCE(SUM(s.n_live_tup), 0) as live_rows
+    FROM pg_stat_user_tables s
+    WHERE s.relid = to_regclass('supervision_operativa_detalle')
+       OR s.relid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass('supervision_operativa_detalle'))
+"""
+
+# Direct lookups served while the first load is still running
+COUNTS_QUERY = """
+    SELECT
+        {column} as value,
+        COUNT(DISTINCT NULLIF(sucursal_clean, '')) as sucursales,
+        COUNT(*) as evaluaciones
+    FROM supervision_operativa_detalle
+    WHERE fecha_supervision IS NOT NULL
+      AND {column} IS NOT NULL
+      AND {column} <> ''
+    GROUP BY {column}
+    ORDER BY {column}
+"""
+
+PERIODS_QUERY = """
+    SELECT
+        EXTRACT(YEAR FROM fecha_supervision)::int as year,
+        EXTRACT(QUARTER FROM fecha_supervision)::int as quarter,
+        COUNT(DISTINCT NULLIF(sucursal_clean, '')) as sucursales
+    FROM supervision_operativa_detalle
+    WHERE fecha_supervision IS NOT NULL
+    GROUP BY 1, 2
+    ORDER BY 1 DESC, 2 DESC
+"""
+
+SUCURSAL_INFO_QUERY = """
+    SELECT estado, grupo_operativo as grupo
+    FROM supervision_operativa_detalle
+    WHERE sucursal_clean = %s
+      AND fecha_supervision IS NOT NULL
+    LIMIT 1
+"""
+
+class DimensionCatalog:
+    """Distinct dimension values with counts, refreshed by watermark"""
+
+    # Seconds between watermark checks, and between forced full reloads
+    CHECK_INTERVAL = int(os.getenv('DIMENSION_CATALOG_CHECK_INTERVAL', 60))
+    FULL_RELOAD_INTERVAL = int(os.getenv('DIMENSION_CATALOG_FULL_RELOAD_INTERVAL', 21600))
+
+    def __init__(self):
+        self.facts = {}
+        self.snapshot = None
+        self.watermark = None
+        self.last_check = 0.0
+        self.last_full_load = 0.0
+        self.refresh_lock = threading.Lock()
+        self.stats = {'full_loads': 0, 'incremental_loads': 0, 'checks': 0, 'errors': 0}
+
+    def _fetch_watermark(self) -> Optional[Dict[str, Any]]:
+        rows = execute_query(WATERMARK_QUERY, route='primary')
+        return rows[0] if rows else None
+
+    def _fetch_facts(self, since=None) -> Dict[Tuple, int]:
+        delta = "AND fecha_supervision > %s" if since is not None else ""
+        rows = execute_query(FACTS_QUERY.format(delta=delta), [since] if since is not None else None,
+                             row_format='tuple', route='primary')
+        if rows is None:
+            raise RuntimeError("Dimension catalog query failed")
+        return {tuple(row[:-1]): row[-1] for row in rows}
+
+    def _build_snapshot(self, facts: Dict[Tuple, int]) -> Dict[str, Any]:
+        """Derive every dimension view from the fact counts"""
+        branches = {dimension: {} for dimension in DIMENSIONS}
+        evaluations = {dimension: {} for dimension in DIMENSIONS}
+        sucursal_info = {}
+        periods = {}
+
+        for (sucursal, estado, grupo, area, year, quarter), count in facts.items():
+            values = {'estado': estado, 'grupo': grupo, 'sucursal': sucursal, 'area': area}
+            for dimension, value in values.items():
+                if value is None or value == '':
+                    continue
+                branches[dimension].setdefault(value, set()).add(sucursal)
+                evaluations[dimension][value] = evaluations[dimension].get(value, 0) + count
+
+            if sucursal:
+                sucursal_info.setdefault(sucursal, {'estado': estado, 'grupo': grupo})
+            periods.setdefault((year, quarter), set()).add(sucursal)
+
+        views = {}
+        for dimension in DIMENSIONS:
+            views[dimension] = [
+                {
+                    'value': value,
+                    'sucursales': len({branch for branch in branches[dimension][value] if branch}),
+                    'evaluaciones': evaluations[dimension][value]
+                }
+                for value in sorted(branches[dimension])
+            ]
+
+        views['periodo'] = [
+            {
+                'year': year,
+                'quarter': QUARTER_NAMES[quarter],
+                'value': f"{QUARTER_NAMES[quarter]} {year}",
+                'sucursales': len({branch for branch in periods[(year, quarter)] if branch})
+            }
+            for year, quarter in sorted(periods, reverse=True)
+        ]
+        views['sucursal_info'] = sucursal_info
+        return views
+
+    def load(self):
+        """Full reload of the catalog"""
+        watermark = self._fetch_watermark()
+        facts = self._fetch_facts()
+        self.facts = facts
+        self.snapshot = self._build_snapshot(facts)
+        self.watermark = watermark
+        self.last_full_load = self.last_check = time.monotonic()
+        self.stats['full_loads'] += 1
+        logger.info(f"Dimension catalog loaded: {len(facts)} fact groups")
+
+    def refresh(self):
+        """
+        Bring the catalog up to date.
+
+        Pure appends of newer supervisions merge only the rows past the
+        previous max(fecha_supervision). Updates, deletes or back-dated
+        inserts trigger a full reload, as does a merge whose row count
+        differs from the insert counter's delta.
+        """
+        self.stats['checks'] += 1
+        self.last_check = time.monotonic()
+        previous = self.watermark
+
+        if previous is None or time.monotonic() - self.last_full_load >= self.FULL_RELOAD_INTERVAL:
+            self.load()
+            return
+
+        current = self._fetch_watermark()
+        if current is None:
+            return
+
+        if current['changes'] != previous['changes'] or current['inserts'] < previous['inserts']:
+            self.load()
+            return
+
+        if current['inserts'] == previous['inserts'] and current['max_fecha'] == previous['max_fecha']:
+            self.watermark = current
+            return
+
+        if previous['max_fecha'] is None or current['max_fecha'] is None or current['max_fecha'] <= previous['max_fecha']:
+            # New rows without a newer date: cannot be isolated by the watermark
+            self.load()
+            return
+
+        delta = self._fetch_facts(since=previous['max_fecha'])
+        inserted = current['inserts'] - previous['inserts']
+        if sum(delta.values()) != inserted:
+            # Some inserts landed at or before the previous max date, so the delta misses them
+            self.load()
+            return
+
+        facts = dict(self.facts)
+        for key, count in delta.items():
+            facts[key] = facts.get(key, 0) + count
+
+        self.facts = facts
+        self.snapshot = self._build_snapshot(facts)
+        self.watermark = current
+        self.stats['incremental_loads'] += 1
+        logger.info(f"Dimension catalog merged {len(delta)} new fact groups")
+
+    def start_loading(self) -> bool:
+        """Run the first load in a background thread unless a load or refresh is in progress"""
+        if not self.refresh_lock.acquire(blocking=False):
+            return False
+        threading.Thread(target=self._background_load, name='dimension-catalog-load', daemon=True).start()
+        return True
+
+    def _background_load(self):
+        try:
+            if self.snapshot is None:
+                self.load()
+        except Exception as e:
+            self.stats['errors'] += 1
+            self.last_check = time.monotonic()
+            logger.error(f"Dimension catalog load error: {e}")
+        finally:
+            self.refresh_lock.release()
+
+    def _current(self) -> Optional[Dict[str, Any]]:
+        """Snapshot to serve, refreshing it when due; None until the first load completes"""
+        if self.snapshot is None:
+            # Failed loads are retried after CHECK_INTERVAL
+            if time.monotonic() - self.last_check >= self.CHECK_INTERVAL:
+                self.start_loading()
+        elif time.monotonic() - self.last_check >= self.CHECK_INTERVAL:
+            # Only one thread refreshes; the rest keep serving the current snapshot
+            if self.refresh_lock.acquire(blocking=False):
+                try:
+                    with without_budget():
+                        self.refresh()
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    self.last_check = time.monotonic()
+                    logger.error(f"Dimension catalog refresh error: {e}")
+                finally:
+                    self.refresh_lock.release()
+        return self.snapshot
+
+    def values(self, dimension: str) -> List[str]:
+        """Sorted distinct values of ``dimension``"""
+        return [item['value'] for item in self.with_counts(dimension)]
+
+    def with_counts(self, dimension: str) -> List[Dict[str, Any]]:
+        """Distinct values of ``dimension`` with branch and evaluation counts, sorted by value"""
+        snapshot = self._current()
+        if snapshot is not None:
+            return list(snapshot[dimension])
+        return execute_query(COUNTS_QUERY.format(column=DIMENSION_COLUMNS[dimension])) or []
+
+    def periods(self) -> List[Dict[str, Any]]:
+        """Available quarters, newest first"""
+        snapshot = self._current()
+        if snapshot is not None:
+            return list(snapshot['periodo'])
+        return [
+            {
+                'year': row['year'],
+                'quarter': QUARTER_NAMES[row['quarter']],
+                'value': f"{QUARTER_NAMES[row['quarter']]} {row['year']}",
+                'sucursales': row['sucursales']
+            }
+            for row in execute_query(PERIODS_QUERY) or []
+        ]
+
+    def sucursal_info(self, sucursal: str) -> Optional[Dict[str, Any]]:
+        """Estado and grupo of a sucursal"""
+        snapshot = self._current()
+        if snapshot is not None:
+            return snapshot['sucursal_info'].get(sucursal)
+        rows = execute_query(SUCURSAL_INFO_QUERY, [sucursal])
+        return rows[0] if rows else None
+
+    def invalidate(self):
+        """Force a full reload on next access"""
+        self.watermark = None
+        self.last_check = 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Catalog state for monitoring"""
+        snapshot = self.snapshot or {}
+        return {
+            'loaded': self.snapshot is not None,
+            'fact_groups': len(self.facts),
+            'sizes': {dimension: len(snapshot.get(dimension, [])) for dimension in DIMENSIONS + ('periodo',)},
+            'watermark': {
+                'max_fecha': str(self.watermark['max_fecha']) if self.watermark else None,
+                'live_rows': self.watermark['live_rows'] if self.watermark else None
+            },
+            **self.stats
+        }
+
+# Global dimension catalog instance (one per worker process)
+dimension_catalog = DimensionCatalog()
@@ -0,0 +1,332 @@
+"""
+Workload-driven index advisor.
+Explains the heaviest captured read fingerprints with their sampled
+parameters, turns sequential scans over large tables into index candidates,
+and reads pg_stat_user_indexes to flag unused, unavailable and redundant
+indexes. Every suggestion carries an estimated benefit and write cost.
+"""
+
+import re
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from .connection_v3 import get_db_connection, return_db_connection
+from .query_metrics import query_metrics
+
+logger = logging.getLogger(__name__)
+
+# Fingerprints explained per run (heaviest by cumulative time first)
+WORKLOAD_SIZE = 30
+
+# Sequential scans of smaller tables are not worth an index
+MIN_TABLE_ROWS = 10000
+
+# Per-entry btree overhead used when sizing an index without hypopg
+INDEX_TUPLE_OVERHEAD_BYTES = 16
+
+# Comparisons a btree can serve, in a plan Filter string
+_COMPARISON_RE = re.compile(r'\(?\b([a-z_][a-z0-9_]*)\)?(?:::\w+)?\s*(=|>=|<=|>|<)\s')
+
+TABLE_STATS_SQL = """
+    SELECT
+        c.oid::regclass::text as table_name,
+        c.reltuples::bigint as rows,
+        COALESCE(s.n_tup_ins, 0) + COALESCE(s.n_tup_upd, 0) - COALESCE(s.n_tup_hot_upd, 0)
+            + COALESCE(s.n_tup_del, 0) as index_writes
+    FROM pg_class c
+    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+    WHERE c.relkind IN ('r', 'p')
+      AND c.relnamespace = 'public'::regnamespace
+"""
+
+INDEX_STATS_SQL = """
+    SELECT
+        s.indexrelname as index_name,
+        s.relname as table_name,
+        s.idx_scan as scans,
+        pg_relation_size(s.indexrelid) as size_bytes,
+        i.indisunique OR i.indisprimary as enforces_constraint,
+        i.indkey::int[] as key_columns,
+        i.indnkeyatts as key_count,
+        i.indpred IS NOT NULL as partial,
+        i.indexprs IS NOT NULL as expression,
+        am.amname as method,
+        pg_get_indexdef(s.indexrelid) as definition
+    FROM pg_stat_user_indexes s
+    JOIN pg_index i ON i.indexrelid = s.indexrelid
+    JOIN pg_class ic ON ic.oid = s.indexrelid
+    JOIN pg_am am ON am.oid = ic.relam
+"""
+
+COLUMN_WIDTHS_SQL = """
+    SELECT tablename as table_name, attname as column_name, avg_width
+    FROM pg_stats
+    WHERE schemaname = 'public'
+"""
+
+def _plan_nodes(plan: Dict[str, Any]):
+    """Every node of an EXPLAIN (FORMAT JSON) plan tree"""
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from _plan_nodes(child)
+
+def _fetch(conn, query, params=None) -> List[Dict[str, Any]]:
+    return conn.execute(query, params).fetchall()
+
+class IndexAdvisor:
+    """Index recommendations from the captured query workload"""
+
+    def __init__(self, configured_indexes: List[Dict[str, Any]]):
+        self.configured_indexes = configured_indexes
+        self.last_report = None
+
+    def _explain(self, conn, query: str, params) -> Optional[Dict[str, Any]]:
+        """Top plan node of ``query``, or None if it cannot be explained"""
+        try:
+            with conn.transaction():
+                row = conn.execute(f"EXPLAIN (FORMAT JSON) {query}", params).fetchone()
+            plan = row['QUERY PLAN']
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return plan[0]['Plan']
+        except Exception as e:
+            logger.debug(f"Index advisor could not explain query: {e}")
+            return None
+
+    def _scan_candidates(self, plan, tables, columns) -> List[Dict[str, Any]]:
+        """Index candidates for the sequential scans of large tables in ``plan``"""
+        candidates = []
+        for node in _plan_nodes(plan):
+            table = node.get('Relation Name')
+            if node.get('Node Type') != 'Seq Scan' or not node.get('Filter'):
+                continue
+            if tables.get(table, {}).get('rows', 0) < MIN_TABLE_ROWS:
+                continue
+
+            equality, ranges = [], []
+            for column, operator in _COMPARISON_RE.findall(node['Filter']):
+                if column not in columns.get(table, {}):
+                    continue
+                target = equality if operator == '=' else ranges
+                if column not in equality and column not in target:
+                    target.append(column)
+
+            # Equality columns lead; one range column can follow
+            key = equality + [column for column in ranges if column not in equality][:1]
+            if key:
+                candidates.append({
+                    'table': table,
+                    'columns': key,
+                    'scan_cost': node.get('Total Cost', 0),
+                    'scan_rows': node.get('Plan Rows', 0)
+                })
+        return candidates
+
+    def _covered(self, table, columns, indexes) -> Optional[str]:
+        """Name of an existing plain btree whose leading columns are ``columns``"""
+        for index in indexes:
+            if (index['table_name'] == table and index['method'] == 'btree'
+                    and not index['partial'] and not index['expression']
+                    and index['column_names'][:len(columns)] == columns):
+                return index['index_name']
+        return None
+
+    def _hypothetical_cost(self, conn, table, columns, query, params) -> Optional[Dict[str, Any]]:
+        """Plan cost of ``query`` and size of the index with a hypopg index on ``columns``"""
+        try:
+            with conn.transaction():
+                row = conn.execute(
+                    "SELECT indexrelid FROM hypopg_create_index(%s);",
+                    [f"CREATE INDEX ON {table} ({', '.join(columns)})"]
+                ).fetchone()
+                size = conn.execute("SELECT hypopg_relation_size(%s) as size;", [row['indexrelid']]).fetchone()['size']
+                plan = conn.execute(f"EXPLAIN (FORMAT JSON) {query}", params).fetchone()['QUERY PLAN']
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return {'cost': plan[0]['Plan']['Total Cost'], 'size_bytes': size}
+        except Exception as e:
+            logger.debug(f"Hypothetical index evaluation failed: {e}")
+            return None
+        finally:
+            # Hypothetical indexes live in the session, not the transaction
+            try:
+                conn.execute("SELECT hypopg_reset();")
+            except Exception:
+                pass
+
+    def _estimated_size(self, table, columns, tables, widths) -> int:
+        """Index size estimate from row count and column widths"""
+        width = sum(widths.get((table, column), 8) for column in columns) + INDEX_TUPLE_OVERHEAD_BYTES
+        return int(tables[table]['rows'] * width)
+
+    def _missing_indexes(self, conn, workload, tables, columns, indexes, widths, hypopg) -> Tuple[List[Dict[str, Any]], int]:
+        """Candidates from the workload with benefit aggregated across fingerprints, and the plans explained"""
+        suggestions = {}
+        plans = 0
+
+        for entry in workload:
+            stats = entry['stats']
+            for query, params in entry['samples']:
+                plan = self._explain(conn, query, params)
+                if plan is None:
+                    continue
+                plans += 1
+                total_cost = plan.get('Total Cost') or 1
+
+                for candidate in self._scan_candidates(plan, tables, columns):
+                    if self._covered(candidate['table'], candidate['columns'], indexes):
+                        continue
+
+                    hypothetical = self._hypothetical_cost(conn, candidate['table'], candidate['columns'], query, params) if hypopg else None
+                    if hypothetical:
+                        fraction = max(0.0, (total_cost - hypothetical['cost']) / total_cost)
+                        size = hypothetical['size_bytes']
+                    else:
+                        # Share of the plan spent in the scan, minus the rows an index still reads
+                        selectivity = candidate['scan_rows'] / max(tables[candidate['table']]['rows'], 1)
+                        fraction = min(1.0, candidate['scan_cost'] / total_cost) * max(0.0, 1 - selectivity)
+                        size = self._estimated_size(candidate['table'], candidate['columns'], tables, widths)
+
+                    key = (candidate['table'], tuple(candidate['columns']))
+                    suggestion = suggestions.setdefault(key, {
+                        'table': candidate['table'],
+                        'columns': candidate['columns'],
+                        'definition': f"CREATE INDEX CONCURRENTLY ON {candidate['table']} ({', '.join(candidate['columns'])})",
+                        'fingerprints': [],
+                        'benefit': {'estimated_ms_saved': 0.0, 'method': 'hypopg' if hypothetical else 'plan_heuristic'},
+                        'write_cost': {
+                            'estimated_size_bytes': size,
+                            'index_writes_since_stats_reset': tables[candidate['table']]['index_writes']
+                        }
+                    })
+                    if stats['fingerprint'] not in suggestion['fingerprints']:
+                        suggestion['fingerprints'].append(stats['fingerprint'])
+                        # Samples of one fingerprint are alternatives; count its time once
+                        suggestion['benefit']['estimated_ms_saved'] += stats['total_ms'] * fraction
+
+        ranked = sorted(suggestions.values(), key=lambda item: item['benefit']['estimated_ms_saved'], reverse=True)
+        for suggestion in ranked:
+            suggestion['benefit']['estimated_ms_saved'] = round(suggestion['benefit']['estimated_ms_saved'], 1)
+        return ranked, plans
+
+    def _unused_indexes(self, indexes, tables) -> List[Dict[str, Any]]:
+        """Indexes never scanned since the statistics were reset"""
+        return [
+            {
+                'index': index['index_name'],
+                'table': index['table_name'],
+                'definition': index['definition'],
+                'benefit': {'scans': 0},
+                'write_cost': {
+                    'size_bytes': index['size_bytes'],
+                    'index_writes_since_stats_reset': tables.get(index['table_name'], {}).get('index_writes')
+                }
+            }
+            for index in indexes
+            if index['scans'] == 0 and not index['enforces_constraint']
+        ]
+
+    def _unavailable_indexes(self, indexes, extensions) -> List[Dict[str, Any]]:
+        """Configured indexes that do not exist, with the extensions they still lack"""
+        existing = {index['index_name'] for index in indexes}
+        return [
+            {
+                'index': config['name'],
+                'table': config['table'],
+                'description': config.get('description'),
+                'missing_extensions': [name for name in config.get('requires', []) if name not in extensions]
+            }
+            for config in self.configured_indexes
+            if config['name'] not in existing
+        ]
+
+    def _redundant_indexes(self, indexes) -> List[Dict[str, Any]]:
+        """Configured and live indexes whose key is a leading prefix of another index"""
+        redundant = []
+
+        for config in self.configured_indexes:
+            for other in self.configured_indexes:
+                if (other is not config and other['table'] == config['table']
+                        and other.get('type', 'BTREE') == config.get('type', 'BTREE') == 'BTREE'
+                        and other['columns'][:len(config['columns'])] == config['columns']
+                        and len(other['columns']) > len(config['columns'])
+                        and set(config.get('include', [])) <= set(other['columns'] + other.get('include', []))
+                        and other.get('where') in (None, config.get('where'))):
+                    redundant.append({'index': config['name'], 'covered_by': other['name'], 'source': 'CRITICAL_INDEXES'})
+                    break
+
+        for index in indexes:
+            if index['enforces_constraint'] or index['partial'] or index['expression'] or index['method'] != 'btree':
+                continue
+            covering = self._covered(index['table_name'], index['column_names'], [
+                other for other in indexes
+                if other is not index and len(other['column_names']) > len(index['column_names'])
+                and set(index['include_names']) <= set(other['column_names'] + other['include_names'])
+            ])
+            if covering:
+                redundant.append({
+                    'index': index['index_name'],
+                    'covered_by': covering,
+                    'source': 'database',
+                    'write_cost': {'size_bytes': index['size_bytes']}
+                })
+
+        return redundant
+
+    def analyze(self) -> Dict[str, Any]:
+        """Run the advisor and keep the report in ``last_report``"""
+        conn = get_db_connection(route='primary')
+        if not conn:
+            return {'error': 'No database connection'}
+
+        try:
+            tables = {row['table_name']: row for row in _fetch(conn, TABLE_STATS_SQL)}
+            columns = {}
+            for row in _fetch(conn, "SELECT table_name, column_name FROM information_schema.columns WHERE table_schema = 'public';"):
+                columns.setdefault(row['table_name'], set()).add(row['column_name'])
+            widths = {(row['table_name'], row['column_name']): row['avg_width'] for row in _fetch(conn, COLUMN_WIDTHS_SQL)}
+
+            # Name key columns so indexes can be compared by column list
+            attnames = {}
+            for row in _fetch(conn, "SELECT attrelid::regclass::text as table_name, attnum, attname FROM pg_attribute WHERE attnum > 0 AND NOT attisdropped AND attrelid = ANY(SELECT relid FROM pg_stat_user_tables);"):
+                attnames[(row['table_name'], row['attnum'])] = row['attname']
+            indexes = _fetch(conn, INDEX_STATS_SQL)
+            for index in indexes:
+                names = [attnames.get((index['table_name'], number)) for number in index['key_columns']]
+                index['column_names'], index['include_names'] = names[:index['key_count']], names[index['key_count']:]
+
+            extensions = {row['extname'] for row in _fetch(conn, "SELECT extname FROM pg_extension;")}
+            hypopg = 'hypopg' in extensions
+
+            workload = query_metrics.workload(WORKLOAD_SIZE)
+            missing, plans = self._missing_indexes(conn, workload, tables, columns, indexes, widths, hypopg)
+            stats_reset = _fetch(conn, "SELECT stats_reset FROM pg_stat_database WHERE datname = current_database();")
+
+            report = {
+                'generated_at': datetime.now(timezone.utc).isoformat(),
+                'workload': {
+                    'fingerprints': len(workload),
+                    'plans_explained': plans,
+                    'collecting_since': query_metrics.get_summary()['collecting_since'],
+                    'hypothetical_indexes': hypopg
+                },
+                'stats_reset': str(stats_reset[0]['stats_reset']) if stats_reset else None,
+                'missing': missing,
+                'unused': self._unused_indexes(indexes, tables),
+                'unavailable': self._unavailable_indexes(indexes, extensions),
+                'redundant': self._redundant_indexes(indexes)
+            }
+            self.last_report = report
+            logger.info(
+                f"Index advisor: {len(report['missing'])} missing, {len(report['unused'])} unused, "
+                f"{len(report['unavailable'])} unavailable, {len(report['redundant'])} redundant"
+            )
+            return report
+
+        except Exception as e:
+            logger.error(f"Index advisor error: {e}")
+            return {'error': str(e)}
+        finally:
+            return_db_connection(conn)
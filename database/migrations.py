@@ -0,0 +1,283 @@
+"""
+Schema and optimization migrations.
+Indexes, materialized views and rollup tables are applied by an explicit
+runner (``python -m database.migrations`` or ``flask init-db``) instead of
+every worker at boot. Runs are serialized across processes with a Postgres
+advisory lock, and each applied step is recorded with a checksum of its
+definition so unchanged steps are skipped and changed ones re-applied.
+"""
+
+import os
+import sys
+import time
+import hashlib
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+import psycopg
+from psycopg.rows import dict_row
+
+from . import partitioning
+from .optimization import db_optimizer, DatabaseOptimizer, MV_REFRESH_STATE_SQL
+from .plan_tracker import PLAN_HISTORY_SQL
+from .scheduler import SCHEDULER_RUNS_SQL
+from .rollups import (GRANULARITIES, ROLLUP_TABLE_SQL, WATERMARK_TABLE_SQL, WATERMARK_COUNTERS_SQL, WATERMARK_NAME,
+                      GEO_TABLE_SQL, GEO_WATERMARK_NAME)
+
+logger = logging.getLogger(__name__)
+
+# Advisory lock key shared by every process running migrations
+MIGRATION_LOCK_ID = int(os.getenv('DB_MIGRATION_LOCK_ID', 720351))
+
+# Fail DDL fast instead of queueing behind (and blocking) dashboard reads
+MIGRATION_LOCK_TIMEOUT = os.getenv('DB_MIGRATION_LOCK_TIMEOUT', '10s')
+
+@contextmanager
+def _migration_connection():
+    """
+    Dedicated autocommit session for a migration run.
+
+    The advisory lock, session settings and unlock must all reach the same
+    backend, which a transaction-pooled DATABASE_URL (PgBouncer, the Neon
+    pooler) does not guarantee, so migrations use a direct connection
+    (MIGRATIONS_DATABASE_URL, defaulting to DATABASE_URL).
+    """
+    conninfo = os.getenv('MIGRATIONS_DATABASE_URL') or os.getenv('DATABASE_URL')
+    conn = psycopg.connect(conninfo, autocommit=True, row_factory=dict_row, application_name='migrations')
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+MIGRATIONS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        name TEXT PRIMARY KEY,
+        checksum TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        duration_ms NUMERIC
+    );
+"""
+
+RECORD_SQL = """
+    INSERT INTO schema_migrations (name, checksum, applied_at, duration_ms)
+    VALUES (%s, %s, NOW(), %s)
+    ON CONFLICT (name) DO UPDATE SET
+        checksum = EXCLUDED.checksum,
+        applied_at = EXCLUDED.applied_at,
+        duration_ms = EXCLUDED.duration_ms;
+"""
+
+def _checksum(*parts) -> str:
+    definition = ' '.join(' '.join(str(part).split()) for part in parts)
+    return hashlib.md5(definition.encode()).hexdigest()
+
+def _statements_step(name: str, statements: List[str], transactional: bool = True) -> Dict[str, Any]:
+    def apply(conn):
+        for sql in statements:
+            conn.execute(sql)
+    return {'name': name, 'checksum': _checksum(*statements), 'transactional': transactional, 'apply': apply}
+
+def _index_step(index_config: Dict[str, Any]) -> Dict[str, Any]:
+    sql = db_optimizer.index_sql(index_config)
+    name = index_config['name']
+
+    def apply(conn):
+        if index_config['table'] == partitioning.PARENT_TABLE and partitioning.is_partitioned(conn):
+            partitioning.partition_indexes(conn, name, db_optimizer.index_definition(index_config))
+            return
+
+        # A failed concurrent build leaves an INVALID index that IF NOT EXISTS would keep
+        row = conn.execute(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = %s;",
+            [name]
+        ).fetchone()
+        if row and not row['indisvalid']:
+            conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+        conn.execute(sql)
+
+    return {
+        'name': f"index:{name}",
+        'checksum': _checksum(sql),
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        'transactional': False,
+        'requires': index_config.get('requires', []),
+        'apply': apply
+    }
+
+def _retire_index_step(name: str) -> Dict[str, Any]:
+    def apply(conn):
+        # After partitioning, the legacy table keeps its copy under the child index name
+        for index_name in (name, partitioning._child_index_name(name, partitioning.LEGACY_TABLE)):
+            row = conn.execute("SELECT relkind FROM pg_class WHERE relname = %s;", [index_name]).fetchone()
+            if row is None:
+                continue
+            # A partitioned index (and its partitions' indexes) cannot be dropped concurrently
+            concurrently = '' if row['relkind'] == 'I' else 'CONCURRENTLY '
+            conn.execute(f"DROP INDEX {concurrently}IF EXISTS {index_name};")
+
+    return {'name': f"retire_index:{name}", 'checksum': _checksum('DROP INDEX', name), 'transactional': False, 'apply': apply}
+
+def _view_step(view_config: Dict[str, Any]) -> Dict[str, Any]:
+    name = view_config['name']
+    version = db_optimizer._definition_version(view_config)
+    staging = f"{name}__new"
+
+    def apply(conn):
+        current = conn.execute(
+            "SELECT obj_description(to_regclass(%s), 'pg_class') as version;", [name]
+        ).fetchone()['version']
+        if current == version:
+            return
+
+        # Build under a staging name so readers keep the old view until the swap
+        conn.execute(f"DROP MATERIALIZED VIEW IF EXISTS {staging};")
+        for sql in db_optimizer.materialized_view_statements({**view_config, 'name': staging}):
+            conn.execute(sql)
+        with conn.transaction():
+            conn.execute(f"DROP MATERIALIZED VIEW IF EXISTS {name};")
+            conn.execute(f"ALTER MATERIALIZED VIEW {staging} RENAME TO {name};")
+
+    return {'name': f"view:{name}", 'checksum': version, 'transactional': False, 'apply': apply}
+
+def migration_steps() -> List[Dict[str, Any]]:
+    """Every migration step, in application order"""
+    steps = [
+        _statements_step('rollup_tables', [
+            *(ROLLUP_TABLE_SQL.format(grain=grain) for grain in GRANULARITIES),
+            WATERMARK_TABLE_SQL,
+            f"INSERT INTO rollup_watermarks (name) VALUES ('{WATERMARK_NAME}') ON CONFLICT (name) DO NOTHING;"
+        ]),
+        _statements_step('geo_rollup', [
+            GEO_TABLE_SQL,
+            "CREATE INDEX IF NOT EXISTS idx_rollup_geo_estado ON rollup_geo_sucursal (estado, year, quarter);",
+            f"INSERT INTO rollup_watermarks (name) VALUES ('{GEO_WATERMARK_NAME}') ON CONFLICT (name) DO NOTHING;",
+            # Replaced by rollup_geo_sucursal
+            "DROP MATERIALIZED VIEW IF EXISTS mv_geo_summary;"
+        ]),
+        # Existing watermarks have no counters yet, so their next fold recomputes the rollups
+        _statements_step('rollup_watermark_counters', [WATERMARK_COUNTERS_SQL]),
+        _statements_step('plan_history', [PLAN_HISTORY_SQL]),
+        _statements_step('scheduler_runs', [SCHEDULER_RUNS_SQL]),
+        _statements_step('mv_refresh_state', [MV_REFRESH_STATE_SQL])
+    ]
+    steps.extend(_index_step(index_config) for index_config in DatabaseOptimizer.CRITICAL_INDEXES)
+    steps.extend(_retire_index_step(name) for name in DatabaseOptimizer.RETIRED_INDEXES)
+    steps.extend(_view_step(view_config) for view_config in DatabaseOptimizer.MATERIALIZED_VIEWS)
+    return steps
+
+def _lock(conn, wait: bool) -> bool:
+    if wait:
+        conn.execute("SELECT pg_advisory_lock(%s);", [MIGRATION_LOCK_ID])
+    elif not conn.execute("SELECT pg_try_advisory_lock(%s) as acquired;", [MIGRATION_LOCK_ID]).fetchone()['acquired']:
+        logger.info("Migrations already running in another process")
+        return False
+
+    conn.execute("SET statement_timeout = 0;")
+    conn.execute("SELECT set_config('lock_timeout', %s, false);", [MIGRATION_LOCK_TIMEOUT])
+    conn.execute(MIGRATIONS_TABLE_SQL)
+    return True
+
+def _unlock(conn):
+    conn.execute("RESET statement_timeout;")
+    conn.execute("RESET lock_timeout;")
+    conn.execute("SELECT pg_advisory_unlock(%s);", [MIGRATION_LOCK_ID])
+
+def _apply_steps(conn, results: Dict[str, Any]):
+    applied = {row['name']: row['checksum'] for row in conn.execute("SELECT name, checksum FROM schema_migrations;").fetchall()}
+    extensions = {row['extname'] for row in conn.execute("SELECT extname FROM pg_extension;").fetchall()}
+
+    for step in migration_steps():
+        if applied.get(step['name']) == step['checksum']:
+            results['up_to_date'] += 1
+            continue
+
+        missing = [extension for extension in step.get('requires', []) if extension not in extensions]
+        if missing:
+            results['skipped'].append({'name': step['name'], 'missing_extensions': missing})
+            continue
+
+        started = time.perf_counter()
+        try:
+            if step['transactional']:
+                with conn.transaction():
+                    step['apply'](conn)
+                    conn.execute(RECORD_SQL, [step['name'], step['checksum'], round((time.perf_counter() - started) * 1000, 1)])
+            else:
+                step['apply'](conn)
+                conn.execute(RECORD_SQL, [step['name'], step['checksum'], round((time.perf_counter() - started) * 1000, 1)])
+
+            results['applied'].append(step['name'])
+            logger.info(f"Applied migration {step['name']} in {(time.perf_counter() - started):.1f}s")
+
+        except Exception as e:
+            logger.error(f"Migration {step['name']} failed: {e}")
+            results['errors'].append({'name': step['name'], 'error': str(e)})
+            break
+
+def run_migrations(wait: bool = True) -> Dict[str, Any]:
+    """
+    Apply pending migration steps.
+
+    With ``wait=False`` the call returns immediately (``locked: True``) if
+    another process holds the migration lock. Stops at the first failing
+    step since later steps may depend on it.
+    """
+    results = {'applied': [], 'up_to_date': 0, 'skipped': [], 'errors': [], 'locked': False}
+
+    with _migration_connection() as conn:
+        if not _lock(conn, wait):
+            results['locked'] = True
+            return results
+
+        try:
+            _apply_steps(conn, results)
+        finally:
+            _unlock(conn)
+
+    return results
+
+def run_partitioning(move_history: bool = True, limit: int = None) -> Dict[str, Any]:
+    """
+    Convert supervision_operativa_detalle to quarterly partitions, then re-apply migrations.
+
+    Holds the migration lock throughout. The materialized views keep
+    reading the renamed legacy table after the swap, so their versions and
+    the index records are cleared and rebuilt against the partitioned
+    parent by the migration run that follows.
+    """
+    results = {'partitioning': None, 'history': None, 'applied': [], 'up_to_date': 0, 'skipped': [], 'errors': [], 'locked': False}
+    views = [view_config['name'] for view_config in DatabaseOptimizer.MATERIALIZED_VIEWS]
+
+    with _migration_connection() as conn:
+        if not _lock(conn, wait=True):
+            results['locked'] = True
+            return results
+
+        try:
+            results['partitioning'] = partitioning.convert(conn, allowed_views=views)
+            if results['partitioning']['converted']:
+                with conn.transaction():
+                    for name in views:
+                        if conn.execute("SELECT to_regclass(%s) as oid;", [name]).fetchone()['oid'] is not None:
+                            conn.execute(f"COMMENT ON MATERIALIZED VIEW {name} IS NULL;")
+                    conn.execute("DELETE FROM schema_migrations WHERE name LIKE 'index:%' OR name LIKE 'view:%';")
+
+            if move_history:
+                results['history'] = partitioning.migrate_history(conn, limit=limit)
+
+            _apply_steps(conn, results)
+
+        except Exception as e:
+            logger.error(f"Partitioning failed: {e}")
+            results['errors'].append({'name': 'partitioning', 'error': str(e)})
+        finally:
+            _unlock(conn)
+
+    return results
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    outcome = run_migrations(wait=True)
+    print(outcome)
+    sys.exit(1 if outcome['errors'] else 0)
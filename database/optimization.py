@@ -3,47 +3,83 @@ Database optimization module with indexes, materialized views, and query optimiz
 """
 
 import os
+import time
+import hashlib
 import logging
+from collections import deque
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timezone
 
-from .connection_v3 import execute_query
+from .connection_v3 import execute_query, execute_autocommit, autocommit_connection
+from . import partitioning
+from .periods import parse_quarter, period_conditions, period_filter, resolve_period
+from .rollups import time_rollups, geo_rollup, bucket_start, GRANULARITIES, FRESHNESS_CHECK_INTERVAL
+from .index_advisor import IndexAdvisor
 from cache.cache_manager import cached_query, cache_manager
 
 logger = logging.getLogger(__name__)
 
+# Writes to a view's source table (per pg_stat_user_tables) below which a scheduled refresh is skipped
+MV_REFRESH_MIN_CHANGES = int(os.getenv('MV_REFRESH_MIN_CHANGES', 1))
+
+MV_REFRESH_STATE_SQL = """
+    CREATE TABLE IF NOT EXISTS mv_refresh_state (
+        name TEXT PRIMARY KEY,
+        changes BIGINT NOT NULL,
+        max_fecha TIMESTAMP,
+        refreshed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        duration_ms NUMERIC
+    );
+"""
+
+# Cumulative inserts/updates/deletes on a table and its partitions, plus its latest supervision date
+SOURCE_CHANGES_SQL = """
+    SELECT
+        (SELECT COALESCE(SUM(s.n_tup_ins + s.n_tup_upd + s.n_tup_del), 0)::bigint
+         FROM pg_stat_user_tables s
+         WHERE s.relid = %(source)s::regclass
+            OR s.relid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = %(source)s::regclass)) as changes,
+        (SELECT MAX(fecha_supervision) FROM {source}) as max_fecha;
+"""
+
+# Cached functions and endpoints serving the time/geo rollups (directly or through the aggregate router)
+ROLLUP_CACHE_SCOPES = [
+    'get_performance_trends',
+    'get_optimized_coordinates',
+    'analytics.get_states_performance',
+    'analytics.get_groups_performance',
+    'analytics.get_performance_trends',
+    'analytics.get_analytics_summary',
+    'geo.get_coordinates',
+    'geo.get_states_geo_data',
+    'legacy_coordinates',
+]
+
 class DatabaseOptimizer:
     """Database optimization utilities"""
     
     # Critical indexes for performance improvement
     CRITICAL_INDEXES = [
         {
-            'name': 'idx_supervision_porcentaje_fecha',
+            'name': 'idx_supervision_keyset',
             'table': 'supervision_operativa_detalle',
-            'columns': ['porcentaje', 'fecha_supervision'],
-            'where': 'porcentaje IS NOT NULL AND fecha_supervision IS NOT NULL',
-            'description': 'Primary performance index for KPI queries'
-        },
-        {
-            'name': 'idx_supervision_sucursal_fecha',
-            'table': 'supervision_operativa_detalle', 
-            'columns': ['sucursal_clean', 'fecha_supervision'],
-            'where': None,
-            'description': 'Index for branch-specific queries'
+            'columns': ['fecha_supervision', 'submission_id', 'area_evaluacion'],
+            'where': 'porcentaje IS NOT NULL',
+            'description': 'Period range filters and keyset pagination of detail listings'
         },
         {
-            'name': 'idx_supervision_estado_grupo',
+            'name': 'idx_supervision_fecha',
             'table': 'supervision_operativa_detalle',
-            'columns': ['estado', 'grupo_operativo'],
+            'columns': ['fecha_supervision'],
             'where': None,
-            'description': 'Index for state and group filtering'
+            'description': 'MAX(fecha_supervision) watermarks and delta row counts, which have no porcentaje filter'
         },
         {
             'name': 'idx_supervision_quarter',
             'table': 'supervision_operativa_detalle',
             'columns': ['(EXTRACT(QUARTER FROM fecha_supervision))'],
             'where': None,
-            'description': 'Index for quarter-based filtering'
+            'description': 'Index for quarter filters spanning every year'
         },
         {
             'name': 'idx_supervision_geo',
@@ -51,7 +87,8 @@ class DatabaseOptimizer:
             'columns': ['(ll_to_earth(latitud, longitud))'],
             'where': 'latitud IS NOT NULL AND longitud IS NOT NULL',
             'description': 'Geospatial index for map queries',
-            'type': 'GIST'
+            'type': 'GIST',
+            'requires': ['cube', 'earthdistance']
         },
         {
             'name': 'idx_supervision_complex_filter',
@@ -59,87 +96,84 @@ class DatabaseOptimizer:
             'columns': ['estado', 'grupo_operativo', 'area_evaluacion', 'fecha_supervision'],
             'where': 'porcentaje IS NOT NULL',
             'description': 'Composite index for complex filtering'
+        },
+        {
+            'name': 'idx_supervision_kpi_covering',
+            'table': 'supervision_operativa_detalle',
+            'columns': ['estado', 'grupo_operativo', 'fecha_supervision'],
+            'include': ['porcentaje', 'submission_id', 'sucursal_clean', 'area_evaluacion'],
+            'where': 'porcentaje IS NOT NULL',
+            'description': 'Index-only KPI, estado/grupo/area ranking and trend aggregates on the detail table'
+        },
+        {
+            'name': 'idx_supervision_sucursal_covering',
+            'table': 'supervision_operativa_detalle',
+            'columns': ['sucursal_clean', 'fecha_supervision'],
+            'include': ['porcentaje', 'submission_id', 'grupo_operativo', 'area_evaluacion'],
+            'where': 'porcentaje IS NOT NULL',
+            'description': 'Index-only sucursal rankings and per-sucursal metric listings'
+        },
+        {
+            'name': 'idx_supervision_fecha_brin',
+            'table': 'supervision_operativa_detalle',
+            'columns': ['fecha_supervision'],
+            'where': None,
+            'type': 'BRIN',
+            'with': {'pages_per_range': 32},
+            'description': 'Block ranges of the append-ordered date for period scans and rollup/catalog deltas'
         }
     ]
     
+    # Indexes dropped by the migration runner. The queries that used their
+    # prefixes all carry ``porcentaje IS NOT NULL``, so the partial covering
+    # indexes replace them, and no query filters on a porcentaje range.
+    RETIRED_INDEXES = [
+        'idx_supervision_porcentaje_fecha',  # date ranges: idx_supervision_keyset / idx_supervision_fecha
+        'idx_supervision_sucursal_fecha',    # prefix of idx_supervision_sucursal_covering
+        'idx_supervision_estado_grupo',      # prefix of idx_supervision_kpi_covering
+    ]
+    
     # Materialized views for performance
     MATERIALIZED_VIEWS = [
         {
             'name': 'mv_kpi_summary',
+            # Mergeable state only: any set of groups combines exactly.
+            # A submission belongs to a single sucursal and date, so its
+            # distinct count per group can be summed across groups.
             'query': """
                 SELECT 
-                    EXTRACT(QUARTER FROM fecha_supervision) as quarter,
-                    EXTRACT(YEAR FROM fecha_supervision) as year,
+                    EXTRACT(QUARTER FROM fecha_supervision)::int as quarter,
+                    EXTRACT(YEAR FROM fecha_supervision)::int as year,
                     estado,
                     grupo_operativo,
-                    COUNT(*) as total_supervisiones,
-                    AVG(CAST(porcentaje AS NUMERIC)) as promedio,
-                    COUNT(DISTINCT sucursal_clean) as total_sucursales,
+                    COUNT(*) as evaluaciones,
+                    COUNT(DISTINCT submission_id) as total_supervisiones,
+                    SUM(CAST(porcentaje AS NUMERIC)) as suma,
+                    SUM(CAST(porcentaje AS NUMERIC) * CAST(porcentaje AS NUMERIC)) as suma_cuadrados,
                     MIN(CAST(porcentaje AS NUMERIC)) as minimo,
                     MAX(CAST(porcentaje AS NUMERIC)) as maximo,
-                    STDDEV(CAST(porcentaje AS NUMERIC)) as desviacion_estandar
+                    ARRAY_AGG(DISTINCT sucursal_clean) FILTER (WHERE sucursal_clean IS NOT NULL) as sucursales
                 FROM supervision_operativa_detalle
                 WHERE porcentaje IS NOT NULL 
                   AND fecha_supervision IS NOT NULL
-                GROUP BY quarter, year, estado, grupo_operativo
+                GROUP BY 1, 2, estado, grupo_operativo
             """,
             'unique_index': ['quarter', 'year', 'estado', 'grupo_operativo'],
+            'source': 'supervision_operativa_detalle',
+            # Cached functions and endpoints invalidated after a refresh
+            'cache_scopes': [
+                'get_optimized_kpis',
+                'analytics.get_kpis',
+                'analytics.get_states_performance',
+                'analytics.get_groups_performance',
+                'analytics.get_analytics_summary',
+                'geo.get_states_geo_data',
+                'legacy_kpis',
+            ],
             'description': 'Pre-aggregated KPI data for fast queries'
-        },
-        {
-            'name': 'mv_geo_summary',
-            'query': """
-                SELECT DISTINCT ON (sucursal_clean)
-                    sucursal_clean,
-                    estado,
-                    municipio,
-                    latitud,
-                    longitud,
-                    AVG(CAST(porcentaje AS NUMERIC)) OVER (PARTITION BY sucursal_clean) as promedio_porcentaje,
-                    COUNT(*) OVER (PARTITION BY sucursal_clean) as total_supervisiones,
-                    MAX(fecha_supervision) OVER (PARTITION BY sucursal_clean) as ultima_supervision
-                FROM supervision_operativa_detalle
-                WHERE latitud IS NOT NULL 
-                  AND longitud IS NOT NULL 
-                  AND porcentaje IS NOT NULL
-                ORDER BY sucursal_clean, fecha_supervision DESC
-            """,
-            'unique_index': ['sucursal_clean'],
-            'description': 'Geographic data with performance metrics'
         }
     ]
     
-    def create_indexes(self) -> Dict[str, Any]:
-        """Create all critical indexes"""
-        results = {
-            'created': [],
-            'skipped': [],
-            'errors': []
-        }
-        
-        logger.info("Starting database index creation...")
-        
-        for index_config in self.CRITICAL_INDEXES:
-            try:
-                if self._index_exists(index_config['name']):
-                    results['skipped'].append(index_config['name'])
-                    logger.info(f"Index {index_config['name']} already exists")
-                    continue
-                
-                success = self._create_index(index_config)
-                if success:
-                    results['created'].append(index_config['name'])
-                    logger.info(f"Created index: {index_config['name']}")
-                else:
-                    results['errors'].append(index_config['name'])
-                
-            except Exception as e:
-                logger.error(f"Error creating index {index_config['name']}: {e}")
-                results['errors'].append(index_config['name'])
-        
-        logger.info(f"Index creation completed: {len(results['created'])} created, {len(results['skipped'])} skipped, {len(results['errors'])} errors")
-        return results
-    
     def _index_exists(self, index_name: str) -> bool:
         """Check if index exists"""
         query = """
@@ -148,65 +182,34 @@ class DatabaseOptimizer:
                 WHERE indexname = %s
             );
         """
-        result = execute_query(query, [index_name])
+        # Read the primary's catalog: a lagging replica may not see a fresh index yet
+        result = execute_query(query, [index_name], route='primary')
         return result[0]['exists'] if result else False
     
-    def _create_index(self, index_config: Dict[str, Any]) -> bool:
-        """Create a single index"""
-        try:
-            # Build CREATE INDEX statement
-            index_type = index_config.get('type', 'BTREE')
-            columns_str = ', '.join(index_config['columns'])
-            
-            sql = f"CREATE INDEX CONCURRENTLY {index_config['name']} ON {index_config['table']}"
-            
-            if index_type != 'BTREE':
-                sql += f" USING {index_type}"
-            
-            sql += f" ({columns_str})"
-            
-            if index_config.get('where'):
-                sql += f" WHERE {index_config['where']}"
-            
-            sql += ";"
-            
-            logger.debug(f"Creating index with SQL: {sql}")
-            execute_query(sql)
-            return True
-            
-        except Exception as e:
-            logger.error(f"Failed to create index {index_config['name']}: {e}")
-            return False
-    
-    def create_materialized_views(self) -> Dict[str, Any]:
-        """Create materialized views for performance"""
-        results = {
-            'created': [],
-            'skipped': [],
-            'errors': []
-        }
+    def index_definition(self, index_config: Dict[str, Any]) -> str:
+        """Access method, key and INCLUDE columns, storage parameters and predicate of an index"""
+        index_type = index_config.get('type', 'BTREE')
+        columns_str = ', '.join(index_config['columns'])
         
-        logger.info("Starting materialized view creation...")
+        sql = f"({columns_str})" if index_type == 'BTREE' else f"USING {index_type} ({columns_str})"
         
-        for view_config in self.MATERIALIZED_VIEWS:
-            try:
-                if self._materialized_view_exists(view_config['name']):
-                    results['skipped'].append(view_config['name'])
-                    logger.info(f"Materialized view {view_config['name']} already exists")
-                    continue
-                
-                success = self._create_materialized_view(view_config)
-                if success:
-                    results['created'].append(view_config['name'])
-                    logger.info(f"Created materialized view: {view_config['name']}")
-                else:
-                    results['errors'].append(view_config['name'])
-                
-            except Exception as e:
-                logger.error(f"Error creating materialized view {view_config['name']}: {e}")
-                results['errors'].append(view_config['name'])
+        if index_config.get('include'):
+            sql += f" INCLUDE ({', '.join(index_config['include'])})"
         
-        return results
+        if index_config.get('with'):
+            sql += f" WITH ({', '.join(f'{key} = {value}' for key, value in index_config['with'].items())})"
+        
+        if index_config.get('where'):
+            sql += f" WHERE {index_config['where']}"
+        
+        return sql
+    
+    def index_sql(self, index_config: Dict[str, Any]) -> str:
+        """CREATE INDEX CONCURRENTLY statement for an index definition"""
+        return (
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_config['name']} "
+            f"ON {index_config['table']} {self.index_definition(index_config)};"
+        )
     
     def _materialized_view_exists(self, view_name: str) -> bool:
         """Check if materialized view exists"""
@@ -216,47 +219,106 @@ class DatabaseOptimizer:
                 WHERE matviewname = %s
             );
         """
-        result = execute_query(query, [view_name])
+        result = execute_query(query, [view_name], route='primary')
         return result[0]['exists'] if result else False
     
-    def _create_materialized_view(self, view_config: Dict[str, Any]) -> bool:
-        """Create a materialized view"""
-        try:
-            # Create materialized view
-            sql = f"CREATE MATERIALIZED VIEW {view_config['name']} AS {view_config['query']};"
-            execute_query(sql)
-            
-            # Create unique index if specified
-            if view_config.get('unique_index'):
-                columns = ', '.join(view_config['unique_index'])
-                index_sql = f"CREATE UNIQUE INDEX ON {view_config['name']} ({columns});"
-                execute_query(index_sql)
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Failed to create materialized view {view_config['name']}: {e}")
-            return False
+    def _definition_version(self, view_config: Dict[str, Any]) -> str:
+        """Hash of a view definition, stored as the view comment"""
+        definition = ' '.join(view_config['query'].split())
+        return hashlib.md5(definition.encode()).hexdigest()
+    
+    def materialized_view_statements(self, view_config: Dict[str, Any]) -> List[str]:
+        """Statements creating a materialized view, its unique index and its version comment"""
+        statements = [f"CREATE MATERIALIZED VIEW {view_config['name']} AS {view_config['query']};"]
+        
+        # Create unique index if specified
+        if view_config.get('unique_index'):
+            columns = ', '.join(view_config['unique_index'])
+            statements.append(f"CREATE UNIQUE INDEX ON {view_config['name']} ({columns});")
+        
+        statements.append(
+            f"COMMENT ON MATERIALIZED VIEW {view_config['name']} IS '{self._definition_version(view_config)}';"
+        )
+        return statements
     
-    def refresh_materialized_views(self) -> Dict[str, Any]:
-        """Refresh all materialized views"""
+    def _source_changes(self, source: str) -> Optional[Dict[str, Any]]:
+        """Write counter and latest date of a view's source table, read on the primary"""
+        result = execute_query(SOURCE_CHANGES_SQL.format(source=source), {'source': source}, route='primary')
+        return result[0] if result else None
+    
+    def _refresh_reason(self, current: Optional[Dict[str, Any]], state: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Why a view needs refreshing, or None when its source is unchanged"""
+        if current is None or state is None:
+            return 'no watermark'
+        if current['changes'] < state['changes']:
+            # Statistics were reset (crash, failover or pg_stat_reset)
+            return 'statistics reset'
+        if current['max_fecha'] != state['max_fecha']:
+            return 'new supervision dates'
+        if current['changes'] - state['changes'] >= MV_REFRESH_MIN_CHANGES:
+            return f"{current['changes'] - state['changes']} row changes"
+        return None
+    
+    def refresh_materialized_views(self, force: bool = False) -> Dict[str, Any]:
+        """
+        Refresh materialized views whose source table changed since their last refresh.
+        
+        Changes are detected from the cumulative insert/update/delete
+        counters of the source table (and its partitions) together with its
+        latest supervision date, compared to the values captured before the
+        previous refresh. Refreshed views have their cache scopes invalidated.
+        """
         results = {
             'refreshed': [],
-            'errors': []
+            'unchanged': [],
+            'errors': [],
+            'invalidated': 0
         }
         
         logger.info("Refreshing materialized views...")
         
+        states = {
+            row['name']: row
+            for row in execute_query("SELECT name, changes, max_fecha FROM mv_refresh_state;", route='primary') or []
+        }
+        
         for view_config in self.MATERIALIZED_VIEWS:
+            name = view_config['name']
             try:
-                if self._materialized_view_exists(view_config['name']):
-                    sql = f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view_config['name']};"
-                    execute_query(sql)
-                    results['refreshed'].append(view_config['name'])
-                    logger.info(f"Refreshed materialized view: {view_config['name']}")
+                if not self._materialized_view_exists(name):
+                    continue
+                
+                # Captured before the refresh so writes landing during it trigger the next one
+                current = self._source_changes(view_config['source'])
+                reason = 'forced' if force else self._refresh_reason(current, states.get(name))
+                if reason is None:
+                    results['unchanged'].append(name)
+                    logger.debug(f"Materialized view {name} unchanged, skipping refresh")
+                    continue
+                
+                started = time.perf_counter()
+                if execute_query(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name};") is None:
+                    results['errors'].append(name)
+                    continue
+                duration_ms = round((time.perf_counter() - started) * 1000, 1)
+                
+                if current is not None:
+                    execute_query("""
+                        INSERT INTO mv_refresh_state (name, changes, max_fecha, refreshed_at, duration_ms)
+                        VALUES (%s, %s, %s, NOW(), %s)
+                        ON CONFLICT (name) DO UPDATE SET
+                            changes = EXCLUDED.changes,
+                            max_fecha = EXCLUDED.max_fecha,
+                            refreshed_at = EXCLUDED.refreshed_at,
+                            duration_ms = EXCLUDED.duration_ms;
+                    """, [name, current['changes'], current['max_fecha'], duration_ms])
+                
+                results['refreshed'].append(name)
+                results['invalidated'] += cache_manager.invalidate_scopes(view_config.get('cache_scopes', []))
+                logger.info(f"Refreshed materialized view {name} ({reason}) in {duration_ms / 1000:.1f}s")
             except Exception as e:
-                logger.error(f"Error refreshing materialized view {view_config['name']}: {e}")
-                results['errors'].append(view_config['name'])
+                logger.error(f"Error refreshing materialized view {name}: {e}")
+                results['errors'].append(name)
         
         return results
     
@@ -300,146 +362,428 @@ class DatabaseOptimizer:
     def vacuum_analyze(self, table_name: str = 'supervision_operativa_detalle'):
         """Run VACUUM ANALYZE for better query planning"""
         try:
+            if table_name == partitioning.PARENT_TABLE:
+                with autocommit_connection() as conn:
+                    if partitioning.is_partitioned(conn):
+                        # Closed quarters do not change: only the latest partitions need it
+                        vacuumed = partitioning.vacuum_recent(conn)
+                        conn.execute(f"ANALYZE {table_name};")
+                        logger.info(f"VACUUM ANALYZE completed for {', '.join(vacuumed) or 'no partitions'}")
+                        return
+            
             sql = f"VACUUM ANALYZE {table_name};"
-            execute_query(sql)
-            logger.info(f"VACUUM ANALYZE completed for {table_name}")
+            if execute_autocommit(sql) is not None:
+                logger.info(f"VACUUM ANALYZE completed for {table_name}")
         except Exception as e:
             logger.error(f"VACUUM ANALYZE error: {e}")
-
-class OptimizedQueries:
-    """Optimized database query implementations"""
-    
-    @cached_query(ttl=300, cache_type='kpis')
-    def get_optimized_kpis(self, quarter='ALL', year=2025, estado=None, grupo=None):
-        """Optimized KPI calculation using materialized views when possible"""
-        
-        # Try to use materialized view first
-        if self._can_use_materialized_view(quarter, year, estado, grupo):
-            return self._get_kpis_from_materialized_view(quarter, year, estado, grupo)
-        
-        # Fallback to optimized direct query
-        return self._get_kpis_direct_query(quarter, year, estado, grupo)
     
-    def _can_use_materialized_view(self, quarter, year, estado, grupo) -> bool:
-        """Check if we can use materialized view for this query"""
-        # For now, use materialized view for simple aggregations
-        return quarter != 'ALL' and year and not (estado and grupo)
+    def partition_status(self) -> Dict[str, Any]:
+        """Whether the supervision table is partitioned, with each partition's bounds and size"""
+        try:
+            with autocommit_connection(route='replica') as conn:
+                if not partitioning.is_partitioned(conn):
+                    return {'partitioned': False, 'partitions': []}
+                
+                parts = partitioning.partitions(conn)
+                return {
+                    'partitioned': True,
+                    'partitions': parts,
+                    'default_rows': sum(part['rows'] for part in parts if part['is_default']),
+                    'future_quarters': partitioning.FUTURE_QUARTERS,
+                    'timestamp': datetime.now(timezone.utc).isoformat()
+                }
+        except Exception as e:
+            logger.error(f"Error reading partition status: {e}")
+            return {'error': str(e)}
     
-    def _get_kpis_from_materialized_view(self, quarter, year, estado, grupo):
-        """Get KPIs from materialized view"""
-        base_query = """
-            SELECT 
-                ROUND(AVG(promedio), 2) as promedio,
-                SUM(total_supervisiones) as supervisiones,
-                SUM(total_sucursales) as sucursales,
-                COUNT(DISTINCT estado) as estados,
-                ROUND(MIN(minimo), 2) as minimo,
-                ROUND(MAX(maximo), 2) as maximo
-            FROM mv_kpi_summary
-            WHERE 1=1
-        """
-        
-        params = []
-        conditions = []
-        
-        if quarter != 'ALL':
-            conditions.append("quarter = %s")
-            params.append(int(quarter[1]))
-        
+    def ensure_future_partitions(self) -> List[str]:
+        """Keep quarterly partitions created ahead of incoming supervisions"""
+        try:
+            with autocommit_connection() as conn:
+                created = partitioning.ensure_future_partitions(conn)
+            if created:
+                logger.info(f"Created partitions: {', '.join(created)}")
+            return created
+        except Exception as e:
+            logger.error(f"Error creating future partitions: {e}")
+            return []
+
+RAW_SOURCE = 'supervision_operativa_detalle'
+
+# Measures any aggregate source may be asked for
+MEASURES = ('promedio', 'evaluaciones', 'supervisiones', 'sucursales', 'estados',
+            'minimo', 'maximo', 'desviacion_estandar')
+
+# Request dimensions, mapped to their detail table columns
+DIMENSION_COLUMNS = {
+    'estado': 'estado',
+    'grupo': 'grupo_operativo',
+    'sucursal': 'sucursal_clean',
+    'area': 'area_evaluacion',
+}
+
+class AggregateRouter:
+    """
+    Picks the cheapest source that answers an aggregate exactly.
+
+    Each source declares the dimensions it can group and filter by, the
+    measures it can compute, the period filters whose boundaries align with
+    its rows and the time grains it can be bucketed into. Among the sources
+    covering a request, the one with the fewest estimated rows wins.
+    Rollups and views whose watermark or stored change counters are behind
+    the detail table are skipped, so a request falls back to an exact source.
+
+    Grain rollups also answer a ``days`` range when bucketed by a grain they
+    support: the range then starts at the beginning of its first bucket, on
+    every source, so each bucket is complete whichever source serves it.
+    """
+
+    # Seconds relation size estimates are reused
+    STATS_TTL = 300
+
+    # Row estimates used before a relation has been analyzed
+    DEFAULT_ROWS = {
+        'mv_kpi_summary': 1000,
+        'rollup_geo_sucursal': 5000,
+        'rollup_supervision_quarter': 5000,
+        'rollup_supervision_month': 15000,
+        'rollup_supervision_week': 60000,
+        'rollup_supervision_day': 300000,
+        RAW_SOURCE: 10000000,
+    }
+
+    SOURCES = {
+        'mv_kpi_summary': {
+            'kind': 'mv_kpi',
+            'dimensions': {'estado', 'grupo'},
+            'measures': set(MEASURES),
+            'periods': {'quarter', 'year'},
+            'grains': {'quarter'},
+        },
+        'rollup_geo_sucursal': {
+            'kind': 'geo',
+            'dimensions': {'estado', 'grupo', 'sucursal'},
+            'measures': {'promedio', 'evaluaciones'},
+            'periods': {'quarter', 'year'},
+            'grains': set(),
+        },
+        'rollup_supervision_quarter': {
+            'kind': 'rollup',
+            'dimensions': set(DIMENSION_COLUMNS),
+            'measures': set(MEASURES) - {'supervisiones'},
+            'periods': {'quarter', 'year'},
+            'bucketed_periods': {'days'},
+            'grains': {'quarter'},
+        },
+        'rollup_supervision_month': {
+            'kind': 'rollup',
+            'dimensions': set(DIMENSION_COLUMNS),
+            'measures': set(MEASURES) - {'supervisiones'},
+            'periods': {'quarter', 'year'},
+            'bucketed_periods': {'days'},
+            'grains': {'month', 'quarter'},
+        },
+        'rollup_supervision_week': {
+            'kind': 'rollup',
+            'dimensions': set(DIMENSION_COLUMNS),
+            'measures': set(MEASURES) - {'supervisiones'},
+            'periods': set(),
+            'bucketed_periods': {'days'},
+            'grains': {'week'},
+        },
+        'rollup_supervision_day': {
+            'kind': 'rollup',
+            'dimensions': set(DIMENSION_COLUMNS),
+            'measures': set(MEASURES) - {'supervisiones'},
+            'periods': {'quarter', 'year', 'days'},
+            'grains': set(GRANULARITIES),
+        },
+        RAW_SOURCE: {
+            'kind': 'raw',
+            'dimensions': set(DIMENSION_COLUMNS),
+            'measures': set(MEASURES),
+            'periods': {'quarter', 'year', 'days'},
+            'grains': set(GRANULARITIES),
+        },
+    }
+
+    # Sources ``build`` can aggregate from; rollup_geo_sucursal has its own row shape
+    AGGREGATE_SOURCES = tuple(name for name, source in SOURCES.items() if source['kind'] != 'geo')
+
+    def __init__(self):
+        self.relation_rows = {}
+        self.stats_loaded_at = 0.0
+        self.decisions = deque(maxlen=200)
+        self.source_counts = {}
+        self.fallbacks = 0
+        self.view_freshness = {}
+
+    def _relation_rows(self) -> Dict[str, int]:
+        """Estimated rows of every existing source relation (refreshed every STATS_TTL)"""
+        if time.monotonic() - self.stats_loaded_at >= self.STATS_TTL:
+            result = execute_query(
+                "SELECT relname, reltuples::bigint as rows FROM pg_class WHERE relname = ANY(%s) AND relkind IN ('r', 'm', 'p');",
+                [list(self.SOURCES)]
+            )
+            if result is not None:
+                self.relation_rows = {
+                    row['relname']: row['rows'] if row['rows'] >= 0 else self.DEFAULT_ROWS[row['relname']]
+                    for row in result
+                }
+                self.stats_loaded_at = time.monotonic()
+        return self.relation_rows
+
+    def _view_is_fresh(self, name: str) -> bool:
+        """Whether view ``name`` was last refreshed at the detail table's current state (checked every FRESHNESS_CHECK_INTERVAL)"""
+        fresh, checked_at = self.view_freshness.get(name, (False, None))
+        if checked_at is None or time.monotonic() - checked_at >= FRESHNESS_CHECK_INTERVAL:
+            state = execute_query("SELECT changes, max_fecha FROM mv_refresh_state WHERE name = %s;", [name], route='primary')
+            current = execute_query(SOURCE_CHANGES_SQL.format(source=RAW_SOURCE), {'source': RAW_SOURCE}, route='primary')
+            fresh = bool(state and current) and (
+                state[0]['changes'] == current[0]['changes'] and state[0]['max_fecha'] == current[0]['max_fecha']
+            )
+            self.view_freshness[name] = (fresh, time.monotonic())
+        return fresh
+
+    def _rejection(self, name: str, dimensions, measures, periods, grain, rows) -> Optional[str]:
+        """Why ``name`` cannot answer the request, or None if it can"""
+        source = self.SOURCES[name]
+        if name != RAW_SOURCE and name not in rows:
+            return 'missing'
+        if not dimensions <= source['dimensions']:
+            return f"dimensions {sorted(dimensions - source['dimensions'])}"
+        if not measures <= source['measures']:
+            return f"measures {sorted(measures - source['measures'])}"
+        accepted = source['periods'] | (source.get('bucketed_periods', set()) if grain else set())
+        if not periods <= accepted:
+            return f"periods {sorted(periods - accepted)}"
+        if grain and grain not in source['grains']:
+            return f"grain {grain}"
+        if source['kind'] == 'rollup' and not time_rollups.is_ready():
+            return 'not populated'
+        if source['kind'] == 'geo' and not geo_rollup.is_ready():
+            return 'not populated'
+        # A rollup behind the detail table would silently return different numbers
+        if source['kind'] == 'rollup' and not time_rollups.is_fresh():
+            return 'stale'
+        if source['kind'] == 'geo' and not geo_rollup.is_fresh():
+            return 'stale'
+        if source['kind'] == 'mv_kpi' and not self._view_is_fresh(name):
+            return 'stale'
+        return None
+
+    def route(self, name: str, dimensions=(), measures=(), quarter=None, year=None, days=None,
+              grain: str = None, candidates=None) -> str:
+        """Cheapest source able to answer the request; the decision is recorded"""
+        periods = set()
+        if parse_quarter(quarter):
+            periods.add('quarter')
         if year:
-            conditions.append("year = %s")
-            params.append(year)
-            
-        if estado:
-            conditions.append("estado = %s")
-            params.append(estado)
-            
-        if grupo:
-            conditions.append("grupo_operativo = %s")
-            params.append(grupo)
-        
-        if conditions:
-            base_query += " AND " + " AND ".join(conditions)
-        
-        return execute_query(base_query, params)
-    
-    def _get_kpis_direct_query(self, quarter, year, estado, grupo):
-        """Get KPIs with optimized direct query"""
-        
-        # Use CTE for better performance
-        base_query = """
-            WITH filtered_data AS (
-                SELECT 
-                    CAST(porcentaje AS NUMERIC) as porcentaje_num,
-                    submission_id,
-                    sucursal_clean,
-                    estado,
-                    fecha_supervision
-                FROM supervision_operativa_detalle 
-                WHERE porcentaje IS NOT NULL 
-                  AND fecha_supervision IS NOT NULL
-        """
-        
-        params = []
+            periods.add('year')
+        if days:
+            periods.add('days')
+
+        try:
+            rows = self._relation_rows()
+        except Exception as e:
+            logger.warning(f"Aggregate router stats unavailable: {e}")
+            rows = {}
+
+        considered = {}
+        for candidate in candidates or self.AGGREGATE_SOURCES:
+            reason = self._rejection(candidate, set(dimensions), set(measures), periods, grain, rows)
+            considered[candidate] = reason or rows.get(candidate, self.DEFAULT_ROWS[candidate])
+
+        viable = {candidate: cost for candidate, cost in considered.items() if not isinstance(cost, str)}
+        source = min(viable, key=viable.get) if viable else RAW_SOURCE
+
+        self.source_counts[source] = self.source_counts.get(source, 0) + 1
+        self.decisions.append({
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'query': name,
+            'source': source,
+            'dimensions': sorted(dimensions),
+            'periods': sorted(periods),
+            'grain': grain,
+            'candidates': considered
+        })
+        return source
+
+    def _measure_sql(self, kind: str, measure: str) -> str:
+        if kind == 'raw':
+            value = "CAST(porcentaje AS NUMERIC)"
+            return {
+                'promedio': f"ROUND(AVG({value}), 2)",
+                'evaluaciones': "COUNT(*)",
+                'supervisiones': "COUNT(DISTINCT submission_id)",
+                'sucursales': "COUNT(DISTINCT sucursal_clean)",
+                'estados': "COUNT(DISTINCT estado)",
+                'minimo': f"ROUND(MIN({value}), 2)",
+                'maximo': f"ROUND(MAX({value}), 2)",
+                'desviacion_estandar': f"ROUND(STDDEV({value}), 2)",
+            }[measure]
+
+        # mv_kpi_summary rows are repeated once per unnested sucursal; sum each row once
+        once = " FILTER (WHERE b.n IS NULL OR b.n = 1)" if kind == 'mv_kpi' else ""
+        n = f"SUM(evaluaciones){once}"
+        total = f"SUM(suma){once}"
+        return {
+            'promedio': f"ROUND({total} / NULLIF({n}, 0), 2)",
+            'evaluaciones': f"COALESCE({n}, 0)",
+            'supervisiones': f"COALESCE(SUM(total_supervisiones){once}, 0)",
+            'sucursales': "COUNT(DISTINCT b.sucursal)" if kind == 'mv_kpi' else "COUNT(DISTINCT NULLIF(sucursal_clean, ''))",
+            'estados': "COUNT(DISTINCT estado)" if kind == 'mv_kpi' else "COUNT(DISTINCT NULLIF(estado, ''))",
+            'minimo': "ROUND(MIN(minimo), 2)",
+            'maximo': "ROUND(MAX(maximo), 2)",
+            'desviacion_estandar': (
+                f"ROUND(SQRT(GREATEST(SUM(suma_cuadrados){once} - {total} * {total} / NULLIF({n}, 0), 0)"
+                f" / NULLIF({n} - 1, 0)), 2)"
+            ),
+        }[measure]
+
+    def _sql(self, source: str, group_by, measures, filters, non_null, quarter, year, days, grain):
+        kind = self.SOURCES[source]['kind']
+        select = []
         conditions = []
-        
-        if quarter != 'ALL':
-            conditions.append("EXTRACT(QUARTER FROM fecha_supervision) = %s")
-            params.append(int(quarter[1]))
-        
-        if year:
-            conditions.append("EXTRACT(YEAR FROM fecha_supervision) = %s")
-            params.append(year)
-            
-        if estado:
-            conditions.append("estado = %s")
-            params.append(estado)
-            
-        if grupo:
-            conditions.append("grupo_operativo = %s")
-            params.append(grupo)
-        
+        params = []
+
+        if grain:
+            if kind == 'raw':
+                select.append(f"DATE_TRUNC('{grain}', fecha_supervision)::date as fecha")
+            elif kind == 'mv_kpi':
+                select.append("MAKE_DATE(year, quarter * 3 - 2, 1) as fecha")
+            elif source == f"rollup_supervision_{grain}":
+                select.append("bucket as fecha")
+            else:
+                select.append(f"DATE_TRUNC('{grain}', bucket)::date as fecha")
+
+        for dimension in group_by:
+            column = DIMENSION_COLUMNS[dimension]
+            select.append(f"NULLIF({column}, '') as {column}" if kind == 'rollup' else column)
+
+        for alias, measure in measures.items():
+            select.append(f"{self._measure_sql(kind, measure)} as {alias}")
+
+        for dimension, value in filters.items():
+            conditions.append(f"{DIMENSION_COLUMNS[dimension]} = %s")
+            params.append(value)
+
+        for dimension in non_null:
+            column = DIMENSION_COLUMNS[dimension]
+            conditions.append(f"{column} <> ''" if kind == 'rollup' else f"{column} IS NOT NULL")
+
+        if kind == 'mv_kpi':
+            if parse_quarter(quarter):
+                conditions.append("quarter = %s")
+                params.append(parse_quarter(quarter))
+            if year:
+                conditions.append("year = %s")
+                params.append(int(year))
+            table = "mv_kpi_summary m LEFT JOIN LATERAL unnest(m.sucursales) WITH ORDINALITY AS b(sucursal, n) ON true"
+        else:
+            column = 'fecha_supervision' if kind == 'raw' else 'bucket'
+            period, period_params = period_conditions(quarter, year, days, column=column)
+            if days and grain:
+                # Start at the first bucket's boundary, within any quarter/year, so coarser rollups serve it exactly
+                floor, _ = resolve_period(quarter, year)
+                start = bucket_start(period_params[0], grain)
+                period_params[0] = max(start, floor) if floor else start
+            conditions.extend(period)
+            params.extend(period_params)
+            table = source
+            if kind == 'raw':
+                conditions[:0] = ["porcentaje IS NOT NULL", "fecha_supervision IS NOT NULL"]
+
+        query = f"SELECT {', '.join(select)} FROM {table}"
         if conditions:
-            base_query += " AND " + " AND ".join(conditions)
-        
-        # Optimized aggregation query
-        final_query = base_query + """
-            )
-            SELECT 
-                ROUND(AVG(porcentaje_num), 2) as promedio,
-                COUNT(DISTINCT submission_id) as supervisiones,
-                COUNT(DISTINCT sucursal_clean) as sucursales,
-                COUNT(DISTINCT estado) as estados,
-                ROUND(MIN(porcentaje_num), 2) as minimo,
-                ROUND(MAX(porcentaje_num), 2) as maximo,
-                ROUND(STDDEV(porcentaje_num), 2) as desviacion_estandar
-            FROM filtered_data;
+            query += f" WHERE {' AND '.join(conditions)}"
+        group_count = len(group_by) + (1 if grain else 0)
+        if group_count:
+            query += f" GROUP BY {', '.join(str(i) for i in range(1, group_count + 1))}"
+        return query, params
+
+    def build(self, name: str, measures: Dict[str, str], group_by=(), filters=None, non_null=(),
+              quarter=None, year=None, days=None, grain: str = None, source: str = None):
         """
-        
-        return execute_query(final_query, params)
+        SQL for an aggregate from the cheapest capable source.
+
+        ``measures`` maps output aliases to MEASURES; ``group_by``, ``filters``
+        (dimension -> value) and ``non_null`` use the DIMENSION_COLUMNS keys.
+        Grouped rows carry the detail column names, and time buckets come
+        out as ``fecha``. Returns ``(query, params, source)``.
+        """
+        filters = {dimension: value for dimension, value in (filters or {}).items() if value}
+        if grain and grain not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {grain}")
+
+        if source is None:
+            dimensions = set(group_by) | set(filters) | set(non_null)
+            source = self.route(name, dimensions, measures.values(), quarter, year, days, grain)
+
+        query, params = self._sql(source, group_by, measures, filters, non_null, quarter, year, days, grain)
+        return query, params, source
+
+    def query(self, name: str, measures: Dict[str, str], order_by: str = None, row_format: str = 'dict', **kwargs):
+        """Build and run an aggregate, retrying on the detail table if the chosen source fails"""
+        query, params, source = self.build(name, measures, **kwargs)
+        if order_by:
+            query += f" ORDER BY {order_by}"
+
+        result = execute_query(query, params, row_format=row_format)
+        if result is None and source != RAW_SOURCE:
+            self.fallbacks += 1
+            logger.warning(f"Aggregate {name} failed on {source}, retrying on {RAW_SOURCE}")
+            return self.query(name, measures, order_by, row_format, **{**kwargs, 'source': RAW_SOURCE})
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Routing counters and the most recent decisions"""
+        return {
+            'source_counts': dict(self.source_counts),
+            'fallbacks': self.fallbacks,
+            'relation_rows': dict(self.relation_rows),
+            'recent_decisions': list(self.decisions)[-20:]
+        }
+
+KPI_MEASURES = {
+    'promedio': 'promedio',
+    'supervisiones': 'supervisiones',
+    'sucursales': 'sucursales',
+    'estados': 'estados',
+    'minimo': 'minimo',
+    'maximo': 'maximo',
+    'desviacion_estandar': 'desviacion_estandar',
+}
+
+class OptimizedQueries:
+    """Optimized database query implementations"""
+    
+    @cached_query(ttl=300, cache_type='kpis')
+    def get_optimized_kpis(self, quarter='ALL', year=2025, estado=None, grupo=None):
+        """Optimized KPI calculation from the cheapest source that can answer it"""
+        return aggregate_router.query(
+            'kpis',
+            KPI_MEASURES,
+            filters={'estado': estado, 'grupo': grupo},
+            quarter=quarter,
+            year=year
+        )
     
     @cached_query(ttl=600, cache_type='geo_data')
     def get_optimized_coordinates(self, quarter='ALL', year=2025, estado=None, limit=20):
-        """Optimized geospatial query using materialized view when possible"""
+        """Optimized geospatial query, served from the per-quarter geo rollup"""
         
-        # Try materialized view first for simple queries
-        if not estado and quarter == 'ALL':
-            query = """
-                SELECT 
-                    sucursal_clean,
-                    estado,
-                    municipio,
-                    latitud,
-                    longitud,
-                    ROUND(promedio_porcentaje, 2) as promedio_porcentaje,
-                    total_supervisiones
-                FROM mv_geo_summary
-                ORDER BY promedio_porcentaje DESC
-                LIMIT %s;
-            """
-            return execute_query(query, [limit])
+        source = aggregate_router.route(
+            'coordinates', {'estado', 'sucursal'} if estado else {'sucursal'}, {'promedio', 'evaluaciones'},
+            quarter=quarter, year=year, candidates=('rollup_geo_sucursal', RAW_SOURCE)
+        )
+        
+        if source == 'rollup_geo_sucursal':
+            rows = geo_rollup.sucursales(parse_quarter(quarter), year, estado=estado, limit=limit)
+            if rows is not None:
+                return rows
         
-        # Use optimized direct query for complex filters
+        # Detail rows until the geo rollup is populated
         query = """
             SELECT DISTINCT ON (s.sucursal_clean)
                 s.sucursal_clean,
@@ -455,15 +799,8 @@ class OptimizedQueries:
               AND s.porcentaje IS NOT NULL
         """
         
-        params = []
-        
-        if quarter != 'ALL':
-            query += " AND EXTRACT(QUARTER FROM s.fecha_supervision) = %s"
-            params.append(int(quarter[1]))
-        
-        if year:
-            query += " AND EXTRACT(YEAR FROM s.fecha_supervision) = %s"
-            params.append(year)
+        period_sql, params = period_filter(quarter, year, column='s.fecha_supervision')
+        query += period_sql
             
         if estado:
             query += " AND s.estado = %s"
@@ -479,35 +816,20 @@ class OptimizedQueries:
         return execute_query(query, params)
     
     @cached_query(ttl=300, cache_type='analytics')
-    def get_performance_trends(self, days=30, estado=None, grupo=None):
-        """Get performance trends with optimized query"""
-        query = """
-            SELECT 
-                DATE(fecha_supervision) as fecha,
-                ROUND(AVG(CAST(porcentaje AS NUMERIC)), 2) as promedio_diario,
-                COUNT(*) as supervisiones_diarias,
-                COUNT(DISTINCT sucursal_clean) as sucursales_evaluadas
-            FROM supervision_operativa_detalle
-            WHERE fecha_supervision >= CURRENT_DATE - INTERVAL '%s days'
-              AND porcentaje IS NOT NULL
-        """
-        
-        params = [days]
-        
-        if estado:
-            query += " AND estado = %s"
-            params.append(estado)
-            
-        if grupo:
-            query += " AND grupo_operativo = %s"
-            params.append(grupo)
-        
-        query += """
-            GROUP BY DATE(fecha_supervision)
-            ORDER BY fecha DESC;
-        """
-        
-        return execute_query(query, params)
+    def get_performance_trends(self, days=30, estado=None, grupo=None, granularity='day'):
+        """Get performance trends per day/week/month/quarter"""
+        return aggregate_router.query(
+            'trends',
+            {
+                'promedio_diario': 'promedio',
+                'supervisiones_diarias': 'evaluaciones',
+                'sucursales_evaluadas': 'sucursales'
+            },
+            order_by='fecha DESC',
+            filters={'estado': estado, 'grupo': grupo},
+            days=days,
+            grain=granularity
+        )
 
 # Background tasks for database maintenance
 class DatabaseMaintenanceTasks:
@@ -525,6 +847,14 @@ class DatabaseMaintenanceTasks:
             # Refresh materialized views
             self.optimizer.refresh_materialized_views()
             
+            # Rows past the last partition would fail to insert
+            self.optimizer.ensure_future_partitions()
+            
+            # Fold new supervisions into the time and geo rollups
+            appended = [time_rollups.append(), geo_rollup.append()]
+            if any(result.get('appended') for result in appended):
+                cache_manager.invalidate_scopes(ROLLUP_CACHE_SCOPES)
+            
             # Update statistics
             self.optimizer.vacuum_analyze()
             
@@ -545,8 +875,14 @@ class DatabaseMaintenanceTasks:
             stats = self.optimizer.analyze_table_stats()
             logger.info(f"Table statistics: {stats}")
             
-            # Check for missing indexes
-            # (Implementation would analyze query patterns and suggest new indexes)
+            # Safety net: appends already recompute the rollups when rows change in place
+            time_rollups.rebuild()
+            geo_rollup.rebuild()
+            
+            # Check for missing, unused and redundant indexes
+            advice = index_advisor.analyze()
+            for suggestion in advice.get('missing', [])[:5]:
+                logger.info(f"Suggested index: {suggestion['definition']} (saves ~{suggestion['benefit']['estimated_ms_saved']} ms)")
             
             logger.info("Weekly optimization completed")
             
@@ -555,5 +891,7 @@ class DatabaseMaintenanceTasks:
 
 # Global instances
 db_optimizer = DatabaseOptimizer()
+index_advisor = IndexAdvisor(DatabaseOptimizer.CRITICAL_INDEXES)
+aggregate_router = AggregateRouter()
 optimized_queries = OptimizedQueries()
 maintenance_tasks = DatabaseMaintenanceTasks()
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+Keyset pagination with opaque continuation tokens.
+A token carries the sort key of the last row served, signed so it cannot be
+forged or replayed against a different query. The next page resumes with a
+row comparison on that key instead of OFFSET, so page N costs the same as page 1.
+"""
+
+import os
+import hmac
+import json
+import base64
+import hashlib
+from decimal import Decimal
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+_SECRET = (os.getenv('PAGINATION_SECRET') or os.getenv('JWT_SECRET_KEY', 'dev-secret-key-change-in-production')).encode()
+
+class InvalidCursor(ValueError):
+    """Raised for tampered, malformed or foreign continuation tokens"""
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def _encode_value(value) -> List[str]:
+    """Tag a key value with its type so it decodes to the same Python type"""
+    if value is None:
+        return ['z', '']
+    if isinstance(value, datetime):
+        return ['t', value.isoformat()]
+    if isinstance(value, date):
+        return ['d', value.isoformat()]
+    if isinstance(value, Decimal):
+        return ['n', str(value)]
+    if isinstance(value, bool):
+        return ['b', '1' if value else '0']
+    if isinstance(value, int):
+        return ['i', str(value)]
+    if isinstance(value, float):
+        return ['f', repr(value)]
+    return ['s', str(value)]
+
+_DECODERS = {
+    'z': lambda text: None,
+    't': datetime.fromisoformat,
+    'd': date.fromisoformat,
+    'n': Decimal,
+    'b': lambda text: text == '1',
+    'i': int,
+    'f': float,
+    's': str,
+}
+
+def cursor_scope(name: str, **filters) -> str:
+    """Identify the query a token belongs to (endpoint plus its filters)"""
+    filter_data = json.dumps(filters, sort_keys=True, default=str)
+    return f"{name}:{hashlib.md5(filter_data.encode()).hexdigest()[:12]}"
+
+def encode_cursor(values: Sequence[Any], scope: str) -> str:
+    """Opaque token for resuming after a row with sort key ``values``"""
+    payload = json.dumps([_encode_value(value) for value in values], separators=(',', ':')).encode()
+    signature = hmac.new(_SECRET, scope.encode() + b'|' + payload, hashlib.sha256).digest()[:16]
+    return f"{_b64encode(payload)}.{_b64encode(signature)}"
+
+def decode_cursor(token: str, scope: str) -> List[Any]:
+    """Sort key stored in ``token``; raises InvalidCursor if it was not issued for ``scope``"""
+    try:
+        payload_text, signature_text = token.split('.', 1)
+        payload = _b64decode(payload_text)
+        signature = _b64decode(signature_text)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Malformed cursor: {e}")
+
+    expected = hmac.new(_SECRET, scope.encode() + b'|' + payload, hashlib.sha256).digest()[:16]
+    if not hmac.compare_digest(signature, expected):
+        raise InvalidCursor("Cursor does not match this query")
+
+    try:
+        return [_DECODERS[tag](text) for tag, text in json.loads(payload)]
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(f"Malformed cursor: {e}")
+
+def keyset_predicate(columns: Sequence[str], after: Optional[Sequence[Any]], descending: bool = True) -> Tuple[str, list]:
+    """
+    ``(a, b, ...) < (%s, %s, ...)`` condition selecting rows past ``after``.
+
+    All key columns must sort in the same direction so a single btree can
+    seek to the boundary row. Returns an empty condition for the first page.
+    """
+    if not after:
+        return "", []
+    if len(after) != len(columns):
+        raise InvalidCursor("Cursor does not match this query")
+
+    operator = '<' if descending else '>'
+    placeholders = ', '.join(['%s'] * len(columns))
+    return f"({', '.join(columns)}) {operator} ({placeholders})", list(after)
+
+def keyset_order(columns: Sequence[str], descending: bool = True) -> str:
+    """ORDER BY list matching ``keyset_predicate``"""
+    direction = 'DESC' if descending else 'ASC'
+    return ', '.join(f"{column} {direction}" for column in columns)
+
+def paginate(rows: Optional[list], limit: int, key_fields: Sequence[str], scope: str) -> Tuple[list, Optional[str]]:
+    """
+    Split the ``limit + 1`` rows fetched for a page into the page itself
+    and the token for the next one (None on the last page).
+
+    NULL key values are stored as '', so nullable key columns must be text
+    wrapped in ``COALESCE(column, '')`` in both the keyset predicate and
+    ORDER BY; otherwise filter them with ``IS NOT NULL``.
+    """
+    rows = rows or []
+    if len(rows) <= limit:
+        return rows, None
+
+    page = rows[:limit]
+    last = page[-1]
+    values = ['' if last[field] is None else last[field] for field in key_fields]
+    return page, encode_cursor(values, scope)
+
+def pagination_info(limit: int, next_cursor: Optional[str], offset: int = 0) -> Dict[str, Any]:
+    """Pagination block for API responses"""
+    return {
+        'limit': limit,
+        'offset': offset,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    }
@@ -0,0 +1,274 @@
+"""
+Quarterly range partitioning of supervision_operativa_detalle.
+Converts the table online into a parent partitioned by fecha_supervision,
+keeps partitions created ahead of the data and manages indexes partition by
+partition. Every function takes an autocommit connection (the
+migration runner's direct session) and opens its own short transactions.
+
+Conversion happens in three phases:
+
+1. A ``CHECK (fecha_supervision IS NULL OR fecha_supervision < cutoff)``
+   constraint is validated on the existing table without blocking writes.
+2. In one short transaction the table is renamed to ``..._legacy``, a
+   partitioned parent takes its name, the legacy table is attached as the
+   DEFAULT partition (rows with a NULL date stay there) and quarterly
+   partitions are created from ``cutoff`` on. The CHECK lets Postgres skip
+   scanning the default partition.
+3. ``migrate_history`` moves one historical quarter at a time out of the
+   default partition into its own partition.
+"""
+
+import os
+import logging
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from .periods import QUARTER_NAMES, previous_quarter, quarter_range
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = 'supervision_operativa_detalle'
+LEGACY_TABLE = f'{PARENT_TABLE}_legacy'
+PARTITION_KEY = 'fecha_supervision'
+LEGACY_CONSTRAINT = 'supervision_legacy_fecha_bound'
+
+# Quarters kept created ahead of the current one
+FUTURE_QUARTERS = int(os.getenv('DB_PARTITION_FUTURE_QUARTERS', 4))
+
+PARTITIONS_SQL = """
+    SELECT
+        c.relname as name,
+        pg_get_expr(c.relpartbound, c.oid) as bound,
+        pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT' as is_default,
+        c.reltuples::bigint as rows,
+        pg_total_relation_size(c.oid) as size_bytes
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = to_regclass(%s)
+    ORDER BY c.relname
+"""
+
+def partition_name(year: int, quarter: int) -> str:
+    """Partition table holding one quarter, e.g. supervision_operativa_detalle_2025q3"""
+    return f"{PARENT_TABLE}_{year}q{quarter}"
+
+def _quarter_of(day: date):
+    return day.year, (day.month - 1) // 3 + 1
+
+def _next_quarter(year: int, quarter: int):
+    return (year, quarter + 1) if quarter < 4 else (year + 1, 1)
+
+def is_partitioned(conn) -> bool:
+    """Whether the supervision table already is a partitioned parent"""
+    row = conn.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s);", [PARENT_TABLE]).fetchone()
+    return bool(row and row['relkind'] == 'p')
+
+def partitions(conn) -> List[Dict[str, Any]]:
+    """Partitions of the supervision table with their bounds and sizes"""
+    return conn.execute(PARTITIONS_SQL, [PARENT_TABLE]).fetchall()
+
+def dependent_views(conn) -> List[str]:
+    """Views and materialized views reading the supervision table"""
+    rows = conn.execute("""
+        SELECT DISTINCT v.relname
+        FROM pg_depend d
+        JOIN pg_rewrite r ON r.oid = d.objid
+        JOIN pg_class v ON v.oid = r.ev_class
+        WHERE d.refobjid = to_regclass(%s) AND v.oid <> d.refobjid;
+    """, [PARENT_TABLE]).fetchall()
+    return [row['relname'] for row in rows]
+
+def create_partition(conn, year: int, quarter: int) -> bool:
+    """Create the partition for a quarter if missing; returns whether it was created"""
+    name = partition_name(year, quarter)
+    if conn.execute("SELECT to_regclass(%s) as oid;", [name]).fetchone()['oid'] is not None:
+        return False
+
+    start, end = quarter_range(year, quarter)
+    # Indexes of the parent are created on the new (empty) partition automatically
+    conn.execute(
+        f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}');"
+    )
+    logger.info(f"Created partition {name} for {QUARTER_NAMES[quarter]} {year}")
+    return True
+
+def ensure_future_partitions(conn, today: date = None, ahead: int = FUTURE_QUARTERS) -> List[str]:
+    """
+    Create the partitions of the next ``ahead`` quarters; no-op on a plain table.
+
+    Rows dated past the last partition are rejected by the legacy CHECK,
+    so this must run well before each quarter starts.
+    """
+    if not is_partitioned(conn):
+        return []
+
+    created = []
+    year, quarter = _next_quarter(*_quarter_of(today or date.today()))
+    for _ in range(ahead):
+        if create_partition(conn, year, quarter):
+            created.append(partition_name(year, quarter))
+        year, quarter = _next_quarter(year, quarter)
+    return created
+
+def convert(conn, allowed_views=(), today: date = None, ahead: int = FUTURE_QUARTERS) -> Dict[str, Any]:
+    """
+    Turn the plain table into a quarterly partitioned parent (phases 1 and 2).
+
+    Materialized views in ``allowed_views`` keep reading the legacy table
+    and must be rebuilt afterwards; any other dependent view aborts the
+    conversion, since it would silently keep pointing at the legacy table.
+    """
+    if is_partitioned(conn):
+        return {'converted': False, 'reason': 'already partitioned'}
+
+    blocking = [view for view in dependent_views(conn) if view not in allowed_views]
+    if blocking:
+        raise RuntimeError(f"Views depend on {PARENT_TABLE}: {', '.join(blocking)}")
+
+    # New rows up to the end of the current quarter may still land in the legacy table
+    year, quarter = _next_quarter(*_quarter_of(today or date.today()))
+    cutoff = quarter_range(year, quarter)[0]
+
+    # Phase 1: NOT VALID + VALIDATE only takes a SHARE UPDATE EXCLUSIVE lock while scanning
+    conn.execute(f"ALTER TABLE {PARENT_TABLE} DROP CONSTRAINT IF EXISTS {LEGACY_CONSTRAINT};")
+    conn.execute(
+        f"ALTER TABLE {PARENT_TABLE} ADD CONSTRAINT {LEGACY_CONSTRAINT} "
+        f"CHECK ({PARTITION_KEY} IS NULL OR {PARTITION_KEY} < '{cutoff.isoformat()}') NOT VALID;"
+    )
+    conn.execute(f"ALTER TABLE {PARENT_TABLE} VALIDATE CONSTRAINT {LEGACY_CONSTRAINT};")
+
+    # Phase 2: metadata-only swap
+    with conn.transaction():
+        indexes = conn.execute(
+            "SELECT indexname FROM pg_indexes WHERE schemaname = 'public' AND tablename = %s;", [PARENT_TABLE]
+        ).fetchall()
+        conn.execute(f"ALTER TABLE {PARENT_TABLE} RENAME TO {LEGACY_TABLE};")
+        # Free the index names for the parent; partition_indexes re-attaches these
+        for index in indexes:
+            conn.execute(f"ALTER INDEX {index['indexname']} RENAME TO {_child_index_name(index['indexname'], LEGACY_TABLE)};")
+
+        conn.execute(
+            f"CREATE TABLE {PARENT_TABLE} (LIKE {LEGACY_TABLE} INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE ({PARTITION_KEY});"
+        )
+        conn.execute(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {LEGACY_TABLE} DEFAULT;")
+
+        created = []
+        for _ in range(ahead + 1):
+            if create_partition(conn, year, quarter):
+                created.append(partition_name(year, quarter))
+            year, quarter = _next_quarter(year, quarter)
+
+    logger.info(f"Converted {PARENT_TABLE} to a partitioned table (cutoff {cutoff}, {len(created)} partitions)")
+    return {'converted': True, 'cutoff': cutoff.isoformat(), 'partitions_created': created, 'renamed_indexes': len(indexes)}
+
+def move_quarter(conn, year: int, quarter: int) -> int:
+    """
+    Move one quarter out of the default partition into its own partition.
+
+    Runs in a single transaction, so readers see the rows either in the
+    legacy table or in the new partition. Attaching still scans the
+    default partition under an exclusive lock, which shrinks with each
+    quarter moved.
+    """
+    name = partition_name(year, quarter)
+    start, end = quarter_range(year, quarter)
+    bound = f"{PARTITION_KEY} >= '{start.isoformat()}' AND {PARTITION_KEY} < '{end.isoformat()}'"
+
+    with conn.transaction():
+        conn.execute(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS);")
+        moved = conn.execute(
+            f"WITH moved AS (DELETE FROM ONLY {LEGACY_TABLE} WHERE {bound} RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved;"
+        ).rowcount
+        # Matching CHECK lets ATTACH skip validating the new partition
+        conn.execute(f"ALTER TABLE {name} ADD CONSTRAINT {name}_bound CHECK ({bound});")
+        conn.execute(
+            f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}');"
+        )
+        conn.execute(f"ALTER TABLE {name} DROP CONSTRAINT {name}_bound;")
+
+    logger.info(f"Moved {moved} rows of {QUARTER_NAMES[quarter]} {year} into {name}")
+    return moved
+
+def migrate_history(conn, limit: Optional[int] = None) -> Dict[str, Any]:
+    """Phase 3: move historical quarters out of the default partition, oldest first"""
+    if not is_partitioned(conn):
+        return {'moved': {}, 'reason': 'not partitioned'}
+
+    pending = conn.execute(f"""
+        SELECT DISTINCT
+            EXTRACT(YEAR FROM {PARTITION_KEY})::int as year,
+            EXTRACT(QUARTER FROM {PARTITION_KEY})::int as quarter
+        FROM ONLY {LEGACY_TABLE}
+        WHERE {PARTITION_KEY} IS NOT NULL
+        ORDER BY 1, 2;
+    """).fetchall()
+
+    moved = {}
+    for row in pending[:limit]:
+        if conn.execute("SELECT to_regclass(%s) as oid;", [partition_name(row['year'], row['quarter'])]).fetchone()['oid'] is not None:
+            # Partition exists already: rows in the default partition would block attaching
+            logger.warning(f"Rows for {row['year']}Q{row['quarter']} remain in {LEGACY_TABLE}")
+            continue
+        moved[f"{row['year']}Q{row['quarter']}"] = move_quarter(conn, row['year'], row['quarter'])
+
+    if moved:
+        conn.execute(f"VACUUM ANALYZE {LEGACY_TABLE};")
+    return {'moved': moved, 'remaining_quarters': len(pending) - len(moved)}
+
+def _child_index_name(index_name: str, partition: str) -> str:
+    suffix = partition[len(PARENT_TABLE) + 1:] if partition.startswith(PARENT_TABLE + '_') else partition
+    return f"{index_name}_{suffix}"[:63]
+
+def partition_indexes(conn, index_name: str, definition: str) -> Dict[str, Any]:
+    """
+    Build a parent index partition by partition without blocking writes.
+
+    ``CREATE INDEX CONCURRENTLY`` is not supported on a partitioned parent,
+    so the parent index is created ``ON ONLY`` (invalid), each partition
+    missing a matching index gets one concurrently, and attaching the last
+    one makes the parent index valid. ``definition`` is everything after
+    the table name (see ``DatabaseOptimizer.index_definition``).
+    """
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON ONLY {PARENT_TABLE} {definition};")
+
+    missing = conn.execute("""
+        SELECT c.relname as partition
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_inherits ii
+              JOIN pg_index x ON x.indexrelid = ii.inhrelid
+              WHERE ii.inhparent = to_regclass(%s) AND x.indrelid = c.oid
+          );
+    """, [PARENT_TABLE, index_name]).fetchall()
+
+    attached = []
+    for row in missing:
+        child = _child_index_name(index_name, row['partition'])
+        existing = conn.execute(
+            "SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass(%s);", [child]
+        ).fetchone()
+        if existing and not existing['indisvalid']:
+            conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {child};")
+        conn.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {child} ON {row['partition']} {definition};")
+        conn.execute(f"ALTER INDEX {index_name} ATTACH PARTITION {child};")
+        attached.append(child)
+
+    return {'index': index_name, 'attached': attached}
+
+def vacuum_recent(conn, quarters: int = 2, today: date = None) -> List[str]:
+    """VACUUM ANALYZE the partitions of the latest ``quarters`` quarters only"""
+    year, quarter = _quarter_of(today or date.today())
+    vacuumed = []
+    for _ in range(quarters):
+        name = partition_name(year, quarter)
+        if conn.execute("SELECT to_regclass(%s) as oid;", [name]).fetchone()['oid'] is not None:
+            conn.execute(f"VACUUM ANALYZE {name};")
+            vacuumed.append(name)
+        year, quarter = previous_quarter(year, quarter)
+    return vacuumed
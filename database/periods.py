@@ -0,0 +1,90 @@
+"""
+Period filters as half-open date ranges.
+Turns quarter/year/days request parameters into ``fecha >= start AND fecha < end``
+predicates that a btree on fecha_supervision can serve, instead of EXTRACT()
+expressions that force a sequential scan.
+"""
+
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+
+QUARTER_NAMES = {1: 'Q1', 2: 'Q2', 3: 'Q3', 4: 'Q4'}
+
+def parse_quarter(quarter) -> Optional[int]:
+    """'Q3', '3' or 3 -> 3; 'ALL', None or '' -> None"""
+    if quarter in (None, '', 'ALL'):
+        return None
+    if isinstance(quarter, str):
+        quarter = quarter.strip().upper().lstrip('Q')
+    quarter = int(quarter)
+    if quarter not in QUARTER_NAMES:
+        raise ValueError(f"Invalid quarter: {quarter}")
+    return quarter
+
+def quarter_range(year: int, quarter: int) -> Tuple[date, date]:
+    """First day of the quarter and first day of the next one"""
+    start = date(year, 3 * (quarter - 1) + 1, 1)
+    end = date(year + 1, 1, 1) if quarter == 4 else date(year, 3 * quarter + 1, 1)
+    return start, end
+
+def year_range(year: int) -> Tuple[date, date]:
+    """January 1st of ``year`` and of the following year"""
+    return date(year, 1, 1), date(year + 1, 1, 1)
+
+def days_range(days: int, today: date = None) -> Tuple[date, date]:
+    """The last ``days`` days up to and including today"""
+    today = today or date.today()
+    return today - timedelta(days=days), today + timedelta(days=1)
+
+def previous_quarter(year: int, quarter: int) -> Tuple[int, int]:
+    """(year, quarter) of the quarter before the given one"""
+    return (year, quarter - 1) if quarter > 1 else (year - 1, 4)
+
+def resolve_period(quarter=None, year=None, days=None) -> Tuple[Optional[date], Optional[date]]:
+    """
+    Half-open ``[start, end)`` range for the given filters.
+
+    Either bound is None when unconstrained. A quarter without a year is
+    not a single range; use ``period_conditions`` for that case.
+    """
+    start = end = None
+    quarter = parse_quarter(quarter)
+
+    if year:
+        start, end = quarter_range(int(year), quarter) if quarter else year_range(int(year))
+
+    if days:
+        days_start, days_end = days_range(int(days))
+        start = max(start, days_start) if start else days_start
+        end = min(end, days_end) if end else days_end
+
+    return start, end
+
+def period_conditions(quarter=None, year=None, days=None, column: str = 'fecha_supervision') -> Tuple[List[str], list]:
+    """SQL conditions and params restricting ``column`` to the requested period"""
+    conditions = []
+    params = []
+    start, end = resolve_period(quarter, year, days)
+
+    if start is not None:
+        conditions.append(f"{column} >= %s")
+        params.append(start)
+
+    if end is not None:
+        conditions.append(f"{column} < %s")
+        params.append(end)
+
+    quarter = parse_quarter(quarter)
+    if quarter and not year:
+        # Same quarter of every year: served by the idx_supervision_quarter expression index
+        conditions.append(f"EXTRACT(QUARTER FROM {column}) = %s")
+        params.append(quarter)
+
+    return conditions, params
+
+def period_filter(quarter=None, year=None, days=None, column: str = 'fecha_supervision') -> Tuple[str, list]:
+    """Like ``period_conditions`` but as an ``" AND ..."`` fragment to append to a WHERE clause"""
+    conditions, params = period_conditions(quarter, year, days, column)
+    if not conditions:
+        return "", params
+    return " AND " + " AND ".join(conditions), params
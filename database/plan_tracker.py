@@ -0,0 +1,307 @@
+"""
+Plan capture and regression tracking for the hot dashboard queries.
+Runs each registered query through EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)
+with representative parameters, stores one capture per query and day, and
+flags plan shape changes, new sequential scans and latency regressions
+against the previous captures.
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+from datetime import date, datetime, timezone
+from statistics import median
+from typing import Any, Dict, List, Optional
+
+from .connection_v3 import get_db_connection, return_db_connection
+from .dimension_catalog import dimension_catalog
+from .optimization import aggregate_router, KPI_MEASURES
+from .queries_v3 import heatmap_query
+from .rollups import geo_rollup
+
+logger = logging.getLogger(__name__)
+
+# Per-query execution limit while capturing (EXPLAIN ANALYZE runs the query)
+PLAN_CAPTURE_TIMEOUT = os.getenv('PLAN_CAPTURE_TIMEOUT', '30s')
+
+# Previous captures the latency baseline (median) is taken from
+BASELINE_CAPTURES = 7
+
+# A capture is a latency regression past both thresholds
+REGRESSION_RATIO = float(os.getenv('PLAN_REGRESSION_RATIO', 1.5))
+REGRESSION_MIN_MS = float(os.getenv('PLAN_REGRESSION_MIN_MS', 20))
+
+# Quarter partitions of one table share a plan shape
+_PARTITION_SUFFIX_RE = re.compile(r'_\d{4}q[1-4]$')
+
+PLAN_HISTORY_SQL = """
+    CREATE TABLE IF NOT EXISTS query_plan_history (
+        captured_on DATE NOT NULL,
+        name TEXT NOT NULL,
+        source TEXT,
+        plan_hash TEXT NOT NULL,
+        seq_scans TEXT[] NOT NULL DEFAULT '{}',
+        execution_ms NUMERIC,
+        planning_ms NUMERIC,
+        total_cost NUMERIC,
+        shared_hit_blocks BIGINT,
+        shared_read_blocks BIGINT,
+        rows BIGINT,
+        regressions JSONB NOT NULL DEFAULT '[]',
+        plan JSONB NOT NULL,
+        captured_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (name, captured_on)
+    );
+"""
+
+SAVE_SQL = """
+    INSERT INTO query_plan_history
+        (captured_on, name, source, plan_hash, seq_scans, execution_ms, planning_ms, total_cost,
+         shared_hit_blocks, shared_read_blocks, rows, regressions, plan, captured_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+    ON CONFLICT (name, captured_on) DO UPDATE SET
+        source = EXCLUDED.source,
+        plan_hash = EXCLUDED.plan_hash,
+        seq_scans = EXCLUDED.seq_scans,
+        execution_ms = EXCLUDED.execution_ms,
+        planning_ms = EXCLUDED.planning_ms,
+        total_cost = EXCLUDED.total_cost,
+        shared_hit_blocks = EXCLUDED.shared_hit_blocks,
+        shared_read_blocks = EXCLUDED.shared_read_blocks,
+        rows = EXCLUDED.rows,
+        regressions = EXCLUDED.regressions,
+        plan = EXCLUDED.plan,
+        captured_at = EXCLUDED.captured_at;
+"""
+
+def _kpis(sample):
+    return aggregate_router.build(
+        'plan:kpis', KPI_MEASURES, filters={'estado': sample['estado']},
+        quarter=sample['quarter'], year=sample['year']
+    )
+
+def _ranking(sample):
+    query, params, source = aggregate_router.build(
+        'plan:ranking',
+        {'promedio': 'promedio', 'total_supervisiones': 'evaluaciones', 'total_sucursales': 'sucursales'},
+        group_by=['estado'], quarter=sample['quarter'], year=sample['year']
+    )
+    return f"{query} ORDER BY promedio DESC", params, source
+
+def _coordinates(sample):
+    query, params = geo_rollup.sucursales_query(sample['quarter'], sample['year'], estado=sample['estado'], limit=100)
+    return query, params, 'rollup_geo_sucursal'
+
+def _heatmap(sample):
+    query, params = heatmap_query(f"Q{sample['quarter']}", sample['year'], sample['estado'], limit=5000)
+    return query, params, 'supervision_operativa_detalle'
+
+def _trends(sample):
+    query, params, source = aggregate_router.build(
+        'plan:trends',
+        {'promedio_diario': 'promedio', 'supervisiones_diarias': 'evaluaciones', 'sucursales_evaluadas': 'sucursales'},
+        days=30, grain='day'
+    )
+    return f"{query} ORDER BY fecha DESC", params, source
+
+# Hot queries, each built the way its endpoint builds it: (query, params, source)
+REGISTERED_QUERIES: List[Dict[str, Any]] = [
+    {'name': 'kpis', 'build': _kpis, 'description': 'KPI cards for one estado and quarter'},
+    {'name': 'ranking', 'build': _ranking, 'description': 'Estado ranking for one quarter'},
+    {'name': 'coordinates', 'build': _coordinates, 'description': 'Map markers for one estado and quarter'},
+    {'name': 'heatmap', 'build': _heatmap, 'description': 'Heatmap points for one estado and quarter'},
+    {'name': 'trends', 'build': _trends, 'description': 'Daily trend of the last 30 days'},
+]
+
+def _plan_nodes(plan: Dict[str, Any]):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from _plan_nodes(child)
+
+def _relation(node: Dict[str, Any]) -> Optional[str]:
+    name = node.get('Relation Name')
+    return _PARTITION_SUFFIX_RE.sub('', name) if name else None
+
+def plan_shape(plan: Dict[str, Any]) -> List[str]:
+    """Node types with their relation, index and join type, in tree order; costs and timings left out"""
+    shape = []
+
+    def walk(node, depth):
+        parts = [node['Node Type'], _relation(node), node.get('Index Name'), node.get('Join Type'), node.get('Strategy')]
+        shape.append(f"{depth}:" + '/'.join(part for part in parts if part))
+        for child in node.get('Plans', []):
+            walk(child, depth + 1)
+
+    walk(plan, 0)
+    return shape
+
+class PlanTracker:
+    """Daily EXPLAIN ANALYZE captures of the registered queries"""
+
+    def __init__(self, queries: List[Dict[str, Any]] = None):
+        self.queries = queries if queries is not None else REGISTERED_QUERIES
+        self.last_capture = None
+
+    def _representative_params(self, conn) -> Dict[str, Any]:
+        """Latest quarter with data and the estado with the most evaluations"""
+        latest = conn.execute("SELECT MAX(fecha_supervision) as max_fecha FROM supervision_operativa_detalle;").fetchone()['max_fecha']
+        latest = latest or datetime.now(timezone.utc)
+
+        estado = None
+        try:
+            estados = dimension_catalog.with_counts('estado')
+            if estados:
+                estado = max(estados, key=lambda item: item['evaluaciones'])['value']
+        except Exception as e:
+            logger.warning(f"No representative estado for plan capture: {e}")
+
+        return {'year': latest.year, 'quarter': (latest.month - 1) // 3 + 1, 'estado': estado}
+
+    def _explain(self, conn, query: str, params) -> Dict[str, Any]:
+        with conn.transaction():
+            conn.execute("SELECT set_config('statement_timeout', %s, true);", [PLAN_CAPTURE_TIMEOUT])
+            row = conn.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", params).fetchone()
+        result = row['QUERY PLAN']
+        return (json.loads(result) if isinstance(result, str) else result)[0]
+
+    def _regressions(self, capture: Dict[str, Any], previous: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Changes against the previous captures (newest first) worth a look"""
+        if not previous:
+            return []
+
+        regressions = []
+        last = previous[0]
+        if last['plan_hash'] != capture['plan_hash']:
+            regressions.append({'type': 'plan_changed', 'previous_capture': str(last['captured_on'])})
+
+        new_scans = sorted(set(capture['seq_scans']) - set(last['seq_scans'] or []))
+        if new_scans:
+            regressions.append({'type': 'new_seq_scan', 'relations': new_scans})
+
+        timings = [float(row['execution_ms']) for row in previous if row['execution_ms'] is not None]
+        if timings and capture['execution_ms'] is not None:
+            baseline = median(timings)
+            if capture['execution_ms'] > baseline * REGRESSION_RATIO and capture['execution_ms'] - baseline > REGRESSION_MIN_MS:
+                regressions.append({
+                    'type': 'slower',
+                    'baseline_ms': round(baseline, 2),
+                    'execution_ms': capture['execution_ms'],
+                    'ratio': round(capture['execution_ms'] / baseline, 2) if baseline else None
+                })
+
+        return regressions
+
+    def _capture_one(self, conn, entry: Dict[str, Any], sample: Dict[str, Any], today: date) -> Dict[str, Any]:
+        query, params, source = entry['build'](sample)
+        explained = self._explain(conn, query, params)
+        plan = explained['Plan']
+        shape = plan_shape(plan)
+
+        capture = {
+            'name': entry['name'],
+            'source': source,
+            'plan_hash': hashlib.md5('\n'.join(shape).encode()).hexdigest()[:12],
+            'seq_scans': sorted({_relation(node) for node in _plan_nodes(plan) if node['Node Type'] == 'Seq Scan'}),
+            'execution_ms': round(explained.get('Execution Time', 0), 2),
+            'planning_ms': round(explained.get('Planning Time', 0), 2),
+            'total_cost': plan.get('Total Cost'),
+            'shared_hit_blocks': plan.get('Shared Hit Blocks'),
+            'shared_read_blocks': plan.get('Shared Read Blocks'),
+            'rows': plan.get('Actual Rows'),
+        }
+
+        previous = conn.execute("""
+            SELECT captured_on, plan_hash, seq_scans, execution_ms
+            FROM query_plan_history
+            WHERE name = %s AND captured_on < %s
+            ORDER BY captured_on DESC
+            LIMIT %s;
+        """, [entry['name'], today, BASELINE_CAPTURES]).fetchall()
+        capture['regressions'] = self._regressions(capture, previous)
+
+        conn.execute(SAVE_SQL, [
+            today, capture['name'], source, capture['plan_hash'], capture['seq_scans'],
+            capture['execution_ms'], capture['planning_ms'], capture['total_cost'],
+            capture['shared_hit_blocks'], capture['shared_read_blocks'], capture['rows'],
+            json.dumps(capture['regressions']), json.dumps(explained)
+        ])
+        conn.commit()
+
+        for regression in capture['regressions']:
+            logger.warning(f"Query plan regression in {entry['name']}: {regression}")
+        return capture
+
+    def capture(self) -> Dict[str, Any]:
+        """Capture today's plan of every registered query and flag regressions"""
+        conn = get_db_connection(route='primary')
+        if not conn:
+            return {'error': 'No database connection'}
+
+        try:
+            today = date.today()
+            sample = self._representative_params(conn)
+            conn.commit()
+
+            captures = []
+            errors = []
+            for entry in self.queries:
+                try:
+                    captures.append(self._capture_one(conn, entry, sample, today))
+                except Exception as e:
+                    conn.rollback()
+                    logger.error(f"Plan capture of {entry['name']} failed: {e}")
+                    errors.append({'name': entry['name'], 'error': str(e)})
+
+            report = {
+                'captured_on': today.isoformat(),
+                'parameters': sample,
+                'queries': captures,
+                'regressions': sum(len(capture['regressions']) for capture in captures),
+                'errors': errors
+            }
+            self.last_capture = report
+            logger.info(f"Captured {len(captures)} query plans, {report['regressions']} regressions")
+            return report
+
+        except Exception as e:
+            logger.error(f"Plan capture error: {e}")
+            return {'error': str(e)}
+        finally:
+            return_db_connection(conn)
+
+    def history(self, days: int = 14, name: str = None, include_plan: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """Stored captures of the last ``days`` days, newest first"""
+        conn = get_db_connection(route='primary')
+        if not conn:
+            return None
+
+        try:
+            conditions = ["captured_on >= CURRENT_DATE - %s::int"]
+            params = [days]
+            if name:
+                conditions.append("name = %s")
+                params.append(name)
+
+            rows = conn.execute(f"""
+                SELECT
+                    captured_on, name, source, plan_hash, seq_scans, execution_ms, planning_ms,
+                    total_cost, shared_hit_blocks, shared_read_blocks, rows, regressions, captured_at
+                    {', plan' if include_plan else ''}
+                FROM query_plan_history
+                WHERE {' AND '.join(conditions)}
+                ORDER BY captured_on DESC, name;
+            """, params).fetchall()
+            conn.commit()
+            return rows
+
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Plan history error: {e}")
+            return None
+        finally:
+            return_db_connection(conn)
+
+# Global plan tracker instance
+plan_tracker = PlanTracker()
@@ -0,0 +1,208 @@
+"""
+Connection pool telemetry and adaptive sizing.
+Tracks checkout wait time, saturation and connection age per pool and resizes
+the pool within configured bounds when requests start queueing.
+"""
+
+import os
+import time
+import bisect
+import logging
+import threading
+import weakref
+from collections import deque
+from typing import Any, Dict, List
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Checkout wait histogram bucket upper bounds in milliseconds (last bucket is +Inf)
+WAIT_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000]
+
+class PoolConfig:
+    """Pool sizing settings read from the environment"""
+    MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 1))
+    MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+    # Hard ceiling the autoscaler may grow max_size to
+    MAX_SIZE_LIMIT = int(os.getenv('DB_POOL_MAX_SIZE_LIMIT', max(MAX_SIZE, 20)))
+    # Recycle connections after this many seconds (Neon/pgbouncer friendly)
+    MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', 1800))
+    MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', 300))
+    # Seconds a request waits for a connection before failing
+    CHECKOUT_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+    # Open min_size connections before serving the first request
+    PREWARM = os.getenv('DB_POOL_PREWARM', 'true').lower() == 'true'
+    # Autoscaler: evaluation period and the p95 wait that triggers growth
+    RESIZE_INTERVAL = float(os.getenv('DB_POOL_RESIZE_INTERVAL', 30))
+    WAIT_THRESHOLD_MS = float(os.getenv('DB_POOL_WAIT_THRESHOLD_MS', 50))
+
+    @classmethod
+    def pool_arguments(cls) -> Dict[str, Any]:
+        """Keyword arguments shared by the sync and async pool constructors"""
+        return {
+            'min_size': cls.MIN_SIZE,
+            'max_size': cls.MAX_SIZE,
+            'max_lifetime': cls.MAX_LIFETIME,
+            'max_idle': cls.MAX_IDLE,
+            'timeout': cls.CHECKOUT_TIMEOUT,
+        }
+
+class PoolMonitor:
+    """Checkout telemetry and autoscaling for one connection pool"""
+
+    def __init__(self, name: str, pool=None):
+        self.name = name
+        self.pool = pool
+        # Creation time of every live connection of this pool, keyed by id()
+        self.born = {}
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.window = deque(maxlen=2000)
+        self.last_resize_check = time.monotonic()
+        self.resize_history = deque(maxlen=20)
+
+    def register_connection(self, connection):
+        """Pool ``configure`` callback: remember when a connection was opened"""
+        key = id(connection)
+        self.born[key] = time.monotonic()
+        weakref.finalize(connection, self.born.pop, key, None)
+
+    def record_checkout(self, wait_ms: float, timed_out: bool = False):
+        """Record how long a caller waited for a connection"""
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+                self.in_use += 1
+                self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            self.buckets[bisect.bisect_left(WAIT_BUCKETS_MS, wait_ms)] += 1
+            self.window.append((time.monotonic(), wait_ms))
+            due = time.monotonic() - self.last_resize_check >= PoolConfig.RESIZE_INTERVAL
+
+        if due:
+            self.maybe_resize()
+
+    def record_return(self):
+        """A checked-out connection went back to the pool"""
+        with self.lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def _recent_waits(self) -> List[float]:
+        cutoff = time.monotonic() - PoolConfig.RESIZE_INTERVAL
+        return sorted(wait for stamp, wait in self.window if stamp >= cutoff)
+
+    def maybe_resize(self):
+        """Grow max_size when checkouts queue; shrink back when the pool sits idle"""
+        with self.lock:
+            self.last_resize_check = time.monotonic()
+            waits = self._recent_waits()
+            peak = self.peak_in_use
+            self.peak_in_use = self.in_use
+
+        try:
+            current_min, current_max = self.pool.min_size, self.pool.max_size
+            p95_wait = waits[int(len(waits) * 0.95) - 1] if waits else 0.0
+            step = max(1, current_max // 4)
+            new_max = current_max
+
+            if p95_wait > PoolConfig.WAIT_THRESHOLD_MS and peak >= current_max:
+                new_max = min(PoolConfig.MAX_SIZE_LIMIT, current_max + step)
+            elif p95_wait <= PoolConfig.WAIT_THRESHOLD_MS and peak < current_max // 2:
+                new_max = max(PoolConfig.MAX_SIZE, current_max - step)
+
+            # Keep enough warm connections for the recent peak
+            new_min = min(max(PoolConfig.MIN_SIZE, peak), new_max)
+
+            if (new_min, new_max) != (current_min, current_max):
+                self.pool.resize(min_size=new_min, max_size=new_max)
+                change = {
+                    'timestamp': datetime.now(timezone.utc).isoformat(),
+                    'from': [current_min, current_max],
+                    'to': [new_min, new_max],
+                    'p95_wait_ms': round(p95_wait, 2),
+                    'peak_in_use': peak
+                }
+                self.resize_history.append(change)
+                logger.info(f"Resized {self.name} pool: {change}")
+
+        except Exception as e:
+            logger.error(f"Pool resize error for {self.name}: {e}")
+
+    def connection_ages(self) -> Dict[str, Any]:
+        """Age of live connections in seconds"""
+        now = time.monotonic()
+        ages = [now - born for born in list(self.born.values())]
+        if not ages:
+            return {'count': 0, 'min_s': None, 'avg_s': None, 'max_s': None}
+        return {
+            'count': len(ages),
+            'min_s': round(min(ages), 1),
+            'avg_s': round(sum(ages) / len(ages), 1),
+            'max_s': round(max(ages), 1)
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current telemetry for health endpoints"""
+        stats = {}
+        try:
+            stats = self.pool.get_stats()
+        except Exception:
+            pass
+
+        with self.lock:
+            waits = self._recent_waits()
+            checkouts = self.checkouts
+            in_use = self.in_use
+            data = {
+                'name': self.name,
+                'min_size': self.pool.min_size,
+                'max_size': self.pool.max_size,
+                'max_size_limit': PoolConfig.MAX_SIZE_LIMIT,
+                'in_use': in_use,
+                'saturation': round(in_use / self.pool.max_size, 3) if self.pool.max_size else 0,
+                'checkouts': checkouts,
+                'checkout_timeouts': self.timeouts,
+                'avg_wait_ms': round(self.total_wait_ms / checkouts, 2) if checkouts else 0,
+                'max_wait_ms': round(self.max_wait_ms, 2),
+                'recent_p95_wait_ms': round(waits[int(len(waits) * 0.95) - 1], 2) if waits else 0,
+                'wait_histogram': dict(zip([str(b) for b in WAIT_BUCKETS_MS] + ['+Inf'], self.buckets)),
+                'resize_history': list(self.resize_history)
+            }
+
+        data.update({
+            'pool_size': stats.get('pool_size'),
+            'pool_available': stats.get('pool_available'),
+            'requests_waiting': stats.get('requests_waiting'),
+            'connections_lost': stats.get('connections_lost'),
+            'connection_age': self.connection_ages(),
+            'max_lifetime_s': PoolConfig.MAX_LIFETIME
+        })
+        return data
+
+    def prometheus_metrics(self) -> str:
+        """Pool gauges and wait histogram in Prometheus text format"""
+        snap = self.snapshot()
+        label = f'pool="{self.name}"'
+        lines = [
+            f'app_db_pool_size{{{label}}} {snap["pool_size"] or 0}',
+            f'app_db_pool_max_size{{{label}}} {snap["max_size"]}',
+            f'app_db_pool_in_use{{{label}}} {snap["in_use"]}',
+            f'app_db_pool_saturation{{{label}}} {snap["saturation"]}',
+            f'app_db_pool_requests_waiting{{{label}}} {snap["requests_waiting"] or 0}',
+            f'app_db_pool_checkout_timeouts_total{{{label}}} {snap["checkout_timeouts"]}',
+        ]
+        cumulative = 0
+        for bound, count in snap['wait_histogram'].items():
+            cumulative += count
+            lines.append(f'app_db_pool_wait_ms_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f'app_db_pool_wait_ms_count{{{label}}} {cumulative}')
+        return "\n".join(lines) + "\n"
@@ -1,50 +1,69 @@
 from datetime import datetime, timedelta
-from database.connection_v3 import execute_query
+from database.connection_v3 import execute_query, execute_batch_queries, stream_query, copy_columns
+from database.dimension_catalog import dimension_catalog
+from database.rollups import time_rollups
+from database.pagination import cursor_scope, decode_cursor, keyset_predicate, keyset_order, paginate
+from database.periods import period_filter
 import logging
 
 logger = logging.getLogger(__name__)
 
-def get_sucursales_list():
-    """Get list of all unique sucursales."""
+# Columns loaded by load_supervision_snapshot unless a projection is given
+SNAPSHOT_COLUMNS = (
+    'submission_id', 'sucursal_clean', 'grupo_operativo', 'area_evaluacion',
+    'estado', 'municipio', 'fecha_supervision', 'porcentaje', 'latitud', 'longitud'
+)
+
+# Unique sort key of detail rows (newest first) used for keyset pagination.
+# Keyset pages exclude rows with a NULL key column: the row comparison would
+# be NULL for them, so pages would skip them unpredictably.
+DETAIL_KEY_COLUMNS = ('fecha_supervision', 'submission_id', 'area_evaluacion')
+DETAIL_KEY_CONDITIONS = [f"{column} IS NOT NULL" for column in DETAIL_KEY_COLUMNS]
+
+def heatmap_query(quarter=None, year=None, estado=None, grupo=None, limit=5000):
+    """SQL and params of the heatmap point listing (one point per evaluation)."""
     query = """
-        SELECT DISTINCT sucursal_clean 
-        FROM supervision_operativa_detalle 
-        WHERE sucursal_clean IS NOT NULL 
-        ORDER BY sucursal_clean;
+        SELECT 
+            latitud,
+            longitud,
+            CAST(porcentaje AS NUMERIC) as porcentaje,
+            sucursal_clean,
+            estado,
+            fecha_supervision
+        FROM supervision_operativa_detalle
+        WHERE latitud IS NOT NULL 
+          AND longitud IS NOT NULL 
+          AND porcentaje IS NOT NULL
+          AND fecha_supervision IS NOT NULL
     """
     
-    results = execute_query(query)
-    if results:
-        return [row['sucursal_clean'] for row in results]
-    return []
+    period_sql, params = period_filter(quarter, year)
+    query += period_sql
+    
+    if estado:
+        query += " AND estado = %s"
+        params.append(estado)
+    
+    if grupo:
+        query += " AND grupo_operativo = %s"
+        params.append(grupo)
+    
+    query += " LIMIT %s;"
+    params.append(limit)
+    
+    return query, params
+
+def get_sucursales_list():
+    """Get list of all unique sucursales."""
+    return dimension_catalog.values('sucursal')
 
 def get_grupos_operativos():
     """Get list of all unique grupos operativos."""
-    query = """
-        SELECT DISTINCT grupo_operativo 
-        FROM supervision_operativa_detalle 
-        WHERE grupo_operativo IS NOT NULL 
-        ORDER BY grupo_operativo;
-    """
-    
-    results = execute_query(query)
-    if results:
-        return [row['grupo_operativo'] for row in results]
-    return []
+    return dimension_catalog.values('grupo')
 
 def get_areas_evaluacion():
     """Get list of all unique areas de evaluacion."""
-    query = """
-        SELECT DISTINCT area_evaluacion 
-        FROM supervision_operativa_detalle 
-        WHERE area_evaluacion IS NOT NULL 
-        ORDER BY area_evaluacion;
-    """
-    
-    results = execute_query(query)
-    if results:
-        return [row['area_evaluacion'] for row in results]
-    return []
+    return dimension_catalog.values('area')
 
 def get_summary_stats():
     """Get general summary statistics."""
@@ -59,34 +78,69 @@ def get_summary_stats():
         WHERE porcentaje IS NOT NULL;
     """
     
-    results = execute_query(query)
+    # Get top sucursales
+    top_query = """
+        SELECT 
+            sucursal_clean as sucursal,
+            AVG(porcentaje) as promedio
+        FROM supervision_operativa_detalle
+        WHERE porcentaje IS NOT NULL
+        GROUP BY sucursal_clean
+        ORDER BY promedio DESC
+        LIMIT 5;
+    """
+    
+    # Both queries go out in one pipelined round trip
+    results, top_results = execute_batch_queries([(query, None), (top_query, None)])
     if results and len(results) > 0:
         stats = results[0]
         
-        # Get top sucursales
-        top_query = """
-            SELECT 
-                sucursal_clean as sucursal,
-                AVG(porcentaje) as promedio
-            FROM supervision_operativa_detalle
-            WHERE porcentaje IS NOT NULL
-            GROUP BY sucursal_clean
-            ORDER BY promedio DESC
-            LIMIT 5;
-        """
-        
-        top_results = execute_query(top_query)
         if top_results:
             stats['top_sucursales'] = top_results
         
         return stats
     return None
 
-def get_metrics_by_sucursal(sucursal=None, fecha_inicio=None, fecha_fin=None):
-    """Get metrics filtered by sucursal and date range."""
+def load_supervision_snapshot(columns=SNAPSHOT_COLUMNS, fecha_inicio=None, fecha_fin=None, row_format='columns'):
+    """
+    Load a column projection of the whole table via binary COPY.
+    
+    Meant for in-process aggregation, cache warmup and replica jobs that
+    need every row; returns ``{column: values}`` (see ``copy_columns``).
+    """
+    unknown = set(columns) - set(SNAPSHOT_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown snapshot columns: {sorted(unknown)}")
+    
     where_conditions = ["porcentaje IS NOT NULL"]
     params = []
     
+    if fecha_inicio:
+        where_conditions.append("fecha_supervision >= %s")
+        params.append(fecha_inicio)
+    
+    if fecha_fin:
+        where_conditions.append("fecha_supervision <= %s")
+        params.append(fecha_fin)
+    
+    query = f"""
+        SELECT {', '.join(columns)}
+        FROM supervision_operativa_detalle
+        WHERE {' AND '.join(where_conditions)}
+    """
+    
+    return copy_columns(query, params or None, row_format=row_format)
+
+def iter_metrics_by_sucursal(sucursal=None, fecha_inicio=None, fecha_fin=None, limit=None, after=None, keyed=False):
+    """
+    Stream metrics filtered by sucursal and date range, newest first.
+    
+    ``keyed`` restricts the rows to those with a complete DETAIL_KEY_COLUMNS
+    key, as keyset pages need; ``after`` then resumes past that key.
+    """
+    where_conditions = ["porcentaje IS NOT NULL", *(DETAIL_KEY_CONDITIONS if keyed else [])]
+    params = []
+    
     if sucursal:
         where_conditions.append("sucursal_clean = %s")
         params.append(sucursal)
@@ -99,6 +153,11 @@ def get_metrics_by_sucursal(sucursal=None, fecha_inicio=None, fecha_fin=None):
         where_conditions.append("fecha_supervision <= %s")
         params.append(fecha_fin)
     
+    keyset_sql, keyset_params = keyset_predicate(DETAIL_KEY_COLUMNS, after)
+    if keyset_sql:
+        where_conditions.append(keyset_sql)
+        params.extend(keyset_params)
+    
     query = f"""
         SELECT 
             submission_id,
@@ -109,14 +168,37 @@ def get_metrics_by_sucursal(sucursal=None, fecha_inicio=None, fecha_fin=None):
             porcentaje
         FROM supervision_operativa_detalle
         WHERE {' AND '.join(where_conditions)}
-        ORDER BY fecha_supervision DESC, sucursal_clean
-        LIMIT 1000;
+        ORDER BY {keyset_order(DETAIL_KEY_COLUMNS)}
     """
     
-    results = execute_query(query, params)
-    if results:
-        return results
-    return []
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    
+    return stream_query(query, params)
+
+def get_metrics_by_sucursal(sucursal=None, fecha_inicio=None, fecha_fin=None, limit=1000):
+    """Get metrics filtered by sucursal and date range."""
+    try:
+        return list(iter_metrics_by_sucursal(sucursal, fecha_inicio, fecha_fin, limit))
+    except Exception as e:
+        logger.error(f"Error getting metrics by sucursal: {e}")
+        return []
+
+def get_metrics_by_sucursal_page(sucursal=None, fecha_inicio=None, fecha_fin=None, page_size=1000, cursor=None):
+    """
+    One keyset page of ``get_metrics_by_sucursal``.
+    
+    Returns ``{'data': rows, 'next_cursor': token}``; pass the token back
+    as ``cursor`` for the following page (None once the history is exhausted).
+    Raises InvalidCursor for a token issued for different filters.
+    """
+    scope = cursor_scope('metrics_by_sucursal', sucursal=sucursal, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+    after = decode_cursor(cursor, scope) if cursor else None
+    
+    rows = list(iter_metrics_by_sucursal(sucursal, fecha_inicio, fecha_fin, page_size + 1, after, keyed=True))
+    page, next_cursor = paginate(rows, page_size, DETAIL_KEY_COLUMNS, scope)
+    return {'data': page, 'next_cursor': next_cursor}
 
 def get_performance_by_sucursal(fecha_inicio=None, fecha_fin=None):
     """Get average performance by sucursal."""
@@ -209,8 +291,80 @@ def get_performance_by_area(fecha_inicio=None, fecha_fin=None):
         return results
     return []
 
-def get_trends_by_date(fecha_inicio=None, fecha_fin=None, sucursal=None):
-    """Get trends over time."""
+# GROUPING(sucursal_clean, grupo_operativo, area_evaluacion) bitmask of each
+# grouping set: a 1 bit marks a column rolled up in that row
+ROLLUP_DIMENSIONS = {
+    0b011: ('sucursal', 'sucursal_clean'),
+    0b101: ('grupo', 'grupo_operativo'),
+    0b110: ('area', 'area_evaluacion'),
+}
+
+def get_performance_rollup(fecha_inicio=None, fecha_fin=None):
+    """
+    Performance by sucursal, grupo and area plus the overall total in one scan.
+    
+    Returns ``{'sucursal': [...], 'grupo': [...], 'area': [...], 'total': {...}}``;
+    each breakdown is sorted by ``promedio`` descending and carries the
+    same columns as the per-dimension ``get_performance_by_*`` functions.
+    """
+    where_conditions = ["porcentaje IS NOT NULL"]
+    params = []
+    
+    if fecha_inicio:
+        where_conditions.append("fecha_supervision >= %s")
+        params.append(fecha_inicio)
+    
+    if fecha_fin:
+        where_conditions.append("fecha_supervision <= %s")
+        params.append(fecha_fin)
+    
+    query = f"""
+        SELECT 
+            GROUPING(sucursal_clean, grupo_operativo, area_evaluacion) as grouping_id,
+            sucursal_clean,
+            grupo_operativo,
+            area_evaluacion,
+            AVG(porcentaje) as promedio,
+            COUNT(*) as total_evaluaciones,
+            COUNT(DISTINCT sucursal_clean) as total_sucursales,
+            MAX(porcentaje) as max_porcentaje,
+            MIN(porcentaje) as min_porcentaje
+        FROM supervision_operativa_detalle
+        WHERE {' AND '.join(where_conditions)}
+        GROUP BY GROUPING SETS ((sucursal_clean), (grupo_operativo), (area_evaluacion), ())
+        ORDER BY promedio DESC;
+    """
+    
+    rollup = {name: [] for name, _ in ROLLUP_DIMENSIONS.values()}
+    rollup['total'] = None
+    
+    results = execute_query(query, params)
+    for row in results or []:
+        grouping_id = row.pop('grouping_id')
+        if grouping_id == 0b111:
+            rollup['total'] = {key: row[key] for key in ('promedio', 'total_evaluaciones', 'total_sucursales', 'max_porcentaje', 'min_porcentaje')}
+            continue
+        
+        name, column = ROLLUP_DIMENSIONS[grouping_id]
+        row = {key: value for key, value in row.items() if key == column or key not in ('sucursal_clean', 'grupo_operativo', 'area_evaluacion')}
+        rollup[name].append(row)
+    
+    return rollup
+
+def get_trends_by_date(fecha_inicio=None, fecha_fin=None, sucursal=None, granularity='day'):
+    """Get trends over time per day, week, month or quarter."""
+    rollup_rows = time_rollups.trends(granularity, fecha_inicio, fecha_fin, sucursal=sucursal)
+    if rollup_rows is not None:
+        return [
+            {
+                'fecha_supervision': row['fecha'],
+                'promedio_dia': row['promedio'],
+                'evaluaciones_dia': row['evaluaciones'],
+                'sucursales_dia': row['sucursales']
+            }
+            for row in rollup_rows
+        ]
+    
     where_conditions = ["porcentaje IS NOT NULL"]
     params = []
     
@@ -228,14 +382,14 @@ def get_trends_by_date(fecha_inicio=None, fecha_fin=None, sucursal=None):
     
     query = f"""
         SELECT 
-            fecha_supervision,
+            DATE_TRUNC('{granularity}', fecha_supervision)::date as fecha_supervision,
             AVG(porcentaje) as promedio_dia,
             COUNT(*) as evaluaciones_dia,
             COUNT(DISTINCT sucursal_clean) as sucursales_dia
         FROM supervision_operativa_detalle
         WHERE {' AND '.join(where_conditions)}
-        GROUP BY fecha_supervision
-        ORDER BY fecha_supervision;
+        GROUP BY 1
+        ORDER BY 1;
     """
     
     results = execute_query(query, params)
@@ -243,9 +397,9 @@ def get_trends_by_date(fecha_inicio=None, fecha_fin=None, sucursal=None):
         return results
     return []
 
-def get_detailed_performance(sucursal=None, grupo=None, area=None, fecha_inicio=None, fecha_fin=None):
-    """Get detailed performance with all filters."""
-    where_conditions = ["porcentaje IS NOT NULL"]
+def iter_detailed_performance(sucursal=None, grupo=None, area=None, fecha_inicio=None, fecha_fin=None, limit=None, after=None, keyed=False):
+    """Stream detailed performance rows with all filters, newest first (``keyed``/``after`` as in ``iter_metrics_by_sucursal``)."""
+    where_conditions = ["porcentaje IS NOT NULL", *(DETAIL_KEY_CONDITIONS if keyed else [])]
     params = []
     
     if sucursal:
@@ -268,6 +422,11 @@ def get_detailed_performance(sucursal=None, grupo=None, area=None, fecha_inicio=
         where_conditions.append("fecha_supervision <= %s")
         params.append(fecha_fin)
     
+    keyset_sql, keyset_params = keyset_predicate(DETAIL_KEY_COLUMNS, after)
+    if keyset_sql:
+        where_conditions.append(keyset_sql)
+        params.extend(keyset_params)
+    
     query = f"""
         SELECT 
             submission_id,
@@ -278,11 +437,29 @@ def get_detailed_performance(sucursal=None, grupo=None, area=None, fecha_inicio=
             porcentaje
         FROM supervision_operativa_detalle
         WHERE {' AND '.join(where_conditions)}
-        ORDER BY fecha_supervision DESC, sucursal_clean, area_evaluacion
-        LIMIT 1000;
+        ORDER BY {keyset_order(DETAIL_KEY_COLUMNS)}
     """
     
-    results = execute_query(query, params)
-    if results:
-        return results
-    return []
\ No newline at end of file
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit)
+    
+    return stream_query(query, params)
+
+def get_detailed_performance(sucursal=None, grupo=None, area=None, fecha_inicio=None, fecha_fin=None, limit=1000):
+    """Get detailed performance with all filters."""
+    try:
+        return list(iter_detailed_performance(sucursal, grupo, area, fecha_inicio, fecha_fin, limit))
+    except Exception as e:
+        logger.error(f"Error getting detailed performance: {e}")
+        return []
+
+def get_detailed_performance_page(sucursal=None, grupo=None, area=None, fecha_inicio=None, fecha_fin=None, page_size=1000, cursor=None):
+    """One keyset page of ``get_detailed_performance`` (see ``get_metrics_by_sucursal_page``)."""
+    scope = cursor_scope('detailed_performance', sucursal=sucursal, grupo=grupo, area=area,
+                         fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+    after = decode_cursor(cursor, scope) if cursor else None
+    
+    rows = list(iter_detailed_performance(sucursal, grupo, area, fecha_inicio, fecha_fin, page_size + 1, after, keyed=True))
+    page, next_cursor = paginate(rows, page_size, DETAIL_KEY_COLUMNS, scope)
+    return {'data': page, 'next_cursor': next_cursor}
@@ -0,0 +1,241 @@
+"""
+Per-query latency instrumentation for the connection layer.
+Aggregates duration, row count and payload size by normalized SQL fingerprint.
+"""
+
+import re
+import bisect
+import hashlib
+import logging
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in milliseconds (the last bucket is +Inf)
+DURATION_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# Rows inspected when estimating payload size; larger results are extrapolated
+PAYLOAD_SAMPLE_ROWS = 200
+
+# Distinct parameter sets kept per read fingerprint for EXPLAIN-based analysis
+PARAM_SAMPLES = 3
+
+_COMMENT_RE = re.compile(r'--[^\n]*')
+_STRING_RE = re.compile(r"'(?:''|[^'])*'")
+_PLACEHOLDER_RE = re.compile(r'%(?:\([^)]+\))?s')
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+@lru_cache(maxsize=1024)
+def normalize_sql(query: str) -> str:
+    """Strip literals, placeholders and formatting so equivalent statements compare equal."""
+    normalized = _COMMENT_RE.sub(' ', query)
+    normalized = _STRING_RE.sub('?', normalized)
+    normalized = _PLACEHOLDER_RE.sub('?', normalized)
+    normalized = _NUMBER_RE.sub('?', normalized)
+    normalized = _IN_LIST_RE.sub('(?)', normalized)
+    normalized = _WHITESPACE_RE.sub(' ', normalized).strip().rstrip(';').strip()
+    return normalized
+
+@lru_cache(maxsize=1024)
+def fingerprint_sql(query: str) -> str:
+    """Short stable identifier for a normalized statement."""
+    return hashlib.md5(normalize_sql(query).encode()).hexdigest()[:12]
+
+def estimate_payload_bytes(pgresult) -> int:
+    """
+    Estimate the wire size of a result from its value lengths.
+
+    Only the first ``PAYLOAD_SAMPLE_ROWS`` rows are measured; the total is
+    extrapolated so large results do not pay a per-cell cost.
+    """
+    if pgresult is None:
+        return 0
+
+    ntuples = pgresult.ntuples
+    nfields = pgresult.nfields
+    if not ntuples or not nfields:
+        return 0
+
+    sampled = min(ntuples, PAYLOAD_SAMPLE_ROWS)
+    sample_bytes = sum(
+        pgresult.get_length(row, col)
+        for row in range(sampled)
+        for col in range(nfields)
+    )
+    return int(sample_bytes * ntuples / sampled)
+
+class QueryStats:
+    """Running statistics for a single query fingerprint"""
+
+    def __init__(self, fingerprint: str, sql: str):
+        self.fingerprint = fingerprint
+        self.sql = sql
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.total_rows = 0
+        self.total_bytes = 0
+        self.buckets = [0] * (len(DURATION_BUCKETS_MS) + 1)
+        self.last_called = None
+        # Executable statements with representative parameters (reads only)
+        self.samples = deque(maxlen=PARAM_SAMPLES)
+
+    def add_sample(self, query: str, params):
+        """Keep ``query``/``params`` as a representative execution if not seen yet"""
+        sample = (query, params)
+        if sample not in self.samples:
+            self.samples.append(sample)
+
+    def record(self, duration_ms: float, rows: int, payload_bytes: int, error: bool):
+        """Add one execution to the aggregate"""
+        self.calls += 1
+        self.errors += 1 if error else 0
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.total_rows += rows
+        self.total_bytes += payload_bytes
+        self.buckets[bisect.bisect_left(DURATION_BUCKETS_MS, duration_ms)] += 1
+        self.last_called = datetime.now(timezone.utc)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Approximate a latency percentile from the histogram (bucket upper bound)"""
+        if not self.calls:
+            return None
+
+        target = self.calls * fraction
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                return DURATION_BUCKETS_MS[index] if index < len(DURATION_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializable summary"""
+        return {
+            'fingerprint': self.fingerprint,
+            'sql': self.sql[:500],
+            'calls': self.calls,
+            'errors': self.errors,
+            'total_ms': round(self.total_ms, 2),
+            'avg_ms': round(self.total_ms / self.calls, 2) if self.calls else 0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'max_ms': round(self.max_ms, 2),
+            'total_rows': self.total_rows,
+            'avg_rows': round(self.total_rows / self.calls, 1) if self.calls else 0,
+            'total_payload_bytes': self.total_bytes,
+            'last_called': self.last_called.isoformat() if self.last_called else None
+        }
+
+class QueryMetricsCollector:
+    """Aggregate query executions by fingerprint for monitoring"""
+
+    def __init__(self):
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.started_at = datetime.now(timezone.utc)
+
+    def record(self, query: str, duration_ms: float, rows: int = 0, payload_bytes: int = 0, error: bool = False, params=None):
+        """Record one execution of ``query`` (``params`` are sampled for read statements)"""
+        try:
+            fingerprint = fingerprint_sql(query)
+            with self.lock:
+                stats = self.stats.get(fingerprint)
+                if stats is None:
+                    stats = self.stats[fingerprint] = QueryStats(fingerprint, normalize_sql(query))
+                stats.record(duration_ms, rows, payload_bytes, error)
+                if not error and stats.sql.split(' ', 1)[0].upper() in ('SELECT', 'WITH'):
+                    stats.add_sample(query, params)
+        except Exception as e:
+            # Instrumentation must never break query execution
+            logger.debug(f"Query metrics record error: {e}")
+
+    def top_queries(self, limit: int = 20, order_by: str = 'total_ms') -> List[Dict[str, Any]]:
+        """Fingerprints sorted by ``order_by`` (descending)"""
+        with self.lock:
+            summaries = [stats.to_dict() for stats in self.stats.values()]
+        summaries.sort(key=lambda item: item.get(order_by) or 0, reverse=True)
+        return summaries[:limit]
+
+    def workload(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Read fingerprints by cumulative time, with their sampled executions"""
+        with self.lock:
+            entries = [
+                {'stats': stats.to_dict(), 'samples': list(stats.samples)}
+                for stats in self.stats.values() if stats.samples
+            ]
+        entries.sort(key=lambda item: item['stats']['total_ms'], reverse=True)
+        return entries[:limit]
+
+    def get_summary(self) -> Dict[str, Any]:
+        """Totals across every fingerprint"""
+        with self.lock:
+            calls = sum(stats.calls for stats in self.stats.values())
+            total_ms = sum(stats.total_ms for stats in self.stats.values())
+            errors = sum(stats.errors for stats in self.stats.values())
+            fingerprints = len(self.stats)
+
+        return {
+            'fingerprints': fingerprints,
+            'total_calls': calls,
+            'total_errors': errors,
+            'total_ms': round(total_ms, 2),
+            'collecting_since': self.started_at.isoformat()
+        }
+
+    def reset(self):
+        """Drop all collected statistics"""
+        with self.lock:
+            self.stats.clear()
+            self.started_at = datetime.now(timezone.utc)
+
+    def prometheus_metrics(self) -> str:
+        """Histogram and counters in Prometheus text exposition format"""
+        with self.lock:
+            snapshot = [
+                (stats.fingerprint, list(stats.buckets), stats.total_ms, stats.calls, stats.total_rows, stats.total_bytes, stats.errors)
+                for stats in self.stats.values()
+            ]
+
+        lines = [
+            "# HELP app_db_query_duration_ms Query execution time by fingerprint",
+            "# TYPE app_db_query_duration_ms histogram"
+        ]
+        for fingerprint, buckets, total_ms, calls, _, _, _ in snapshot:
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS_MS + ['+Inf'], buckets):
+                cumulative += count
+                lines.append(f'app_db_query_duration_ms_bucket{{fingerprint="{fingerprint}",le="{bound}"}} {cumulative}')
+            lines.append(f'app_db_query_duration_ms_sum{{fingerprint="{fingerprint}"}} {round(total_ms, 3)}')
+            lines.append(f'app_db_query_duration_ms_count{{fingerprint="{fingerprint}"}} {calls}')
+
+        lines.append("")
+        lines.append("# HELP app_db_query_rows_total Rows returned by fingerprint")
+        lines.append("# TYPE app_db_query_rows_total counter")
+        for fingerprint, _, _, _, rows, _, _ in snapshot:
+            lines.append(f'app_db_query_rows_total{{fingerprint="{fingerprint}"}} {rows}')
+
+        lines.append("")
+        lines.append("# HELP app_db_query_payload_bytes_total Estimated result payload by fingerprint")
+        lines.append("# TYPE app_db_query_payload_bytes_total counter")
+        for fingerprint, _, _, _, _, payload, _ in snapshot:
+            lines.append(f'app_db_query_payload_bytes_total{{fingerprint="{fingerprint}"}} {payload}')
+
+        lines.append("")
+        lines.append("# HELP app_db_query_errors_total Failed executions by fingerprint")
+        lines.append("# TYPE app_db_query_errors_total counter")
+        for fingerprint, _, _, _, _, _, errors in snapshot:
+            lines.append(f'app_db_query_errors_total{{fingerprint="{fingerprint}"}} {errors}')
+
+        return "\n".join(lines) + "\n"
+
+# Global query metrics instance
+query_metrics = QueryMetricsCollector()
@@ -0,0 +1,518 @@
+"""
+Incremental rollups of supervision_operativa_detalle.
+Day, week, month and quarter tables keyed by estado/grupo/sucursal/area, and
+a per-sucursal, per-quarter geo table, hold mergeable aggregates (count, sum,
+sum of squares, min, max). New detail rows are folded in from a watermark
+instead of rebuilding, so trend and map queries read a few hundred rollup
+rows instead of scanning every detail row.
+
+The watermark also stores the source's cumulative insert/update/delete
+counters. Whenever they show anything but appends past the watermark
+(updates, deletes, back-dated or same-date inserts, a statistics reset)
+the rollups are recomputed into shadow tables and swapped in.
+"""
+
+import os
+import time
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from .connection_v3 import execute_query, get_db_connection, return_db_connection
+from .dimension_catalog import WATERMARK_QUERY as SOURCE_WATERMARK_QUERY
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ('day', 'week', 'month', 'quarter')
+
+# Seconds between readiness probes while the rollups are not populated yet
+READY_CHECK_INTERVAL = 60
+
+# Seconds a freshness check (watermark vs. source counters) is reused
+FRESHNESS_CHECK_INTERVAL = int(os.getenv('ROLLUP_FRESHNESS_CHECK_INTERVAL', 30))
+
+# Fail the shadow table swap fast instead of queueing (and blocking reads) behind long queries
+SWAP_LOCK_TIMEOUT = os.getenv('ROLLUP_SWAP_LOCK_TIMEOUT', '5s')
+
+WATERMARK_NAME = 'supervision_time_rollups'
+GEO_WATERMARK_NAME = 'supervision_geo_rollup'
+
+ROLLUP_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS rollup_supervision_{grain} (
+        bucket DATE NOT NULL,
+        estado TEXT NOT NULL DEFAULT '',
+        grupo_operativo TEXT NOT NULL DEFAULT '',
+        sucursal_clean TEXT NOT NULL DEFAULT '',
+        area_evaluacion TEXT NOT NULL DEFAULT '',
+        evaluaciones BIGINT NOT NULL,
+        suma NUMERIC NOT NULL,
+        suma_cuadrados NUMERIC NOT NULL,
+        minimo NUMERIC,
+        maximo NUMERIC,
+        PRIMARY KEY (bucket, estado, grupo_operativo, sucursal_clean, area_evaluacion)
+    );
+"""
+
+WATERMARK_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS rollup_watermarks (
+        name TEXT PRIMARY KEY,
+        max_fecha TIMESTAMP,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+"""
+
+# Source insert and update+delete counters as of the last fold
+WATERMARK_COUNTERS_SQL = """
+    ALTER TABLE rollup_watermarks
+        ADD COLUMN IF NOT EXISTS inserts BIGINT,
+        ADD COLUMN IF NOT EXISTS changes BIGINT;
+"""
+
+# Definition (without name) and name of every index on a table
+INDEX_DEFINITIONS_SQL = """
+    SELECT c.relname as name, regexp_replace(pg_get_indexdef(i.indexrelid), '^.* USING ', '') as definition
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE i.indrelid = %s::regclass;
+"""
+
+# NULL dimensions are stored as '' so they take part in the primary key.
+# {target} is the rollup table, or its shadow copy during a rebuild.
+UPSERT_SQL = """
+    INSERT INTO {target} AS r
+        (bucket, estado, grupo_operativo, sucursal_clean, area_evaluacion,
+         evaluaciones, suma, suma_cuadrados, minimo, maximo)
+    SELECT
+        DATE_TRUNC('{grain}', fecha_supervision)::date,
+        COALESCE(estado, ''),
+        COALESCE(grupo_operativo, ''),
+        COALESCE(sucursal_clean, ''),
+        COALESCE(area_evaluacion, ''),
+        COUNT(*),
+        SUM(CAST(porcentaje AS NUMERIC)),
+        SUM(CAST(porcentaje AS NUMERIC) * CAST(porcentaje AS NUMERIC)),
+        MIN(CAST(porcentaje AS NUMERIC)),
+        MAX(CAST(porcentaje AS NUMERIC))
+    FROM supervision_operativa_detalle
+    WHERE porcentaje IS NOT NULL
+      AND fecha_supervision IS NOT NULL
+      AND fecha_supervision <= %s
+      {lower_bound}
+    GROUP BY 1, 2, 3, 4, 5
+    ON CONFLICT (bucket, estado, grupo_operativo, sucursal_clean, area_evaluacion) DO UPDATE SET
+        evaluaciones = r.evaluaciones + EXCLUDED.evaluaciones,
+        suma = r.suma + EXCLUDED.suma,
+        suma_cuadrados = r.suma_cuadrados + EXCLUDED.suma_cuadrados,
+        minimo = LEAST(r.minimo, EXCLUDED.minimo),
+        maximo = GREATEST(r.maximo, EXCLUDED.maximo);
+"""
+
+# Latest coordinates and dimensions per sucursal and quarter; sums keep merging
+GEO_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS rollup_geo_sucursal (
+        year INT NOT NULL,
+        quarter INT NOT NULL,
+        sucursal_clean TEXT NOT NULL,
+        estado TEXT,
+        grupo_operativo TEXT,
+        municipio TEXT,
+        latitud NUMERIC NOT NULL,
+        longitud NUMERIC NOT NULL,
+        evaluaciones BIGINT NOT NULL,
+        supervisiones BIGINT NOT NULL,
+        suma NUMERIC NOT NULL,
+        suma_cuadrados NUMERIC NOT NULL,
+        minimo NUMERIC,
+        maximo NUMERIC,
+        ultima_supervision TIMESTAMP NOT NULL,
+        PRIMARY KEY (year, quarter, sucursal_clean)
+    );
+"""
+
+GEO_UPSERT_SQL = """
+    INSERT INTO {target} AS r
+        (year, quarter, sucursal_clean, estado, grupo_operativo, municipio, latitud, longitud,
+         evaluaciones, supervisiones, suma, suma_cuadrados, minimo, maximo, ultima_supervision)
+    SELECT
+        EXTRACT(YEAR FROM fecha_supervision)::int,
+        EXTRACT(QUARTER FROM fecha_supervision)::int,
+        sucursal_clean,
+        (ARRAY_AGG(estado ORDER BY fecha_supervision DESC))[1],
+        (ARRAY_AGG(grupo_operativo ORDER BY fecha_supervision DESC))[1],
+        (ARRAY_AGG(municipio ORDER BY fecha_supervision DESC))[1],
+        (ARRAY_AGG(latitud ORDER BY fecha_supervision DESC))[1],
+        (ARRAY_AGG(longitud ORDER BY fecha_supervision DESC))[1],
+        COUNT(*),
+        COUNT(DISTINCT submission_id),
+        SUM(CAST(porcentaje AS NUMERIC)),
+        SUM(CAST(porcentaje AS NUMERIC) * CAST(porcentaje AS NUMERIC)),
+        MIN(CAST(porcentaje AS NUMERIC)),
+        MAX(CAST(porcentaje AS NUMERIC)),
+        MAX(fecha_supervision)
+    FROM supervision_operativa_detalle
+    WHERE porcentaje IS NOT NULL
+      AND latitud IS NOT NULL
+      AND longitud IS NOT NULL
+      AND sucursal_clean IS NOT NULL
+      AND fecha_supervision IS NOT NULL
+      AND fecha_supervision <= %s
+      {lower_bound}
+    GROUP BY 1, 2, 3
+    ON CONFLICT (year, quarter, sucursal_clean) DO UPDATE SET
+        estado = CASE WHEN EXCLUDED.ultima_supervision >= r.ultima_supervision THEN EXCLUDED.estado ELSE r.estado END,
+        grupo_operativo = CASE WHEN EXCLUDED.ultima_supervision >= r.ultima_supervision THEN EXCLUDED.grupo_operativo ELSE r.grupo_operativo END,
+        municipio = CASE WHEN EXCLUDED.ultima_supervision >= r.ultima_supervision THEN EXCLUDED.municipio ELSE r.municipio END,
+        latitud = CASE WHEN EXCLUDED.ultima_supervision >= r.ultima_supervision THEN EXCLUDED.latitud ELSE r.latitud END,
+        longitud = CASE WHEN EXCLUDED.ultima_supervision >= r.ultima_supervision THEN EXCLUDED.longitud ELSE r.longitud END,
+        evaluaciones = r.evaluaciones + EXCLUDED.evaluaciones,
+        supervisiones = r.supervisiones + EXCLUDED.supervisiones,
+        suma = r.suma + EXCLUDED.suma,
+        suma_cuadrados = r.suma_cuadrados + EXCLUDED.suma_cuadrados,
+        minimo = LEAST(r.minimo, EXCLUDED.minimo),
+        maximo = GREATEST(r.maximo, EXCLUDED.maximo),
+        ultima_supervision = GREATEST(r.ultima_supervision, EXCLUDED.ultima_supervision);
+"""
+
+# Rollup row filters, mapped to their rollup columns
+FILTER_COLUMNS = {
+    'estado': 'estado',
+    'grupo': 'grupo_operativo',
+    'sucursal': 'sucursal_clean',
+    'area': 'area_evaluacion',
+}
+
+def bucket_start(value, granularity: str) -> date:
+    """First day of the ``granularity`` bucket containing ``value``"""
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    if isinstance(value, datetime):
+        value = value.date()
+
+    if granularity == 'week':
+        return value - timedelta(days=value.weekday())
+    if granularity == 'month':
+        return value.replace(day=1)
+    if granularity == 'quarter':
+        return value.replace(month=3 * ((value.month - 1) // 3) + 1, day=1)
+    return value
+
+def _rebuild_reason(stored: Dict[str, Any], current: Dict[str, Any]) -> Optional[str]:
+    """Why the stored watermark cannot be advanced by appending, or None"""
+    if stored['max_fecha'] is None or stored['inserts'] is None or stored['changes'] is None:
+        return 'no watermark'
+    if current['inserts'] < stored['inserts'] or current['changes'] < stored['changes']:
+        # Statistics were reset (crash, failover or pg_stat_reset)
+        return 'statistics reset'
+    if current['changes'] != stored['changes']:
+        return 'updated or deleted rows'
+    if current['max_fecha'] is None or current['max_fecha'] < stored['max_fecha']:
+        return 'latest rows deleted'
+    return None
+
+def _swap_in(conn, table: str, staging: str):
+    """Replace ``table`` with its rebuilt ``staging`` copy, keeping index and constraint names"""
+    names = {row['definition']: row['name'] for row in conn.execute(INDEX_DEFINITIONS_SQL, [table]).fetchall()}
+    staged = conn.execute(INDEX_DEFINITIONS_SQL, [staging]).fetchall()
+    conn.execute(f"DROP TABLE {table};")
+    conn.execute(f"ALTER TABLE {staging} RENAME TO {table};")
+    for row in staged:
+        if row['definition'] in names:
+            conn.execute(f"ALTER INDEX {row['name']} RENAME TO {names[row['definition']]};")
+
+def _refold(conn, upserts: Dict[str, str], current) -> Dict[str, int]:
+    """Recompute every table of ``upserts`` into a shadow copy and swap it in"""
+    upserted = {}
+    for table, sql in upserts.items():
+        staging = f"{table}__new"
+        conn.execute(f"DROP TABLE IF EXISTS {staging};")
+        conn.execute(f"CREATE TABLE {staging} (LIKE {table} INCLUDING ALL);")
+        if current is not None:
+            upserted[table] = conn.execute(sql.format(target=staging, lower_bound=''), [current]).rowcount
+
+    # Readers keep using the old tables until here; the swap itself only needs a brief exclusive lock
+    conn.execute("SELECT set_config('lock_timeout', %s, true);", [SWAP_LOCK_TIMEOUT])
+    for table in upserts:
+        _swap_in(conn, table, f"{table}__new")
+    return upserted
+
+def _fold(watermark: str, upserts: Dict[str, str], reset: bool = False) -> Dict[str, Any]:
+    """
+    Bring the ``upserts`` tables (table name -> upsert SQL) up to date and advance ``watermark``.
+
+    If the rows added since the last fold are exactly those dated after
+    the watermark (the insert counter moved by as many rows, and nothing
+    was updated or deleted), only they are folded in. Otherwise, or with
+    ``reset``, every table is recomputed into a shadow copy and swapped
+    in, so readers are never blocked by the rebuild. Runs in one
+    transaction holding the watermark row lock, so concurrent workers
+    cannot fold the same rows twice.
+    """
+    conn = get_db_connection(route='primary')
+    if not conn:
+        return {'error': 'No database connection'}
+
+    try:
+        with conn.transaction():
+            stored = conn.execute(
+                "SELECT max_fecha, inserts, changes FROM rollup_watermarks WHERE name = %s FOR UPDATE;",
+                [watermark]
+            ).fetchone()
+            if stored is None:
+                return {'error': 'Rollup tables not initialized'}
+
+            # Counters are read first: rows landing after this are seen as new by the next fold
+            current = conn.execute(SOURCE_WATERMARK_QUERY).fetchone()
+            previous = stored['max_fecha']
+            reason = 'rebuild requested' if reset else _rebuild_reason(stored, current)
+
+            if reason is None:
+                inserted = current['inserts'] - stored['inserts']
+                if inserted == 0 and current['max_fecha'] == previous:
+                    return {'appended': False, 'watermark': str(previous)}
+
+                # Same-date, back-dated or NULL-dated inserts are not past the watermark
+                newer = conn.execute(
+                    "SELECT COUNT(*) as count FROM supervision_operativa_detalle WHERE fecha_supervision > %s;",
+                    [previous]
+                ).fetchone()['count']
+                if newer != inserted:
+                    reason = f"{inserted - newer} rows inserted at or before the watermark"
+
+            if reason is None:
+                upserted = {
+                    table: conn.execute(
+                        sql.format(target=table, lower_bound="AND fecha_supervision > %s"),
+                        [current['max_fecha'], previous]
+                    ).rowcount
+                    for table, sql in upserts.items()
+                }
+            else:
+                logger.info(f"Recomputing rollups {watermark}: {reason}")
+                upserted = _refold(conn, upserts, current['max_fecha'])
+
+            conn.execute("""
+                UPDATE rollup_watermarks
+                SET max_fecha = %s, inserts = %s, changes = %s, updated_at = NOW()
+                WHERE name = %s;
+            """, [current['max_fecha'], current['inserts'], current['changes'], watermark])
+
+        logger.info(f"Rollups {watermark} {'rebuilt' if reason else 'appended'} up to {current['max_fecha']}: {upserted}")
+        return {
+            'appended': True,
+            'rebuilt': reason is not None,
+            'reason': reason,
+            'watermark': str(current['max_fecha']),
+            'upserted': upserted
+        }
+
+    except Exception as e:
+        logger.error(f"Error appending rollups {watermark}: {e}")
+        return {'error': str(e)}
+    finally:
+        return_db_connection(conn)
+
+def _is_fresh(watermark: str) -> bool:
+    """Whether ``watermark`` matches the source's latest date and change counters"""
+    result = execute_query(f"""
+        SELECT
+            w.max_fecha IS NOT NULL
+            AND w.max_fecha = s.max_fecha
+            AND w.inserts = s.inserts
+            AND w.changes = s.changes as fresh
+        FROM rollup_watermarks w, ({SOURCE_WATERMARK_QUERY}) s
+        WHERE w.name = %s;
+    """, [watermark], route='primary')
+    return bool(result and result[0]['fresh'])
+
+class TimeRollups:
+    """Maintenance and reads of the day/week/month/quarter rollup tables"""
+
+    def __init__(self):
+        self.ready = False
+        self.ready_checked_at = 0.0
+        self.fresh = False
+        self.fresh_checked_at = 0.0
+
+    def append(self, reset: bool = False) -> Dict[str, Any]:
+        """Fold new detail rows into every rollup table (recomputing them when rows changed in place)"""
+        result = _fold(
+            WATERMARK_NAME,
+            {
+                f"rollup_supervision_{grain}": UPSERT_SQL.format(grain=grain, target='{target}', lower_bound='{lower_bound}')
+                for grain in GRANULARITIES
+            },
+            reset
+        )
+        if result.get('appended'):
+            self.ready = True
+            self.fresh_checked_at = 0.0
+        return result
+
+    def rebuild(self) -> Dict[str, Any]:
+        """Recompute every rollup into shadow tables and swap them in"""
+        return self.append(reset=True)
+
+    def is_ready(self) -> bool:
+        """Whether the rollups have been populated at least once"""
+        if not self.ready and time.monotonic() - self.ready_checked_at >= READY_CHECK_INTERVAL:
+            self.ready_checked_at = time.monotonic()
+            result = execute_query(
+                "SELECT max_fecha FROM rollup_watermarks WHERE name = %s;", [WATERMARK_NAME]
+            )
+            self.ready = bool(result and result[0]['max_fecha'] is not None)
+        return self.ready
+
+    def is_fresh(self) -> bool:
+        """Whether the rollups hold exactly the current detail rows (checked every FRESHNESS_CHECK_INTERVAL)"""
+        if time.monotonic() - self.fresh_checked_at >= FRESHNESS_CHECK_INTERVAL:
+            self.fresh = _is_fresh(WATERMARK_NAME)
+            self.fresh_checked_at = time.monotonic()
+        return self.fresh
+
+    def trends(self, granularity: str = 'day', fecha_inicio=None, fecha_fin=None, **filters) -> Optional[List[Dict[str, Any]]]:
+        """
+        Average, evaluation count and evaluated branches per bucket.
+
+        ``filters`` may be any of estado, grupo, sucursal and area. Returns
+        None when the rollups are not populated or lag the detail table, so
+        callers can fall back to it.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {granularity}")
+
+        try:
+            if not self.is_ready() or not self.is_fresh():
+                return None
+        except Exception:
+            return None
+
+        conditions = []
+        params = []
+
+        if fecha_inicio:
+            conditions.append("bucket >= %s")
+            params.append(bucket_start(fecha_inicio, granularity))
+
+        if fecha_fin:
+            conditions.append("bucket <= %s")
+            params.append(bucket_start(fecha_fin, granularity))
+
+        for name, column in FILTER_COLUMNS.items():
+            if filters.get(name):
+                conditions.append(f"{column} = %s")
+                params.append(filters[name])
+
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        query = f"""
+            SELECT
+                bucket as fecha,
+                ROUND(SUM(suma) / NULLIF(SUM(evaluaciones), 0), 2) as promedio,
+                SUM(evaluaciones) as evaluaciones,
+                COUNT(DISTINCT NULLIF(sucursal_clean, '')) as sucursales
+            FROM rollup_supervision_{granularity}
+            {where_clause}
+            GROUP BY bucket
+            ORDER BY bucket;
+        """
+
+        return execute_query(query, params)
+
+class GeoRollup:
+    """Maintenance and reads of the per-sucursal, per-quarter geo rollup"""
+
+    def __init__(self):
+        self.ready = False
+        self.ready_checked_at = 0.0
+        self.fresh = False
+        self.fresh_checked_at = 0.0
+
+    def append(self, reset: bool = False) -> Dict[str, Any]:
+        """Fold new detail rows into rollup_geo_sucursal (recomputing it when rows changed in place)"""
+        result = _fold(GEO_WATERMARK_NAME, {'rollup_geo_sucursal': GEO_UPSERT_SQL}, reset)
+        if result.get('appended'):
+            self.ready = True
+            self.fresh_checked_at = 0.0
+        return result
+
+    def rebuild(self) -> Dict[str, Any]:
+        """Recompute the geo rollup into a shadow table and swap it in"""
+        return self.append(reset=True)
+
+    def is_ready(self) -> bool:
+        """Whether the geo rollup has been populated at least once"""
+        if not self.ready and time.monotonic() - self.ready_checked_at >= READY_CHECK_INTERVAL:
+            self.ready_checked_at = time.monotonic()
+            result = execute_query(
+                "SELECT max_fecha FROM rollup_watermarks WHERE name = %s;", [GEO_WATERMARK_NAME]
+            )
+            self.ready = bool(result and result[0]['max_fecha'] is not None)
+        return self.ready
+
+    def is_fresh(self) -> bool:
+        """Whether the geo rollup holds exactly the current detail rows (checked every FRESHNESS_CHECK_INTERVAL)"""
+        if time.monotonic() - self.fresh_checked_at >= FRESHNESS_CHECK_INTERVAL:
+            self.fresh = _is_fresh(GEO_WATERMARK_NAME)
+            self.fresh_checked_at = time.monotonic()
+        return self.fresh
+
+    def sucursales(self, quarter: Optional[int] = None, year: Optional[int] = None, estado: str = None,
+                   grupo: str = None, limit: int = 20) -> Optional[List[Dict[str, Any]]]:
+        """
+        Coordinates and performance of each sucursal over the requested quarters, best first.
+
+        Coordinates, estado and municipio come from the latest supervision
+        in range. ``estado`` and ``grupo`` match the sucursal's dimensions
+        in each quarter. Returns None when the rollup lags the detail table.
+        """
+        if not self.is_fresh():
+            return None
+        query, params = self.sucursales_query(quarter, year, estado, grupo, limit)
+        return execute_query(query, params)
+
+    def sucursales_query(self, quarter: Optional[int] = None, year: Optional[int] = None, estado: str = None,
+                         grupo: str = None, limit: int = 20):
+        """SQL and params behind ``sucursales``"""
+        conditions = []
+        params = []
+
+        if quarter:
+            conditions.append("quarter = %s")
+            params.append(quarter)
+
+        if year:
+            conditions.append("year = %s")
+            params.append(int(year))
+
+        if estado:
+            conditions.append("estado = %s")
+            params.append(estado)
+
+        if grupo:
+            conditions.append("grupo_operativo = %s")
+            params.append(grupo)
+
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.append(limit)
+
+        query = f"""
+            SELECT
+                sucursal_clean,
+                (ARRAY_AGG(estado ORDER BY ultima_supervision DESC))[1] as estado,
+                (ARRAY_AGG(municipio ORDER BY ultima_supervision DESC))[1] as municipio,
+                (ARRAY_AGG(latitud ORDER BY ultima_supervision DESC))[1] as latitud,
+                (ARRAY_AGG(longitud ORDER BY ultima_supervision DESC))[1] as longitud,
+                ROUND(SUM(suma) / NULLIF(SUM(evaluaciones), 0), 2) as promedio_porcentaje,
+                SUM(evaluaciones) as total_supervisiones,
+                MAX(ultima_supervision) as ultima_supervision
+            FROM rollup_geo_sucursal
+            {where_clause}
+            GROUP BY sucursal_clean
+            ORDER BY promedio_porcentaje DESC
+            LIMIT %s;
+        """
+        return query, params
+
+# Global rollup instances
+time_rollups = TimeRollups()
+geo_rollup = GeoRollup()
@@ -0,0 +1,235 @@
+"""
+In-process maintenance scheduler.
+Every worker runs a scheduler thread, but only the one holding a Postgres
+session advisory lock (the leader) runs jobs, so each job runs once across
+gunicorn workers and instances. If the leader dies its session ends, the
+lock is released and another worker takes over. Runs are recorded in
+scheduler_runs, which also tells a new leader when each job last ran.
+"""
+
+import os
+import json
+import time
+import random
+import socket
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import psycopg
+from psycopg.rows import dict_row
+
+from cache.cache_manager import cache_manager
+from .connection_v3 import execute_query
+from .optimization import db_optimizer, maintenance_tasks, ROLLUP_CACHE_SCOPES
+from .plan_tracker import plan_tracker
+from .rollups import time_rollups, geo_rollup
+
+logger = logging.getLogger(__name__)
+
+# Advisory lock key held by the leader for as long as its session lives
+SCHEDULER_LOCK_ID = int(os.getenv('SCHEDULER_LOCK_ID', 720352))
+
+# Seconds between leader checks for due jobs, and between followers' lock attempts
+SCHEDULER_TICK = int(os.getenv('SCHEDULER_TICK', 15))
+FOLLOWER_RETRY = int(os.getenv('SCHEDULER_FOLLOWER_RETRY', 60))
+
+# Stored length of a job's result or error text
+RESULT_MAX_CHARS = 4000
+
+SCHEDULER_RUNS_SQL = """
+    CREATE TABLE IF NOT EXISTS scheduler_runs (
+        id BIGSERIAL PRIMARY KEY,
+        job TEXT NOT NULL,
+        started_at TIMESTAMPTZ NOT NULL,
+        finished_at TIMESTAMPTZ,
+        duration_ms NUMERIC,
+        status TEXT NOT NULL,
+        result TEXT,
+        instance TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_scheduler_runs_job ON scheduler_runs (job, started_at DESC);
+"""
+
+def _append_rollups():
+    result = {'time': time_rollups.append(), 'geo': geo_rollup.append()}
+    if any(folded.get('appended') for folded in result.values()):
+        result['invalidated'] = cache_manager.invalidate_scopes(ROLLUP_CACHE_SCOPES)
+    return result
+
+def _cleanup_cache():
+    cache_manager.clear_pattern("*:expired:*")
+    return {'status': 'completed'}
+
+# Jobs formerly scheduled through Celery beat; jitter defaults to 10% of the interval (max 5 min).
+# View refreshes are skipped when the source is unchanged, so they can be checked often.
+DEFAULT_JOBS = [
+    {'name': 'append_rollups', 'interval': 900, 'run': _append_rollups},
+    {'name': 'refresh_materialized_views', 'interval': 300, 'run': db_optimizer.refresh_materialized_views},
+    {'name': 'cleanup_cache', 'interval': 21600, 'run': _cleanup_cache},
+    {'name': 'daily_maintenance', 'interval': 86400, 'run': maintenance_tasks.daily_maintenance},
+    {'name': 'capture_query_plans', 'interval': 86400, 'run': plan_tracker.capture},
+    {'name': 'weekly_optimization', 'interval': 604800, 'run': maintenance_tasks.weekly_optimization},
+]
+
+class MaintenanceScheduler:
+    """Leader-elected periodic job runner"""
+
+    def __init__(self, jobs: List[Dict[str, Any]] = None):
+        self.jobs = {}
+        self.instance = f"{socket.gethostname()}:{os.getpid()}"
+        self.conn = None
+        self.is_leader = False
+        self.leader_since = None
+        self.running_job = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        for job in jobs or []:
+            self.register(**job)
+
+    def register(self, name: str, interval: int, run: Callable[[], Any], jitter: Optional[float] = None):
+        """Add a job running every ``interval`` seconds, delayed by up to ``jitter`` seconds"""
+        self.jobs[name] = {
+            'name': name,
+            'interval': interval,
+            'jitter': jitter if jitter is not None else min(interval * 0.1, 300),
+            'run': run,
+            'next_run': None,
+            'last_status': None,
+        }
+
+    def _schedule(self, job: Dict[str, Any], last_started: Optional[float]):
+        base = last_started if last_started is not None else time.time() - job['interval']
+        job['next_run'] = base + job['interval'] + random.uniform(0, job['jitter'])
+
+    def _connect(self):
+        # Session advisory locks need a direct (non-transaction-pooled) connection
+        conninfo = os.getenv('SCHEDULER_DATABASE_URL') or os.getenv('DATABASE_URL')
+        self.conn = psycopg.connect(conninfo, autocommit=True, row_factory=dict_row, application_name='maintenance-scheduler')
+
+    def _release(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+        self.conn = None
+        if self.is_leader:
+            logger.info(f"Scheduler leadership released by {self.instance}")
+        self.is_leader = False
+        self.leader_since = None
+
+    def _try_lead(self) -> bool:
+        if self.conn is None or self.conn.closed:
+            self._connect()
+        if not self.conn.execute("SELECT pg_try_advisory_lock(%s) as acquired;", [SCHEDULER_LOCK_ID]).fetchone()['acquired']:
+            return False
+
+        self.is_leader = True
+        self.leader_since = datetime.now(timezone.utc)
+        last_runs = {
+            row['job']: row['started_at'].timestamp()
+            for row in self.conn.execute("SELECT job, MAX(started_at) as started_at FROM scheduler_runs GROUP BY job;").fetchall()
+        }
+        for job in self.jobs.values():
+            self._schedule(job, last_runs.get(job['name']))
+        logger.info(f"Scheduler leadership acquired by {self.instance}")
+        return True
+
+    def _run_job(self, job: Dict[str, Any]):
+        started = datetime.now(timezone.utc)
+        started_clock = time.perf_counter()
+        self.running_job = job['name']
+        try:
+            result = job['run']()
+            status = 'error' if isinstance(result, dict) and 'error' in result else 'success'
+        except Exception as e:
+            logger.error(f"Scheduled job {job['name']} failed: {e}")
+            result = {'error': str(e)}
+            status = 'error'
+        finally:
+            self.running_job = None
+
+        duration_ms = round((time.perf_counter() - started_clock) * 1000, 1)
+        job['last_status'] = status
+        self._schedule(job, started.timestamp())
+        self.conn.execute("""
+            INSERT INTO scheduler_runs (job, started_at, finished_at, duration_ms, status, result, instance)
+            VALUES (%s, %s, NOW(), %s, %s, %s, %s);
+        """, [job['name'], started, duration_ms, status, json.dumps(result, default=str)[:RESULT_MAX_CHARS], self.instance])
+        logger.info(f"Scheduled job {job['name']} finished with {status} in {duration_ms / 1000:.1f}s")
+
+    def _loop(self):
+        # Stagger workers booting together
+        self.stop_event.wait(random.uniform(0, SCHEDULER_TICK))
+        while not self.stop_event.is_set():
+            try:
+                if not self.is_leader and not self._try_lead():
+                    self.stop_event.wait(FOLLOWER_RETRY + random.uniform(0, SCHEDULER_TICK))
+                    continue
+
+                # Fails (and drops leadership) if the session holding the lock is gone
+                self.conn.execute("SELECT 1;")
+                for job in sorted(self.jobs.values(), key=lambda item: item['next_run']):
+                    if self.stop_event.is_set() or job['next_run'] > time.time():
+                        break
+                    self._run_job(job)
+
+            except Exception as e:
+                logger.error(f"Scheduler error on {self.instance}: {e}")
+                self._release()
+
+            self.stop_event.wait(SCHEDULER_TICK)
+        self._release()
+
+    def start(self) -> bool:
+        """Start the scheduler thread (idempotent)"""
+        if self.thread is not None and self.thread.is_alive():
+            return False
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._loop, name='maintenance-scheduler', daemon=True)
+        self.thread.start()
+        logger.info(f"Maintenance scheduler started on {self.instance} with {len(self.jobs)} jobs")
+        return True
+
+    def stop(self):
+        """Stop the scheduler thread and give up leadership"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+
+    def history(self, limit: int = 50, job: str = None) -> Optional[List[Dict[str, Any]]]:
+        """Recorded runs, newest first"""
+        conditions = "WHERE job = %s" if job else ""
+        params = ([job] if job else []) + [limit]
+        return execute_query(f"""
+            SELECT id, job, started_at, finished_at, duration_ms, status, result, instance
+            FROM scheduler_runs
+            {conditions}
+            ORDER BY started_at DESC
+            LIMIT %s;
+        """, params, route='primary')
+
+    def get_status(self) -> Dict[str, Any]:
+        """Leadership and job schedule as seen by this worker"""
+        return {
+            'instance': self.instance,
+            'running': self.thread is not None and self.thread.is_alive(),
+            'is_leader': self.is_leader,
+            'leader_since': self.leader_since.isoformat() if self.leader_since else None,
+            'running_job': self.running_job,
+            'jobs': [
+                {
+                    'name': job['name'],
+                    'interval_seconds': job['interval'],
+                    'jitter_seconds': job['jitter'],
+                    'next_run': datetime.fromtimestamp(job['next_run'], timezone.utc).isoformat() if job['next_run'] else None,
+                    'last_status': job['last_status'],
+                }
+                for job in self.jobs.values()
+            ]
+        }
+
+# Global scheduler instance (one thread per worker process)
+maintenance_scheduler = MaintenanceScheduler(DEFAULT_JOBS)
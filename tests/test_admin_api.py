@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('flask_limiter')
+pytest.importorskip('jwt')
+pytest.importorskip('marshmallow')
+pytest.importorskip('psutil')
+pytest.importorskip('psycopg')
+pytest.importorskip('psycopg_pool')
+pytest.importorskip('redis')
+
+
+def test_admin_blueprint_imports():
+    from api.v1.admin import admin_bp, capture_query_plans
+
+    assert admin_bp.name == 'admin'
+    assert capture_query_plans.__name__ == 'capture_query_plans'
+
+
+def test_plan_routes_registered():
+    from flask import Flask
+    from api.v1.admin import admin_bp
+
+    app = Flask(__name__)
+    app.register_blueprint(admin_bp)
+    rules = {rule.rule: rule.methods for rule in app.url_map.iter_rules()}
+    assert 'POST' in rules['/api/v1/admin/database/plans/capture']
@@ -0,0 +1,142 @@
+from datetime import date, timedelta
+
+import pytest
+
+pytest.importorskip('psycopg')
+pytest.importorskip('psycopg_pool')
+pytest.importorskip('redis')
+
+from database import optimization
+from database.optimization import AggregateRouter, RAW_SOURCE
+
+
+@pytest.fixture
+def rollups(monkeypatch):
+    """Rollup readiness and freshness flags the router sees"""
+    state = {'ready': True, 'fresh': True, 'geo_ready': True, 'geo_fresh': True, 'view_fresh': True}
+    monkeypatch.setattr(optimization.time_rollups, 'is_ready', lambda: state['ready'])
+    monkeypatch.setattr(optimization.time_rollups, 'is_fresh', lambda: state['fresh'])
+    monkeypatch.setattr(optimization.geo_rollup, 'is_ready', lambda: state['geo_ready'])
+    monkeypatch.setattr(optimization.geo_rollup, 'is_fresh', lambda: state['geo_fresh'])
+    return state
+
+
+@pytest.fixture
+def router(rollups):
+    router = AggregateRouter()
+    router.rows = dict(AggregateRouter.DEFAULT_ROWS)
+    router._relation_rows = lambda: router.rows
+    router._view_is_fresh = lambda name: rollups['view_fresh']
+    return router
+
+
+def test_smallest_capable_source_wins(router):
+    assert router.route('kpis', {'estado'}, {'promedio'}, quarter='Q3', year=2025) == 'mv_kpi_summary'
+    assert router.route('by_area', {'area'}, {'promedio'}, quarter='Q3', year=2025) == 'rollup_supervision_quarter'
+    assert router.route('weekly', (), {'promedio'}, grain='week') == 'rollup_supervision_week'
+
+
+def test_days_filter_needs_day_buckets(router):
+    assert router.route('recent', {'estado'}, {'promedio'}, days=30) == 'rollup_supervision_day'
+
+
+@pytest.mark.parametrize('grain', ['week', 'month', 'quarter'])
+def test_day_ranges_bucketed_by_grain_use_the_grain_rollup(router, grain):
+    assert router.route('trends', (), {'promedio'}, days=30, grain=grain) == f"rollup_supervision_{grain}"
+
+
+def test_day_ranges_without_grain_need_day_buckets(router):
+    router.route('recent', (), {'promedio'}, days=30)
+    assert router.decisions[-1]['candidates']['rollup_supervision_week'] == "periods ['days']"
+
+
+@pytest.mark.parametrize('source', ['rollup_supervision_week', 'rollup_supervision_day', RAW_SOURCE])
+def test_day_ranges_start_on_a_bucket_boundary(router, source):
+    query, params, chosen = router.build('trends', {'promedio': 'promedio'}, days=30, grain='week', source=source)
+    start = date.today() - timedelta(days=30)
+    assert chosen == source
+    assert params == [start - timedelta(days=start.weekday()), date.today() + timedelta(days=1)]
+
+
+def test_bucket_boundary_stays_within_the_year(router):
+    today = date.today()
+    query, params, source = router.build('trends', {'promedio': 'promedio'}, year=today.year, days=400, grain='week')
+    assert source == 'rollup_supervision_day'
+    assert params[0] == date(today.year, 1, 1)
+
+
+def test_unsupported_measure_falls_back_to_detail(router):
+    assert router.route('supervisions', {'sucursal'}, {'supervisiones'}) == RAW_SOURCE
+    decision = router.decisions[-1]
+    assert decision['candidates']['rollup_supervision_day'] == "measures ['supervisiones']"
+    assert decision['candidates']['mv_kpi_summary'] == "dimensions ['sucursal']"
+
+
+def test_missing_relation_is_skipped(router):
+    del router.rows['mv_kpi_summary']
+    assert router.route('kpis', {'estado'}, {'promedio'}, year=2025) == 'rollup_supervision_quarter'
+    assert router.decisions[-1]['candidates']['mv_kpi_summary'] == 'missing'
+
+
+def test_row_estimates_decide(router):
+    router.rows['rollup_supervision_month'] = 10
+    assert router.route('by_area', {'area'}, {'promedio'}, year=2025) == 'rollup_supervision_month'
+
+
+@pytest.mark.parametrize('flag, reason', [('ready', 'not populated'), ('fresh', 'stale')])
+def test_unusable_rollups_are_skipped(router, rollups, flag, reason):
+    rollups[flag] = False
+    assert router.route('by_area', {'area'}, {'promedio'}, year=2025) == RAW_SOURCE
+    assert router.decisions[-1]['candidates']['rollup_supervision_quarter'] == reason
+
+
+@pytest.mark.parametrize('flag, reason', [('geo_ready', 'not populated'), ('geo_fresh', 'stale')])
+def test_unusable_geo_rollup_is_skipped(router, rollups, flag, reason):
+    candidates = ('rollup_geo_sucursal', RAW_SOURCE)
+    assert router.route('map', {'sucursal'}, {'promedio'}, candidates=candidates) == 'rollup_geo_sucursal'
+    rollups[flag] = False
+    assert router.route('map', {'sucursal'}, {'promedio'}, candidates=candidates) == RAW_SOURCE
+    assert router.decisions[-1]['candidates']['rollup_geo_sucursal'] == reason
+
+
+def test_stale_view_is_skipped(router, rollups):
+    rollups['view_fresh'] = False
+    assert router.route('kpis', {'estado'}, {'promedio'}, year=2025) == 'rollup_supervision_quarter'
+    assert router.decisions[-1]['candidates']['mv_kpi_summary'] == 'stale'
+
+
+@pytest.mark.parametrize('current, fresh', [
+    ({'changes': 10, 'max_fecha': date(2025, 7, 1)}, True),
+    ({'changes': 11, 'max_fecha': date(2025, 7, 1)}, False),
+    ({'changes': 10, 'max_fecha': date(2025, 7, 2)}, False),
+    (None, False),
+])
+def test_view_freshness_compares_refresh_state(monkeypatch, current, fresh):
+    def execute_query(query, params=None, route='auto'):
+        if 'mv_refresh_state' in query:
+            return [{'changes': 10, 'max_fecha': date(2025, 7, 1)}]
+        return [current] if current else None
+
+    monkeypatch.setattr(optimization, 'execute_query', execute_query)
+    router = AggregateRouter()
+    assert router._view_is_fresh('mv_kpi_summary') is fresh
+
+    # Reused until the next check is due
+    monkeypatch.setattr(optimization, 'execute_query', lambda *args, **kwargs: None)
+    assert router._view_is_fresh('mv_kpi_summary') is fresh
+
+
+def test_stats_failure_routes_to_detail(router):
+    def fail():
+        raise RuntimeError('no connection')
+
+    router._relation_rows = fail
+    assert router.route('kpis', {'estado'}, {'promedio'}, year=2025) == RAW_SOURCE
+
+
+def test_decisions_are_counted(router):
+    router.route('kpis', {'estado'}, {'promedio'}, year=2025)
+    router.route('kpis', {'estado'}, {'promedio'}, year=2025)
+    stats = router.get_stats()
+    assert stats['source_counts'] == {'mv_kpi_summary': 2}
+    assert stats['recent_decisions'][-1]['periods'] == ['year']
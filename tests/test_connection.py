@@ -0,0 +1,98 @@
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip('psycopg')
+pytest.importorskip('psycopg_pool')
+
+from database import connection_v3
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.description = [('value',)] if rows is not None else None
+        self.rowcount = 3
+        self.pgresult = None
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None, prepare=None):
+        self.executed.append((query, params, prepare))
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConnection:
+    def __init__(self, rows=None):
+        self.cursor_obj = FakeCursor(rows)
+        self.commits = 0
+
+    def cursor(self, row_factory=None):
+        return self.cursor_obj
+
+    def commit(self):
+        self.commits += 1
+
+
+@pytest.fixture
+def pooled(monkeypatch):
+    """Route execute_query to a fake connection, recording the route it asked for"""
+    state = {'conn': FakeConnection(), 'routes': []}
+
+    @contextmanager
+    def checkout(route):
+        state['routes'].append(route)
+        yield state['conn']
+
+    monkeypatch.setattr(connection_v3, '_ensure_pool', lambda: True)
+    monkeypatch.setattr(connection_v3, '_checkout', checkout)
+    return state
+
+
+@pytest.mark.parametrize('value, expected', [('2', 2), ('0', 0), ('none', None), ('off', None), ('', None)])
+def test_prepare_threshold(monkeypatch, value, expected):
+    monkeypatch.setenv('DB_PREPARE_THRESHOLD', value)
+    assert connection_v3._get_prepare_threshold() == expected
+
+
+@pytest.mark.parametrize('query, expected', [
+    ("SELECT 1", True),
+    ("  with t as (select 1) select * from t", True),
+    ("REFRESH MATERIALIZED VIEW mv_kpi_summary", False),
+    ("CREATE INDEX idx ON t (a)", False),
+    ("VACUUM ANALYZE t", False),
+])
+def test_is_preparable(query, expected):
+    assert connection_v3._is_preparable(query) is expected
+
+
+def test_reads_return_rows(pooled):
+    pooled['conn'] = FakeConnection(rows=[{'value': 1}])
+    assert connection_v3.execute_query("SELECT 1 as value", prepare=True) == [{'value': 1}]
+    assert pooled['conn'].cursor_obj.executed == [("SELECT 1 as value", None, True)]
+    assert pooled['conn'].commits == 0
+    assert pooled['routes'] == ['replica']
+
+
+def test_with_select_returns_rows(pooled):
+    pooled['conn'] = FakeConnection(rows=[])
+    assert connection_v3.execute_query("WITH t AS (SELECT 1) SELECT * FROM t") == []
+
+
+def test_maintenance_is_never_prepared(pooled):
+    assert connection_v3.execute_query("VACUUM ANALYZE supervision_operativa_detalle", prepare=True) == 3
+    assert pooled['conn'].cursor_obj.executed == [("VACUUM ANALYZE supervision_operativa_detalle", None, False)]
+    assert pooled['conn'].commits == 1
+    assert pooled['routes'] == ['primary']
+
+
+def test_unavailable_pool_returns_none(monkeypatch):
+    monkeypatch.setattr(connection_v3, '_ensure_pool', lambda: False)
+    assert connection_v3.execute_query("SELECT 1") is None
@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip('psycopg')
+pytest.importorskip('psycopg_pool')
+
+from database import queries_v3
+from database.pagination import decode_cursor, cursor_scope
+
+KEY_CONDITIONS = ['submission_id IS NOT NULL', 'area_evaluacion IS NOT NULL']
+
+
+@pytest.fixture
+def streamed(monkeypatch):
+    """Queries sent to stream_query, answered with ``rows``"""
+    state = {'queries': [], 'rows': []}
+
+    def stream_query(query, params=None):
+        state['queries'].append((query, params))
+        return iter(state['rows'])
+
+    monkeypatch.setattr(queries_v3, 'stream_query', stream_query)
+    return state
+
+
+def test_listings_keep_rows_with_null_keys(streamed):
+    queries_v3.get_detailed_performance(grupo='TEPEYAC')
+    queries_v3.get_metrics_by_sucursal('1 - Centro')
+    for query, params in streamed['queries']:
+        assert not any(condition in query for condition in KEY_CONDITIONS)
+
+
+def test_pages_require_complete_keys(streamed):
+    queries_v3.get_detailed_performance_page(grupo='TEPEYAC')
+    queries_v3.get_metrics_by_sucursal_page('1 - Centro')
+    for query, params in streamed['queries']:
+        assert all(condition in query for condition in KEY_CONDITIONS)
+
+
+def test_page_resumes_after_cursor(streamed):
+    streamed['rows'] = [
+        {'fecha_supervision': '2025-07-0%d' % day, 'submission_id': 's%d' % day, 'area_evaluacion': 'Cocina'}
+        for day in (3, 2, 1)
+    ]
+    page = queries_v3.get_detailed_performance_page(area='Cocina', page_size=2)
+    assert page['data'] == streamed['rows'][:2]
+
+    scope = cursor_scope('detailed_performance', sucursal=None, grupo=None, area='Cocina',
+                         fecha_inicio=None, fecha_fin=None)
+    assert decode_cursor(page['next_cursor'], scope) == ['2025-07-02', 's2', 'Cocina']
+
+    queries_v3.get_detailed_performance_page(area='Cocina', page_size=2, cursor=page['next_cursor'])
+    query, params = streamed['queries'][-1]
+    assert "(fecha_supervision, submission_id, area_evaluacion) < (%s, %s, %s)" in query
+    assert params == ['Cocina', '2025-07-02', 's2', 'Cocina', 3]
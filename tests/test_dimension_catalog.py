@@ -0,0 +1,224 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('psycopg')
+pytest.importorskip('psycopg_pool')
+
+from database import dimension_catalog as catalog_module
+from database.dimension_catalog import DimensionCatalog
+
+FACTS = {
+    ('1 - Centro', 'Nuevo León', 'TEPEYAC', 'Cocina', 2025, 3): 10,
+    ('1 - Centro', 'Nuevo León', 'TEPEYAC', 'Caja', 2025, 3): 5,
+    ('2 - Norte', 'Coahuila', 'TEPEYAC', 'Cocina', 2025, 2): 4,
+    (None, 'Coahuila', '', 'Cocina', 2025, 2): 1,
+}
+
+
+def watermark(inserts=100, changes=0, max_fecha=datetime(2025, 7, 1)):
+    return {'inserts': inserts, 'changes': changes, 'max_fecha': max_fecha}
+
+
+@pytest.fixture
+def catalog():
+    """Catalog loaded from FACTS, with the database calls replaced by recorders"""
+    catalog = DimensionCatalog()
+    catalog.calls = []
+    catalog.current = watermark()
+    catalog.delta = {}
+
+    def fetch_watermark():
+        return catalog.current
+
+    def fetch_facts(since=None):
+        catalog.calls.append(('facts', since))
+        return dict(catalog.delta) if since is not None else dict(FACTS)
+
+    catalog._fetch_watermark = fetch_watermark
+    catalog._fetch_facts = fetch_facts
+    catalog.load()
+    catalog.calls.clear()
+    return catalog
+
+
+def test_build_snapshot_views():
+    snapshot = DimensionCatalog()._build_snapshot(FACTS)
+
+    assert snapshot['estado'] == [
+        {'value': 'Coahuila', 'sucursales': 1, 'evaluaciones': 5},
+        {'value': 'Nuevo León', 'sucursales': 1, 'evaluaciones': 15},
+    ]
+    # Empty values are left out, NULL sucursales are not counted as branches
+    assert snapshot['grupo'] == [{'value': 'TEPEYAC', 'sucursales': 2, 'evaluaciones': 19}]
+    assert snapshot['area'] == [
+        {'value': 'Caja', 'sucursales': 1, 'evaluaciones': 5},
+        {'value': 'Cocina', 'sucursales': 2, 'evaluaciones': 15},
+    ]
+    assert [item['value'] for item in snapshot['sucursal']] == ['1 - Centro', '2 - Norte']
+    assert snapshot['periodo'] == [
+        {'year': 2025, 'quarter': 'Q3', 'value': 'Q3 2025', 'sucursales': 1},
+        {'year': 2025, 'quarter': 'Q2', 'value': 'Q2 2025', 'sucursales': 1},
+    ]
+    assert snapshot['sucursal_info'] == {
+        '1 - Centro': {'estado': 'Nuevo León', 'grupo': 'TEPEYAC'},
+        '2 - Norte': {'estado': 'Coahuila', 'grupo': 'TEPEYAC'},
+    }
+
+
+def test_refresh_loads_when_never_loaded():
+    catalog = DimensionCatalog()
+    loads = []
+    catalog.load = lambda: loads.append(True)
+    catalog.refresh()
+    assert loads == [True]
+
+
+def test_refresh_loads_after_full_reload_interval(catalog):
+    catalog.last_full_load = time.monotonic() - catalog.FULL_RELOAD_INTERVAL
+    catalog.refresh()
+    assert catalog.calls == [('facts', None)]
+    assert catalog.stats['full_loads'] == 2
+
+
+def test_refresh_noop_when_unchanged(catalog):
+    catalog.refresh()
+    assert catalog.calls == []
+    assert catalog.stats['full_loads'] == 1
+    assert catalog.stats['incremental_loads'] == 0
+
+
+@pytest.mark.parametrize('current', [
+    watermark(changes=1),
+    watermark(inserts=90),
+    # New rows that are not newer than the previous watermark
+    watermark(inserts=110),
+    watermark(inserts=110, max_fecha=datetime(2025, 6, 1)),
+    watermark(inserts=110, max_fecha=None),
+])
+def test_refresh_full_reload(catalog, current):
+    catalog.current = current
+    catalog.refresh()
+    assert catalog.calls == [('facts', None)]
+    assert catalog.stats['full_loads'] == 2
+    assert catalog.watermark == current
+
+
+def test_refresh_merges_appended_rows(catalog):
+    catalog.current = watermark(inserts=103, max_fecha=datetime(2025, 7, 2))
+    catalog.delta = {
+        ('1 - Centro', 'Nuevo León', 'TEPEYAC', 'Cocina', 2025, 3): 2,
+        ('3 - Sur', 'Nuevo León', 'OGAS', 'Cocina', 2025, 3): 1,
+    }
+    catalog.refresh()
+
+    assert catalog.calls == [('facts', datetime(2025, 7, 1))]
+    assert catalog.stats['incremental_loads'] == 1
+    assert catalog.facts[('1 - Centro', 'Nuevo León', 'TEPEYAC', 'Cocina', 2025, 3)] == 12
+    assert catalog.snapshot == catalog._build_snapshot({**FACTS, **{
+        ('1 - Centro', 'Nuevo León', 'TEPEYAC', 'Cocina', 2025, 3): 12,
+        ('3 - Sur', 'Nuevo León', 'OGAS', 'Cocina', 2025, 3): 1,
+    }})
+    assert catalog.watermark == catalog.current
+
+
+@pytest.mark.parametrize('inserts', [102, 104])
+def test_refresh_reloads_when_merged_rows_differ_from_inserts(catalog, inserts):
+    # Rows inserted on the previous max date are not past the watermark
+    catalog.current = watermark(inserts=inserts, max_fecha=datetime(2025, 7, 2))
+    catalog.delta = {('1 - Centro', 'Nuevo León', 'TEPEYAC', 'Cocina', 2025, 3): 3}
+    catalog.refresh()
+
+    assert catalog.calls == [('facts', datetime(2025, 7, 1)), ('facts', None)]
+    assert catalog.stats['full_loads'] == 2
+    assert catalog.stats['incremental_loads'] == 0
+    assert catalog.facts == FACTS
+
+
+def test_refresh_keeps_state_without_watermark(catalog):
+    catalog.current = None
+    previous = catalog.watermark
+    catalog.refresh()
+    assert catalog.calls == []
+    assert catalog.watermark == previous
+
+
+def wait_for_load(catalog):
+    """Block until the background load releases the catalog lock"""
+    with catalog.refresh_lock:
+        pass
+
+
+@pytest.fixture
+def unloaded(monkeypatch):
+    """Catalog whose first load has not run, with direct queries recorded"""
+    catalog = DimensionCatalog()
+    catalog.queries = []
+    catalog.loads = 0
+    catalog.release = threading.Event()
+
+    def load():
+        catalog.loads += 1
+        catalog.release.wait(5)
+
+    def execute_query(query, params=None):
+        catalog.queries.append((query, params))
+        if 'EXTRACT(YEAR' in query:
+            return [{'year': 2025, 'quarter': 3, 'sucursales': 2}]
+        if 'LIMIT 1' in query:
+            return [{'estado': 'Nuevo León', 'grupo': 'TEPEYAC'}]
+        return [{'value': 'Coahuila', 'sucursales': 1, 'evaluaciones': 5}]
+
+    catalog.load = load
+    monkeypatch.setattr(catalog_module, 'execute_query', execute_query)
+    return catalog
+
+
+def test_lookups_query_directly_until_loaded(unloaded):
+    assert unloaded.values('estado') == ['Coahuila']
+    assert unloaded.with_counts('grupo') == [{'value': 'Coahuila', 'sucursales': 1, 'evaluaciones': 5}]
+    assert unloaded.periods() == [{'year': 2025, 'quarter': 'Q3', 'value': 'Q3 2025', 'sucursales': 2}]
+    assert unloaded.sucursal_info('1 - Centro') == {'estado': 'Nuevo León', 'grupo': 'TEPEYAC'}
+
+    assert 'grupo_operativo IS NOT NULL' in unloaded.queries[1][0]
+    assert unloaded.queries[3][1] == ['1 - Centro']
+    unloaded.release.set()
+    wait_for_load(unloaded)
+    # Lookups made while the load runs do not start another one
+    assert unloaded.loads == 1
+
+
+def test_start_loading_loads_in_background(catalog):
+    fresh = DimensionCatalog()
+    fresh._fetch_watermark = catalog._fetch_watermark
+    fresh._fetch_facts = catalog._fetch_facts
+
+    assert fresh.start_loading() is True
+    wait_for_load(fresh)
+    assert fresh.snapshot == catalog.snapshot
+    assert fresh.with_counts('estado') == catalog.with_counts('estado')
+
+
+def test_start_loading_skips_while_a_load_runs(unloaded):
+    assert unloaded.start_loading() is True
+    assert unloaded.start_loading() is False
+    unloaded.release.set()
+    wait_for_load(unloaded)
+    assert unloaded.loads == 1
+
+
+def test_failed_background_load_is_retried_later(unloaded):
+    def fail():
+        raise RuntimeError('no connection')
+
+    unloaded.load = fail
+    unloaded.start_loading()
+    wait_for_load(unloaded)
+    assert unloaded.stats['errors'] == 1
+    assert not unloaded.refresh_lock.locked()
+
+    # No new attempt until CHECK_INTERVAL has passed
+    unloaded.load = lambda: pytest.fail('retried too early')
+    assert unloaded.values('estado') == ['Coahuila']
@@ -0,0 +1,94 @@
+import pytest
+
+pytest.importorskip('psycopg')
+pytest.importorskip('psycopg_pool')
+
+from database.index_advisor import IndexAdvisor, MIN_TABLE_ROWS
+
+TABLES = {'supervision_operativa_detalle': {'rows': MIN_TABLE_ROWS}, 'small': {'rows': MIN_TABLE_ROWS - 1}}
+COLUMNS = {
+    'supervision_operativa_detalle': {'estado', 'grupo_operativo', 'fecha_supervision', 'porcentaje'},
+    'small': {'estado'},
+}
+
+
+def seq_scan(table, filter_text, **extra):
+    return {'Node Type': 'Seq Scan', 'Relation Name': table, 'Filter': filter_text,
+            'Total Cost': 1200.5, 'Plan Rows': 40, **extra}
+
+
+def live_index(name, columns, include=(), **extra):
+    return {
+        'index_name': name, 'table_name': 'supervision_operativa_detalle', 'method': 'btree',
+        'partial': False, 'expression': False, 'enforces_constraint': False,
+        'column_names': list(columns), 'include_names': list(include), 'size_bytes': 8192, **extra
+    }
+
+
+def test_scan_candidates_equality_columns_lead():
+    plan = {'Node Type': 'Aggregate', 'Plans': [seq_scan(
+        'supervision_operativa_detalle',
+        "((fecha_supervision >= '2025-01-01'::date) AND ((estado)::text = 'Nuevo León'::text)"
+        " AND (porcentaje > '50'::numeric) AND ((grupo_operativo)::text = 'TEPEYAC'::text))"
+    )]}
+    candidates = IndexAdvisor([])._scan_candidates(plan, TABLES, COLUMNS)
+    assert candidates == [{
+        'table': 'supervision_operativa_detalle',
+        'columns': ['estado', 'grupo_operativo', 'fecha_supervision'],
+        'scan_cost': 1200.5,
+        'scan_rows': 40,
+    }]
+
+
+def test_scan_candidates_skip_small_tables_and_unfiltered_scans():
+    plan = {'Node Type': 'Append', 'Plans': [
+        seq_scan('small', "((estado)::text = 'Coahuila'::text)"),
+        seq_scan('supervision_operativa_detalle', None),
+        {'Node Type': 'Index Scan', 'Relation Name': 'supervision_operativa_detalle', 'Filter': "(porcentaje > 50)"},
+    ]}
+    assert IndexAdvisor([])._scan_candidates(plan, TABLES, COLUMNS) == []
+
+
+def test_scan_candidates_ignore_unknown_columns():
+    plan = seq_scan('supervision_operativa_detalle', "((otro = 1) AND ((tipo)::text = 'X'::text))")
+    assert IndexAdvisor([])._scan_candidates(plan, TABLES, COLUMNS) == []
+
+
+def test_redundant_configured_indexes():
+    configured = [
+        {'name': 'idx_estado', 'table': 'supervision_operativa_detalle', 'columns': ['estado']},
+        {'name': 'idx_estado_fecha', 'table': 'supervision_operativa_detalle', 'columns': ['estado', 'fecha_supervision']},
+        {'name': 'idx_fecha_brin', 'table': 'supervision_operativa_detalle', 'columns': ['fecha_supervision'], 'type': 'BRIN'},
+        {'name': 'idx_fecha_partial', 'table': 'supervision_operativa_detalle', 'columns': ['fecha_supervision'],
+         'where': 'porcentaje IS NOT NULL'},
+        {'name': 'idx_fecha_grupo', 'table': 'supervision_operativa_detalle', 'columns': ['fecha_supervision', 'grupo_operativo']},
+    ]
+    assert IndexAdvisor(configured)._redundant_indexes([]) == [
+        {'index': 'idx_estado', 'covered_by': 'idx_estado_fecha', 'source': 'CRITICAL_INDEXES'},
+        {'index': 'idx_fecha_partial', 'covered_by': 'idx_fecha_grupo', 'source': 'CRITICAL_INDEXES'},
+    ]
+
+
+def test_redundant_configured_index_needs_its_include_columns():
+    configured = [
+        {'name': 'idx_kpi', 'table': 'supervision_operativa_detalle', 'columns': ['estado'], 'include': ['porcentaje']},
+        {'name': 'idx_estado_fecha', 'table': 'supervision_operativa_detalle', 'columns': ['estado', 'fecha_supervision']},
+    ]
+    assert IndexAdvisor(configured)._redundant_indexes([]) == []
+
+
+def test_redundant_live_indexes():
+    indexes = [
+        live_index('idx_estado', ['estado']),
+        live_index('idx_estado_fecha', ['estado', 'fecha_supervision']),
+        live_index('idx_estado_unique', ['estado'], enforces_constraint=True),
+        live_index('idx_estado_partial', ['estado'], partial=True),
+        live_index('idx_estado_covering', ['estado'], include=['porcentaje']),
+        live_index('idx_estado_hash', ['estado'], method='hash'),
+    ]
+    assert IndexAdvisor([])._redundant_indexes(indexes) == [{
+        'index': 'idx_estado',
+        'covered_by': 'idx_estado_fecha',
+        'source': 'database',
+        'write_cost': {'size_bytes': 8192},
+    }]
@@ -0,0 +1,22 @@
+import pytest
+
+pytest.importorskip('psycopg')
+pytest.importorskip('psycopg_pool')
+pytest.importorskip('redis')
+
+from database.optimization import DatabaseOptimizer
+
+
+def test_watermark_max_has_a_full_btree():
+    # MAX(fecha_supervision) watermarks carry no porcentaje filter, so a partial index cannot serve them
+    assert any(
+        index['columns'][0] == 'fecha_supervision' and index['where'] is None
+        and index.get('type', 'BTREE') == 'BTREE'
+        for index in DatabaseOptimizer.CRITICAL_INDEXES
+    )
+
+
+def test_retired_indexes_are_not_recreated():
+    names = [index['name'] for index in DatabaseOptimizer.CRITICAL_INDEXES]
+    assert len(names) == len(set(names))
+    assert not set(DatabaseOptimizer.RETIRED_INDEXES) & set(names)
@@ -0,0 +1,91 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+from database.pagination import (
+    InvalidCursor, cursor_scope, decode_cursor, encode_cursor, keyset_order,
+    keyset_predicate, paginate, pagination_info
+)
+
+SCOPE = cursor_scope('detalle', sucursal='1 - Centro', year=2025)
+
+
+def test_cursor_round_trip_keeps_types():
+    values = [
+        None,
+        datetime(2025, 7, 1, 12, 30, tzinfo=timezone.utc),
+        date(2025, 7, 1),
+        Decimal('87.50'),
+        True,
+        42,
+        0.25,
+        'Centro',
+    ]
+    decoded = decode_cursor(encode_cursor(values, SCOPE), SCOPE)
+    assert decoded == values
+    assert [type(value) for value in decoded] == [type(value) for value in values]
+
+
+def test_cursor_scope_depends_on_filters():
+    assert cursor_scope('detalle', year=2025) == cursor_scope('detalle', year=2025)
+    assert cursor_scope('detalle', year=2025) != cursor_scope('detalle', year=2024)
+
+
+def test_cursor_rejected_for_other_scope():
+    token = encode_cursor([1], SCOPE)
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token, cursor_scope('detalle', year=2024))
+
+
+def test_cursor_rejects_tampered_payload():
+    token = encode_cursor([1], SCOPE)
+    other_payload = encode_cursor([2], SCOPE).split('.')[0]
+    with pytest.raises(InvalidCursor):
+        decode_cursor(f"{other_payload}.{token.split('.')[1]}", SCOPE)
+
+
+@pytest.mark.parametrize('token', ['', 'no-separator', 'a.b', '!!!.???'])
+def test_cursor_rejects_malformed(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token, SCOPE)
+
+
+def test_invalid_cursor_is_value_error():
+    assert issubclass(InvalidCursor, ValueError)
+
+
+def test_keyset_predicate():
+    assert keyset_predicate(['a', 'b'], None) == ("", [])
+    assert keyset_predicate(['a', 'b'], []) == ("", [])
+    assert keyset_predicate(['a', 'b'], [2, 'x']) == ("(a, b) < (%s, %s)", [2, 'x'])
+    assert keyset_predicate(['a'], (5,), descending=False) == ("(a) > (%s)", [5])
+
+
+def test_keyset_predicate_rejects_key_length_mismatch():
+    with pytest.raises(InvalidCursor):
+        keyset_predicate(['a', 'b'], [1])
+
+
+def test_keyset_order():
+    assert keyset_order(['a', 'b']) == "a DESC, b DESC"
+    assert keyset_order(['a'], descending=False) == "a ASC"
+
+
+def test_paginate_last_page():
+    rows = [{'id': 1}, {'id': 2}]
+    assert paginate(rows, 2, ['id'], SCOPE) == (rows, None)
+    assert paginate(None, 2, ['id'], SCOPE) == ([], None)
+
+
+def test_paginate_next_cursor_points_at_last_row():
+    rows = [{'id': 3, 'area': 'Cocina'}, {'id': 2, 'area': None}, {'id': 1, 'area': 'Caja'}]
+    page, token = paginate(rows, 2, ['id', 'area'], SCOPE)
+    assert page == rows[:2]
+    # NULL keys are stored as '' to match COALESCE(column, '')
+    assert decode_cursor(token, SCOPE) == [2, '']
+
+
+def test_pagination_info():
+    assert pagination_info(50, None) == {'limit': 50, 'offset': 0, 'next_cursor': None, 'has_more': False}
+    assert pagination_info(50, 'token')['has_more'] is True
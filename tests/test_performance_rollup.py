@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip('psycopg')
+pytest.importorskip('psycopg_pool')
+
+from database import queries_v3
+
+
+def row(grouping_id, sucursal=None, grupo=None, area=None, promedio=90.0):
+    return {
+        'grouping_id': grouping_id,
+        'sucursal_clean': sucursal,
+        'grupo_operativo': grupo,
+        'area_evaluacion': area,
+        'promedio': promedio,
+        'total_evaluaciones': 10,
+        'total_sucursales': 1,
+        'max_porcentaje': 100,
+        'min_porcentaje': 80,
+    }
+
+
+def test_rows_split_by_grouping_bitmask(monkeypatch):
+    calls = []
+
+    def execute_query(query, params):
+        calls.append(params)
+        return [
+            row(0b011, sucursal='1 - Centro', promedio=95.0),
+            row(0b101, grupo='TEPEYAC', promedio=92.0),
+            row(0b111, promedio=91.0),
+            row(0b110, area='Cocina', promedio=90.0),
+            row(0b011, sucursal='2 - Norte', promedio=85.0),
+        ]
+
+    monkeypatch.setattr(queries_v3, 'execute_query', execute_query)
+    rollup = queries_v3.get_performance_rollup('2025-01-01', '2025-03-31')
+
+    assert calls == [['2025-01-01', '2025-03-31']]
+    assert [item['sucursal_clean'] for item in rollup['sucursal']] == ['1 - Centro', '2 - Norte']
+    assert rollup['grupo'] == [{
+        'grupo_operativo': 'TEPEYAC', 'promedio': 92.0, 'total_evaluaciones': 10,
+        'total_sucursales': 1, 'max_porcentaje': 100, 'min_porcentaje': 80,
+    }]
+    assert set(rollup['area'][0]) == {
+        'area_evaluacion', 'promedio', 'total_evaluaciones', 'total_sucursales', 'max_porcentaje', 'min_porcentaje'
+    }
+    assert rollup['total'] == {
+        'promedio': 91.0, 'total_evaluaciones': 10, 'total_sucursales': 1,
+        'max_porcentaje': 100, 'min_porcentaje': 80,
+    }
+
+
+def test_failed_query_returns_empty_rollup(monkeypatch):
+    monkeypatch.setattr(queries_v3, 'execute_query', lambda query, params: None)
+    assert queries_v3.get_performance_rollup() == {'sucursal': [], 'grupo': [], 'area': [], 'total': None}
@@ -0,0 +1,82 @@
+from datetime import date, timedelta
+
+import pytest
+
+from database.periods import (
+    days_range, parse_quarter, period_conditions, period_filter, previous_quarter,
+    quarter_range, resolve_period, year_range
+)
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('Q3', 3), ('q1', 1), (' Q4 ', 4), ('2', 2), (4, 4),
+    ('ALL', None), (None, None), ('', None),
+])
+def test_parse_quarter(value, expected):
+    assert parse_quarter(value) == expected
+
+
+@pytest.mark.parametrize('value', ['Q5', '0', 'QX'])
+def test_parse_quarter_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        parse_quarter(value)
+
+
+def test_quarter_range_is_half_open():
+    assert quarter_range(2025, 1) == (date(2025, 1, 1), date(2025, 4, 1))
+    assert quarter_range(2025, 3) == (date(2025, 7, 1), date(2025, 10, 1))
+    assert quarter_range(2025, 4) == (date(2025, 10, 1), date(2026, 1, 1))
+
+
+def test_year_and_days_ranges():
+    assert year_range(2025) == (date(2025, 1, 1), date(2026, 1, 1))
+    assert days_range(30, today=date(2025, 3, 15)) == (date(2025, 2, 13), date(2025, 3, 16))
+
+
+def test_previous_quarter_wraps_year():
+    assert previous_quarter(2025, 3) == (2025, 2)
+    assert previous_quarter(2025, 1) == (2024, 4)
+
+
+def test_resolve_period_unconstrained():
+    assert resolve_period() == (None, None)
+    assert resolve_period(quarter='Q2') == (None, None)
+
+
+def test_resolve_period_year_and_quarter():
+    assert resolve_period(year=2025) == (date(2025, 1, 1), date(2026, 1, 1))
+    assert resolve_period(quarter='Q2', year='2025') == (date(2025, 4, 1), date(2025, 7, 1))
+
+
+def test_resolve_period_days_intersects_year():
+    today = date.today()
+    start, end = resolve_period(year=today.year, days=7)
+    assert start == max(date(today.year, 1, 1), today - timedelta(days=7))
+    assert end == today + timedelta(days=1)
+
+    # Days entirely outside the year leave an empty range
+    start, end = resolve_period(year=today.year - 2, days=7)
+    assert start >= end
+
+
+def test_period_conditions_with_year():
+    conditions, params = period_conditions('Q3', 2025)
+    assert conditions == ['fecha_supervision >= %s', 'fecha_supervision < %s']
+    assert params == [date(2025, 7, 1), date(2025, 10, 1)]
+
+
+def test_period_conditions_quarter_without_year():
+    conditions, params = period_conditions('Q3', column='bucket')
+    assert conditions == ['EXTRACT(QUARTER FROM bucket) = %s']
+    assert params == [3]
+
+
+def test_period_conditions_empty():
+    assert period_conditions('ALL') == ([], [])
+
+
+def test_period_filter():
+    assert period_filter() == ("", [])
+    fragment, params = period_filter(year=2025)
+    assert fragment == " AND fecha_supervision >= %s AND fecha_supervision < %s"
+    assert params == [date(2025, 1, 1), date(2026, 1, 1)]
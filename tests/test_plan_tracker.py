@@ -0,0 +1,81 @@
+from datetime import date
+
+import pytest
+
+pytest.importorskip('psycopg')
+pytest.importorskip('psycopg_pool')
+pytest.importorskip('redis')
+
+from database.plan_tracker import PlanTracker, REGRESSION_MIN_MS, REGRESSION_RATIO, plan_shape
+
+PLAN = {
+    'Node Type': 'Hash Join', 'Join Type': 'Inner', 'Total Cost': 10.5,
+    'Plans': [
+        {'Node Type': 'Seq Scan', 'Relation Name': 'supervision_operativa_detalle_2025q3', 'Actual Total Time': 4.2},
+        {'Node Type': 'Hash', 'Plans': [
+            {'Node Type': 'Index Scan', 'Relation Name': 'rollup_geo_sucursal',
+             'Index Name': 'rollup_geo_sucursal_pkey'},
+        ]},
+        {'Node Type': 'Aggregate', 'Strategy': 'Hashed'},
+    ]
+}
+
+
+def test_plan_shape():
+    assert plan_shape(PLAN) == [
+        '0:Hash Join/Inner',
+        '1:Seq Scan/supervision_operativa_detalle',
+        '1:Hash',
+        '2:Index Scan/rollup_geo_sucursal/rollup_geo_sucursal_pkey',
+        '1:Aggregate/Hashed',
+    ]
+
+
+def test_plan_shape_ignores_costs_and_partitions():
+    other = {**PLAN, 'Total Cost': 99.0, 'Plans': [
+        {**PLAN['Plans'][0], 'Relation Name': 'supervision_operativa_detalle_2024q1', 'Actual Total Time': 80.0},
+        *PLAN['Plans'][1:],
+    ]}
+    assert plan_shape(other) == plan_shape(PLAN)
+
+
+def capture(plan_hash='abc', seq_scans=(), execution_ms=10.0):
+    return {'plan_hash': plan_hash, 'seq_scans': list(seq_scans), 'execution_ms': execution_ms}
+
+
+def previous(plan_hash='abc', seq_scans=(), execution_ms=10.0, captured_on=date(2025, 7, 1)):
+    return {**capture(plan_hash, seq_scans, execution_ms), 'captured_on': captured_on}
+
+
+def test_no_regressions_without_history():
+    assert PlanTracker([])._regressions(capture(), []) == []
+
+
+def test_no_regressions_when_unchanged():
+    assert PlanTracker([])._regressions(capture(), [previous(), previous(execution_ms=12.0)]) == []
+
+
+def test_plan_changed_and_new_seq_scan():
+    regressions = PlanTracker([])._regressions(
+        capture(plan_hash='def', seq_scans=['rollup_geo_sucursal', 'supervision_operativa_detalle']),
+        [previous(seq_scans=['rollup_geo_sucursal']), previous(plan_hash='def')]
+    )
+    assert regressions == [
+        {'type': 'plan_changed', 'previous_capture': '2025-07-01'},
+        {'type': 'new_seq_scan', 'relations': ['supervision_operativa_detalle']},
+    ]
+
+
+def test_slower_against_median():
+    history = [previous(execution_ms=ms) for ms in (40.0, 50.0, 500.0)]
+    slow = 50.0 * REGRESSION_RATIO + 1
+    assert slow - 50.0 > REGRESSION_MIN_MS
+    assert PlanTracker([])._regressions(capture(execution_ms=slow), history) == [{
+        'type': 'slower', 'baseline_ms': 50.0, 'execution_ms': slow, 'ratio': round(slow / 50.0, 2)
+    }]
+
+
+def test_slower_needs_minimum_difference():
+    # Well past the ratio but only a few milliseconds slower
+    history = [previous(execution_ms=2.0), previous(execution_ms=None)]
+    assert PlanTracker([])._regressions(capture(execution_ms=2.0 + REGRESSION_MIN_MS), history) == []